@@ -3,31 +3,83 @@ from rasa_sdk import Action, Tracker
 from rasa_sdk.executor import CollectingDispatcher
 from rasa_sdk.events import SlotSet, FollowupAction, ActiveLoop
 from rasa_sdk.forms import FormValidationAction
-import mysql.connector
 from mysql.connector import Error
 import os
-from dotenv import load_dotenv
 import re  # Thêm để parse payload fallback
 from rasa_sdk.types import DomainDict
 from datetime import datetime, timedelta, time
-import google.generativeai as genai
 import json # ⚠️ QUAN TRỌNG: Nhớ import json ở đầu file actions.py
-
-# Load file .env
-load_dotenv()
-
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
-
-# Kết nối DB từ .env
-DB_CONFIG = {
-    'host': os.getenv('DB_HOST'),
-    'user': os.getenv('DB_USER'),
-    'password': os.getenv('DB_PASSWORD'),
-    'database': os.getenv('DB_NAME')
-}
-
-if None in DB_CONFIG.values():
-    raise ValueError("Thiếu thông tin kết nối DB trong file .env.")
+import asyncio
+import time as _time
+
+# DB_CONFIG + pool kết nối dùng chung (load .env nằm trong db.py)
+from .db import DB_CONFIG, fetch_all, fetch_one, execute, transaction, run_db
+from .id_allocator import appointment_ids
+from .booking import BOOKING_DOCTOR_QUERY, booking_idempotency_key, resolve_booking_ids, write_booking
+from .slots import check_slot_available
+# Cache lịch làm việc theo tuần (maBS, tuần ISO)
+from .schedule_cache import schedule_cache
+# Cache theo hội thoại cho các ID / dòng đã resolve trong một form
+from .session_cache import conversation_cache
+# Cache kết quả Gemini (triệu chứng -> chuyên khoa)
+from .llm_cache import symptom_specialty_cache
+# Bộ phân loại triệu chứng cục bộ (tầng trước Gemini)
+from .symptom_classifier import SYMPTOM_CONFIDENCE_THRESHOLD, get_symptom_classifier
+# Chỉ mục vector triệu chứng (mota + chẩn đoán cũ), tầng thứ hai trước Gemini
+from .symptom_index import SYMPTOM_INDEX_THRESHOLD, get_symptom_index
+# Chạy đua dự đoán cục bộ với Gemini theo ngân sách độ trễ
+from .hedge import hedge, specialty_hedge
+# Client Gemini bất đồng bộ (deadline, retry, circuit breaker)
+from .llm_client import LLMError, LLMRejectedError, gemini_client
+# Prompt gọn (mã chuyên khoa ngắn + phần đầu tĩnh) cho câu hỏi triệu chứng -> chuyên khoa
+from .specialty_prompt import FALLBACK_SPECIALTY, SpecialtyPromptCodec, get_specialty_codec
+# Template HTML (hàm f-string, escape giá trị) + stylesheet gửi một lần mỗi phiên
+from .html_templates import (
+    render_appointment_choices,
+    render_day_slots,
+    render_doctor_confirmation,
+    render_doctor_search,
+    render_doctor_specialty_choice,
+    render_prescription_table,
+    render_reexamination,
+    render_specialty_doctor_contacts,
+    render_specialty_doctors,
+    render_upcoming_appointments,
+    render_week_schedule,
+    stylesheets,
+)
+# Chế độ trả lời bằng custom payload JSON (RESPONSE_MODE=json) thay cho HTML
+from .payloads import (
+    appointments_payload,
+    doctor_list_payload,
+    doctor_schedule_payload,
+    json_mode,
+    prescription_payload,
+)
+# Cache dữ liệu tham chiếu (bacsi / chuyenkhoa / chuyenmon)
+from .refdata import get_reference_data, find_specialty, reference_cache, warm_up_reference_data
+# Danh sách tĩnh (tất cả chuyên khoa / bác sĩ) render sẵn, làm mới khi dữ liệu tham chiếu đổi
+from .listing_cache import all_doctors_page, listing_cache
+# Phân trang keyset cho các danh sách bác sĩ
+from .pagination import keyset_page, page_buttons, page_cursor
+# Truy vấn nóng với điều kiện ngày dạng nửa mở (dùng được index)
+from .queries import (
+    day_bounds,
+    PATIENT_APPOINTMENTS_ON_DAY_QUERY,
+    PATIENT_APPOINTMENT_BY_ID_QUERY,
+    PATIENT_UPCOMING_APPOINTMENTS_QUERY,
+    PATIENT_PRESCRIPTIONS_ON_DAY_QUERY,
+)
+
+# Dựng lại bộ phân loại triệu chứng ngay khi có snapshot mới (TF-IDF + đọc nlu.yml khá nặng),
+# trong thread nạp snapshot thay vì ở lượt chat đầu tiên trên event loop
+reference_cache.add_listener(get_symptom_classifier)
+# Nạp sẵn snapshot dữ liệu tham chiếu + chỉ mục tên bác sĩ khi action server khởi động
+warm_up_reference_data()
+
+# Mỗi lần dùng lại maBS đã resolve (validate_date / validate_appointment_time) thay cho
+# một truy vấn bacsi (hoặc JOIN bacsi - chuyenmon) các bước này từng gửi để tìm lại maBS
+DOCTOR_ID_LOOKUP_ROUND_TRIPS = 1
 
 # Keywords để detect wrong input (mở rộng theo data)
 WRONG_INPUT_KEYWORDS = {
@@ -59,6 +111,53 @@ def get_patient_id(tracker: Tracker) -> Text | None:
     return None
 
 
+async def resolve_doctor_id(tracker: Tracker, doctor_name: Text, specialty: Text | None = None) -> Text | None:
+    """
+    (tenBS, tenCK) -> maBS, dùng lại kết quả đã resolve trong cùng hội thoại (conversation_cache).
+    Miss -> snapshot dữ liệu tham chiếu, cuối cùng mới hỏi DB. Hai bác sĩ trùng tên (cùng khoa, hoặc
+    chưa chọn khoa) -> None, không đoán.
+    """
+    key = ("maBS", doctor_name, specialty)
+    ma_bs = conversation_cache.get(tracker.sender_id, key)
+    if ma_bs:
+        return ma_bs
+
+    snapshot = await get_reference_data()
+    ma_bs = resolve_booking_ids(snapshot, doctor_name, specialty)["maBS"]
+    if not ma_bs:
+        if specialty:
+            rows = await fetch_all(BOOKING_DOCTOR_QUERY, (doctor_name, specialty))
+        else:
+            rows = await fetch_all("SELECT maBS FROM bacsi WHERE tenBS = %s", (doctor_name,))
+        if len(rows) != 1:
+            return None
+        ma_bs = rows[0]['maBS']
+    conversation_cache.put(tracker.sender_id, key, ma_bs, DOCTOR_ID_LOOKUP_ROUND_TRIPS)
+    return ma_bs
+
+
+def remember_doctor_id(tracker: Tracker, snapshot, doc: Dict[Text, Any]):
+    """
+    Ghi sẵn maBS cho (tenBS, tenCK) vừa xác nhận để validate_date / validate_appointment_time không tra lại.
+    Chỉ ghi khi đúng một bác sĩ mang tên đó trong khoa đó (bác sĩ trùng tên không ghi đè lẫn nhau).
+    """
+    if resolve_booking_ids(snapshot, doc["tenBS"], doc["tenCK"])["maBS"] == doc["maBS"]:
+        conversation_cache.put(tracker.sender_id, ("maBS", doc["tenBS"], doc["tenCK"]), doc["maBS"],
+                               DOCTOR_ID_LOOKUP_ROUND_TRIPS)
+
+
+async def load_patient_appointment(tracker: Tracker, mahen: Text, patient_id: Text) -> Dict[Text, Any] | None:
+    """Dòng lichhen (chưa hủy) của bệnh nhân, dùng lại trong suốt luồng hủy lịch."""
+    key = ("lichhen", mahen)
+    appointment = conversation_cache.get(tracker.sender_id, key)
+    if appointment:
+        return appointment
+    appointment = await fetch_one(PATIENT_APPOINTMENT_BY_ID_QUERY, (mahen, patient_id))
+    if appointment:
+        conversation_cache.put(tracker.sender_id, key, appointment)
+    return appointment
+
+
 # === THÊM MỚI ACTION Ở CUỐI FILE HOẶC GẦN CÁC ACTION TRA CỨU KHÁC ===
 class ActionShowDoctorSchedule(Action):
     """
@@ -80,7 +179,7 @@ class ActionShowDoctorSchedule(Action):
             return time_obj.strftime('%H:%M')
         return str(time_obj)
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         # 1. Lấy tên bác sĩ từ entity
         entities = tracker.latest_message.get('entities', [])
         doctor_name_input = next((e['value'] for e in entities if e['entity'] == 'doctor_name'), None)
@@ -92,28 +191,20 @@ class ActionShowDoctorSchedule(Action):
         print(f"[DEBUG] Running ActionShowDoctorSchedule for: {doctor_name_input}")
 
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
-            
-            # 2. Xác thực tên bác sĩ (tránh trùng lặp)
-            query_find_bs = "SELECT maBS, tenBS FROM bacsi WHERE tenBS LIKE %s"
-            cursor.execute(query_find_bs, (f"%{doctor_name_input}%",))
-            doctors_found = cursor.fetchall()
+            # 2. Xác thực tên bác sĩ (tránh trùng lặp) - tìm qua chỉ mục tên không dấu
+            snapshot = await get_reference_data()
+            doctors_found = snapshot.doctors_matching(doctor_name_input)
             
             unique_names = set(doc['tenBS'] for doc in doctors_found)
             
             if not doctors_found:
                 dispatcher.utter_message(text=f"Không tìm thấy bác sĩ nào có tên '{doctor_name_input}'.")
-                cursor.close()
-                conn.close()
                 return []
             
             if len(unique_names) > 1:
                 dispatcher.utter_message(
                     text=f"Tên '{doctor_name_input}' không rõ ràng (tìm thấy: {', '.join(unique_names)}). Vui lòng nhập họ tên đầy đủ."
                 )
-                cursor.close()
-                conn.close()
                 return []
             
             # Đã tìm thấy 1 bác sĩ duy nhất
@@ -126,19 +217,8 @@ class ActionShowDoctorSchedule(Action):
             start_of_week = today - timedelta(days=today.weekday())
             end_of_week = start_of_week + timedelta(days=6)
 
-            # 4. Query lịch làm việc trong tuần (SỬA ĐỔI: Thêm AND trangthai != 'Nghỉ')
-            query_schedule = """
-            SELECT ngaythangnam, giobatdau, gioketthuc, trangthai
-            FROM thoigiankham
-            WHERE maBS = %s 
-              AND DATE(ngaythangnam) BETWEEN %s AND %s
-              AND (trangthai != 'Nghỉ' OR trangthai IS NULL)
-            ORDER BY ngaythangnam, giobatdau
-            """
-            cursor.execute(query_schedule, (maBS, start_of_week, end_of_week))
-            schedule_rows = cursor.fetchall()
-            cursor.close()
-            conn.close()
+            # 4. Lịch làm việc trong tuần, bỏ ca 'Nghỉ' (đọc từ cache lịch tuần)
+            schedule_rows = await schedule_cache.working_week(maBS, today)
 
             if not schedule_rows:
                 dispatcher.utter_message(
@@ -154,66 +234,19 @@ class ActionShowDoctorSchedule(Action):
                     schedule_by_date[date_obj] = []
                 schedule_by_date[date_obj].append(row)
 
-            # 6. Tạo bảng HTML
-            html_table = f"""
-            <style>
-                .schedule-table {{
-                    width: 100%; max-width: 450px; border-collapse: collapse;
-                    font-family: Arial, sans-serif; background: white;
-                    border-radius: 8px; overflow: hidden; box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-                }}
-                .schedule-table th, .schedule-table td {{
-                    padding: 10px 12px; text-align: left; border-bottom: 1px solid #eee;
-                }}
-                .schedule-table th {{
-                    background-color: #f8faff; color: #007bff; font-size: 14px;
-                }}
-                .schedule-table .date-cell {{
-                    font-weight: bold; color: #333; font-size: 14px;
-                }}
-                .schedule-table .shift-cell div {{
-                    margin-bottom: 4px;
-                }}
-                /* CSS trạng thái không còn cần thiết nhưng để lại cũng không sao */
-                .status-work {{ color: green; font-weight: bold; }}
-                .status-off {{ color: red; font-weight: bold; }}
-            </style>
-            <div style="font-family: Arial, sans-serif; font-size: 15px; margin-bottom: 8px;">
-                📅 <strong>Lịch làm việc tuần này của Bác sĩ {tenBS}</strong><br>
-                (Từ {start_of_week.strftime('%d/%m')} đến {end_of_week.strftime('%d/%m')})
-            </div>
-            <table class="schedule-table">
-                <thead>
-                    <tr>
-                        <th>Ngày</th>
-                        <th>Ca làm việc</th>
-                    </tr>
-                </thead>
-                <tbody>
-            """
-            
-            # Điền dữ liệu vào bảng
-            for date_obj, shifts in sorted(schedule_by_date.items()):
-                day_name_vn = self._get_vietnamese_day_name(date_obj.weekday())
-                date_str = date_obj.strftime('%d/%m')
-                
-                shifts_html = ""
-                for shift in shifts:
-                    start_time = self._format_time(shift['giobatdau'])
-                    end_time = self._format_time(shift['gioketthuc'])
-                    
-                    # SỬA ĐỔI: Bỏ hiển thị trạng thái
-                    shifts_html += f"<div>{start_time} - {end_time}</div>"
-                
-                html_table += f"""
-                    <tr>
-                        <td class="date-cell" style="padding-right: 20px;">{day_name_vn} ({date_str})</td>
-                        <td class="shift-cell" style="padding-left: 20px;">{shifts_html}</td>
-                    </tr>
-                """
-            
-            html_table += "</tbody></table>"
-            dispatcher.utter_message(text=html_table, html=True)
+            # 6. Tạo bảng HTML (template HTML, CSS gửi một lần mỗi phiên)
+            days = [
+                (f"{self._get_vietnamese_day_name(date_obj.weekday())} ({date_obj.strftime('%d/%m')})",
+                 [(self._format_time(shift['giobatdau']), self._format_time(shift['gioketthuc']), None)
+                  for shift in shifts])
+                for date_obj, shifts in sorted(schedule_by_date.items())
+            ]
+            week = (start_of_week.strftime('%d/%m'), end_of_week.strftime('%d/%m'))
+            if json_mode():
+                dispatcher.utter_message(json_message=doctor_schedule_payload(tenBS, *week, days))
+            else:
+                html_table = render_week_schedule(tenBS, *week, days)
+                dispatcher.utter_message(text=stylesheets.wrap(tracker, html_table, "schedule"), html=True)
 
         except Error as e:
             print(f"[ERROR] DB Error in ActionShowDoctorSchedule: {e}")
@@ -230,51 +263,23 @@ class ActionListAllDoctors(Action):
     def name(self) -> Text:
         return "action_list_all_doctors"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         print(f"[DEBUG] Running ActionListAllDoctors")
         
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
-            # Query để lấy TẤT CẢ bác sĩ và GOM NHÓM chuyên khoa
-            query = """
-            SELECT 
-                bs.tenBS,
-                GROUP_CONCAT(DISTINCT ck.tenCK SEPARATOR ', ') as chuyenkhoa
-            FROM bacsi bs
-            LEFT JOIN chuyenmon cm ON bs.maBS = cm.maBS
-            LEFT JOIN chuyenkhoa ck ON cm.maCK = ck.maCK
-            WHERE bs.vaiTro = "DOCTOR" AND bs.xoa = 0
-            GROUP BY bs.maBS, bs.tenBS
-            ORDER BY bs.tenBS
-            """
-            cursor.execute(query)
-            doctors = cursor.fetchall()
-            cursor.close()
-            conn.close()
-            
-            if doctors:
-                html_list = f"""
-                <div style="font-family: Arial, sans-serif; font-size: 15px; color: #333; background: #f8faff; border-radius: 10px; padding: 10px; border: 1px solid #cce0ff;">
-                    <div style="color: #007bff; font-weight: bold; margin-bottom: 8px;">
-                        📋 Danh sách bác sĩ trong hệ thống (Tổng: {len(doctors)}):
-                    </div>
-                """
-                
-                for doc in doctors:
-                    specialties = doc['chuyenkhoa'] if doc['chuyenkhoa'] else 'Chưa có'
-                    html_list += f"""
-                    <div style="background: #ffffff; border-left: 3px solid #007bff; border-radius: 6px; padding: 6px 10px; margin-bottom: 6px;">
-                        <div style="font-weight: bold; color: #007bff;">🩺 Bác sĩ {doc['tenBS']}</div>
-                        <div><strong>Chuyên khoa:</strong> {specialties}</div>
-                    </div>
-                    """
-                
-                html_list += """
-                    <div style="margin-top: 6px; font-style: italic;">👉 Vui lòng tiếp tục yêu cầu của bạn...</div>
-                </div>
-                """
-                dispatcher.utter_message(text=html_list, html=True)
+            # Trang đầu đã render sẵn theo version nội dung của dữ liệu tham chiếu;
+            # nút "Trang sau" / "Trang trước" mang cursor -> chỉ render trang đó
+            snapshot = await get_reference_data()
+            cursor = page_cursor(tracker)
+            listing = all_doctors_page(snapshot, cursor) if cursor else listing_cache.get(snapshot, "all_doctors")
+            
+            if listing:
+                if json_mode():
+                    dispatcher.utter_message(json_message=listing.payload)
+                else:
+                    dispatcher.utter_message(
+                        text=stylesheets.wrap(tracker, listing.html, "list"), buttons=listing.buttons, html=True
+                    )
             else:
                 dispatcher.utter_message(
                     text="Không tìm thấy bác sĩ nào trong hệ thống."
@@ -296,7 +301,7 @@ class ActionShowExaminingDoctorInForm(Action):
     def name(self) -> Text:
         return "action_show_examining_doctor_in_form"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         # Lấy maBN động
         patient_id = get_patient_id(tracker)
 
@@ -308,8 +313,6 @@ class ActionShowExaminingDoctorInForm(Action):
         print(f"[DEBUG] Running ActionShowExaminingDoctorInForm cho bệnh nhân: {patient_id}")
         
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
             # Query để lấy bác sĩ khám gần nhất dựa trên maBN
             query = """
             SELECT bs.tenBS, lk.ngaythangnamkham 
@@ -320,10 +323,7 @@ class ActionShowExaminingDoctorInForm(Action):
             ORDER BY lk.ngaythangnamkham DESC
             LIMIT 1
             """
-            cursor.execute(query, (patient_id,))
-            result = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            result = await fetch_one(query, (patient_id,))
             
             if result:
                 doctor_name = result['tenBS']
@@ -515,7 +515,7 @@ class ValidateCancelAppointmentForm(FormValidationAction):
     def name(self) -> Text:
         return "validate_cancel_appointment_form"
 
-    def _handle_form_interruption(self, dispatcher, tracker):
+    async def _handle_form_interruption(self, dispatcher, tracker):
         """Xử lý interruption trong cancel form"""
         latest_message = tracker.latest_message
         
@@ -527,14 +527,14 @@ class ValidateCancelAppointmentForm(FormValidationAction):
         # === THÊM MỚI: Xử lý list_all_specialties ===
         if latest_intent == "list_all_specialties":
             list_action = ActionListAllSpecialties()
-            list_action.run(dispatcher, tracker, {})
+            await list_action.run(dispatcher, tracker, {})
             # Trả về slot dummy để form tiếp tục mà không bị gãy flow
             return {"just_listed_all_specialties_dummy": False}
 
         # === Xử lý explain_specialty ===
         if latest_intent == "explain_specialty":
             explain_action = ActionExplainSpecialtyInForm()
-            explain_action.run(dispatcher, tracker, {})
+            await explain_action.run(dispatcher, tracker, {})
             return {
                 "specialty": tracker.get_slot("specialty"),
                 "just_explained": False,
@@ -543,7 +543,7 @@ class ValidateCancelAppointmentForm(FormValidationAction):
         # === Xử lý ask_doctor_info ===
         if latest_intent == "ask_doctor_info":
             info_action = ActionShowDoctorInfoInForm()
-            info_action.run(dispatcher, tracker, {})
+            await info_action.run(dispatcher, tracker, {})
             return {
                 "doctor_name": tracker.get_slot("doctor_name"),
                 "just_asked_doctor_info": False,
@@ -552,7 +552,7 @@ class ValidateCancelAppointmentForm(FormValidationAction):
         # === Xử lý list_doctors_by_specialty ===
         if latest_intent == "list_doctors_by_specialty":
             list_action = ActionListDoctorsInForm()
-            list_action.run(dispatcher, tracker, {})
+            await list_action.run(dispatcher, tracker, {})
             return {
                 "specialty": tracker.get_slot("specialty"),
                 "just_listed_doctors": False,
@@ -561,23 +561,23 @@ class ValidateCancelAppointmentForm(FormValidationAction):
         # === THÊM MỚI: Xử lý ask_who_examined_me ===
         if latest_intent == "ask_who_examined_me":
             info_action = ActionShowExaminingDoctorInForm()
-            info_action.run(dispatcher, tracker, {})
+            await info_action.run(dispatcher, tracker, {})
             # Trả về slot dummy để form tiếp tục
             return {"just_asked_examining_doctor": False}
         
         if latest_intent == "list_all_doctors":
             list_action = ActionListAllDoctors()
-            list_action.run(dispatcher, tracker, {}) # Dùng {} cho domain
+            await list_action.run(dispatcher, tracker, {}) # Dùng {} cho domain
             return {"just_listed_all_doctors_dummy": False} # Trả về slot dummy để form tiếp tục
         
         if latest_intent == "ask_doctor_schedule":
             schedule_action = ActionShowDoctorSchedule()
-            schedule_action.run(dispatcher, tracker, {})
+            await schedule_action.run(dispatcher, tracker, {})
             return {"just_asked_doctor_schedule_dummy": False}
         
         return {}
 
-    def validate_appointment_date(
+    async def validate_appointment_date(
         self, 
         slot_value: Any, 
         dispatcher: CollectingDispatcher, 
@@ -587,7 +587,7 @@ class ValidateCancelAppointmentForm(FormValidationAction):
         """Validate ngày hủy lịch"""
         
         # === CHECK INTERRUPTION TRƯỚC ===
-        interruption_result = self._handle_form_interruption(dispatcher, tracker)
+        interruption_result = await self._handle_form_interruption(dispatcher, tracker)
         if interruption_result:
             return interruption_result
         
@@ -613,20 +613,9 @@ class ValidateCancelAppointmentForm(FormValidationAction):
 
         # Query DB để lấy danh sách lịch hẹn trong ngày
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
-            query = """
-            SELECT lh.mahen, lh.ngaythangnam, lh.khunggio, bs.tenBS, ck.tenCK, lh.mota
-            FROM lichhen lh
-            JOIN bacsi bs ON lh.maBS = bs.maBS
-            JOIN chuyenkhoa ck ON lh.maCK = ck.maCK
-            WHERE lh.maBN = %s AND DATE(lh.ngaythangnam) = %s AND lh.trangthai != 'Huy'
-            ORDER BY lh.khunggio
-            """
-            cursor.execute(query, (patient_id, parsed_date))
-            appointments = cursor.fetchall()
-            cursor.close()
-            conn.close()
+            appointments = await fetch_all(
+                PATIENT_APPOINTMENTS_ON_DAY_QUERY, (patient_id, *day_bounds(parsed_date))
+            )
         except Error as e:
             dispatcher.utter_message(text=f"Lỗi kết nối DB: {e}")
             return {"appointment_date": None}
@@ -640,28 +629,33 @@ class ValidateCancelAppointmentForm(FormValidationAction):
             dispatcher.utter_message(text="Bạn có muốn thử ngày khác không?", buttons=buttons)
             return {"appointment_date": None}
 
-        # Hiển thị danh sách lịch hẹn
-        dispatcher.utter_message(text=f"<b>📋 Danh sách lịch hẹn ngày </b> {date_input}:", metadata={"parse_mode": "HTML"})
+        # Nhớ các lịch vừa liệt kê: bước chọn lịch / xác nhận hủy không cần truy vấn lại
+        for appt in appointments:
+            conversation_cache.put(tracker.sender_id, ("lichhen", appt['mahen']), appt)
 
-        
-        for idx, appt in enumerate(appointments, 1):
-            appt_text = f"{idx}. 🩺 <b>Bác sĩ {appt['tenBS']}</b> ({appt['tenCK']})<br>Giờ: {appt['khunggio']}<br>Mã lịch: {appt['mahen']}<br>Mô tả: {appt['mota']}"
+        # Hiển thị danh sách lịch hẹn: MỘT tin nhắn, nút chọn đánh số theo thứ tự trong danh sách
+        buttons = [
+            {
+                "title": f"{idx}. Chọn lịch {appt['mahen']}",
+                "payload": f"/select_appointment{{\"appointment_id\":\"{appt['mahen']}\"}}"
+            }
+            for idx, appt in enumerate(appointments, 1)
+        ]
+        if json_mode():
+            items = [dict(appt, day=date_input, time=appt['khunggio']) for appt in appointments]
+            dispatcher.utter_message(json_message=appointments_payload(
+                items, [[button] for button in buttons], date=date_input, purpose="select"
+            ))
+        else:
+            html_list = render_appointment_choices(date_input, appointments)
             dispatcher.utter_message(
-                text=appt_text,
-                buttons=[
-                    {
-                        "title": f"Chọn lịch này",
-                        "payload": f"/select_appointment{{\"appointment_id\":\"{appt['mahen']}\"}}"
-                    }
-                ]
+                text=stylesheets.wrap(tracker, html_list, "list"), buttons=buttons, metadata={"parse_mode": "HTML"}
             )
         
-        dispatcher.utter_message(text=f"\nTổng cộng: {len(appointments)} lịch hẹn. Vui lòng chọn lịch cần hủy.")
-        
         # Trả về với appointment_date đã validate
         return {"appointment_date": date_input}
 
-    def validate_selected_appointment_id(
+    async def validate_selected_appointment_id(
         self,
         slot_value: Any,
         dispatcher: CollectingDispatcher,
@@ -671,7 +665,7 @@ class ValidateCancelAppointmentForm(FormValidationAction):
         """Validate mã lịch hẹn được chọn"""
         
         # === CHECK INTERRUPTION TRƯỚC ===
-        interruption_result = self._handle_form_interruption(dispatcher, tracker)
+        interruption_result = await self._handle_form_interruption(dispatcher, tracker)
         if interruption_result:
             return interruption_result
         
@@ -688,19 +682,7 @@ class ValidateCancelAppointmentForm(FormValidationAction):
         
         # Validate appointment_id tồn tại trong DB
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
-            query = """
-            SELECT lh.mahen, lh.ngaythangnam, lh.khunggio, bs.tenBS, ck.tenCK, lh.mota
-            FROM lichhen lh
-            JOIN bacsi bs ON lh.maBS = bs.maBS
-            JOIN chuyenkhoa ck ON lh.maCK = ck.maCK
-            WHERE lh.mahen = %s AND lh.maBN = %s AND lh.trangthai != 'Huy'
-            """
-            cursor.execute(query, (slot_value, patient_id))
-            appointment = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            appointment = await load_patient_appointment(tracker, slot_value, patient_id)
         except Error as e:
             dispatcher.utter_message(text=f"Lỗi kết nối DB: {e}")
             return {"selected_appointment_id": None}
@@ -749,7 +731,7 @@ class ActionConfirmCancelUpdated(Action):
     def name(self) -> Text:
         return "action_confirm_cancel"
 
-    def run(
+    async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict]:
         selected_id = tracker.get_slot("selected_appointment_id")
@@ -766,19 +748,8 @@ class ActionConfirmCancelUpdated(Action):
 
         # Query thông tin lịch hẹn để hiển thị confirm
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
-            query = """
-            SELECT lh.mahen, lh.ngaythangnam, lh.khunggio, bs.tenBS, ck.tenCK, lh.mota
-            FROM lichhen lh
-            JOIN bacsi bs ON lh.maBS = bs.maBS
-            JOIN chuyenkhoa ck ON lh.maCK = ck.maCK
-            WHERE lh.mahen = %s AND lh.maBN = %s AND lh.trangthai != 'Huy'
-            """
-            cursor.execute(query, (selected_id, patient_id))
-            appointment = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            # Dòng lichhen đã được validate_selected_appointment_id nạp -> lấy lại từ cache hội thoại
+            appointment = await load_patient_appointment(tracker, selected_id, patient_id)
         except Error as e:
             dispatcher.utter_message(text=f"Lỗi kết nối DB: {e}")
             return []
@@ -818,7 +789,7 @@ class ActionPerformCancelUpdated(Action):
     def name(self) -> Text:
         return "action_perform_cancel"
 
-    def run(
+    async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict]:
         selected_id = tracker.get_slot("selected_appointment_id")
@@ -835,14 +806,9 @@ class ActionPerformCancelUpdated(Action):
 
         # Update DB: Set trangthai = 'hủy'
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor()
-            query = "UPDATE lichhen SET trangthai = 'Huy' WHERE mahen = %s AND maBN = %s"
-            cursor.execute(query, (selected_id, patient_id))
-            conn.commit()
-            rows_affected = cursor.rowcount
-            cursor.close()
-            conn.close()
+            # trangthai != 'Huy': dòng trong cache hội thoại có thể đã cũ -> DB quyết định
+            query = "UPDATE lichhen SET trangthai = 'Huy' WHERE mahen = %s AND maBN = %s AND trangthai != 'Huy'"
+            rows_affected = await execute(query, (selected_id, patient_id))
             
             if rows_affected > 0:
                 dispatcher.utter_message(text=f"✅ Đã hủy thành công lịch hẹn **{selected_id}**.")
@@ -857,6 +823,7 @@ class ActionPerformCancelUpdated(Action):
             {"title": "Quay lại menu", "payload": "/greet"}
         ]
         dispatcher.utter_message(text="Bạn có muốn làm gì tiếp theo?", buttons=buttons)
+        conversation_cache.finish(tracker.sender_id, "cancel_appointment_form")
         
         # Reset slots
         return [
@@ -870,7 +837,7 @@ class ActionListDoctorsInForm(Action):
     def name(self) -> Text:
         return "action_list_doctors_in_form"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         # Lấy chuyên khoa từ entities hoặc slot
         entities = tracker.latest_message.get('entities', [])
         specialty_entity = next((e['value'] for e in entities if e['entity'] == 'specialty'), None)
@@ -884,60 +851,35 @@ class ActionListDoctorsInForm(Action):
         
         print(f"[DEBUG] Listing doctors for specialty: {specialty}")
         
-        # Query DB để lấy danh sách bác sĩ theo chuyên khoa
+        # Bác sĩ của chuyên khoa từ cache dữ liệu tham chiếu, MỘT trang theo cursor (phân trang keyset)
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
-            query = """
-            SELECT bs.maBS, bs.tenBS, ck.tenCK, bs.sdtBS, bs.emailBS, bs.diachiBS
-            FROM bacsi bs
-            JOIN chuyenmon cm ON bs.maBS = cm.maBS
-            JOIN chuyenkhoa ck ON cm.maCK = ck.maCK
-            WHERE ck.tenCK LIKE %s
-            ORDER BY bs.tenBS
-            """
-            cursor.execute(query, (f"%{specialty}%",))
-            doctors = cursor.fetchall()
-            cursor.close()
-            conn.close()
+            snapshot = await get_reference_data()
+            found = snapshot.specialty_containing(specialty)
+            keys = snapshot.specialty_doctor_keys.get(found['maCK'], []) if found else []
             
-            if not doctors:
+            if not keys:
                 dispatcher.utter_message(text=f"Không tìm thấy bác sĩ nào trong chuyên khoa '{specialty}'. Vui lòng kiểm tra lại tên chuyên khoa.")
                 return [SlotSet("specialty", None)]
             
-            # Hiển thị danh sách bác sĩ bằng HTML
-            html_list = f"""
-            <div style="font-family: Arial, sans-serif; font-size: 15px; color: #333; background: #f8faff; border-radius: 10px; padding: 10px; border: 1px solid #cce0ff;">
-                <div style="color: #007bff; font-weight: bold; margin-bottom: 8px;">
-                    📋 Danh sách bác sĩ chuyên khoa {doctors[0]['tenCK']}:
-                </div>
-            """
-
-            for idx, doc in enumerate(doctors, 1):
-                html_list += f"""
-                <div style="background: #ffffff; border-left: 3px solid #007bff; border-radius: 6px; padding: 6px 10px; margin-bottom: 6px;">
-                    <div style="font-weight: bold; color: #007bff;">🩺 Bác sĩ {doc['tenBS']}</div>
-                    <div>📞 <strong>SĐT:</strong> {doc['sdtBS']}</div>
-                    <div>✉️ <strong>Email:</strong> {doc.get('emailBS', 'Chưa có')}</div>
-                    # <div>✉️ <strong>Địa chỉ:</strong> {doc.get('diachiBS')}</div>
-                </div>
-                """
-
-            html_list += f"""
-                <div style="margin-top: 8px; font-size: 15px; color: #555;">
-                    Tổng cộng: <strong>{len(doctors)}</strong> bác sĩ<br>
-                    👉 Tiếp tục đặt lịch...
-                </div>
-            </div>
-            """
-
-            dispatcher.utter_message(text=html_list, html=True)
+            page = keyset_page(keys, page_cursor(tracker), snapshot.doctor_key)
+            doctors = [snapshot.doctors[ma_bs] for _, ma_bs in page.keys]
+            buttons = page_buttons(page, "list_doctors_by_specialty", specialty=found['tenCK'])
+            
+            # Hiển thị danh sách bác sĩ (HTML hoặc payload JSON)
+            if json_mode():
+                dispatcher.utter_message(json_message=doctor_list_payload(
+                    f"Danh sách bác sĩ chuyên khoa {found['tenCK']}", doctors, ["tenBS", "sdtBS", "emailBS"],
+                    specialty=found['tenCK'], page=page.info(), pager=buttons,
+                ))
+            else:
+                html_list = render_specialty_doctor_contacts(found['tenCK'], doctors, page.total, page.start + 1)
+                dispatcher.utter_message(text=stylesheets.wrap(tracker, html_list, "list"), buttons=buttons, html=True)
 
             
             # Set lại specialty nếu khác với specialty hiện tại
             current_specialty = tracker.get_slot("specialty")
-            if not current_specialty or current_specialty.lower() != doctors[0]['tenCK'].lower():
-                return [SlotSet("specialty", doctors[0]['tenCK'])]
+            if not current_specialty or current_specialty.lower() != found['tenCK'].lower():
+                return [SlotSet("specialty", found['tenCK'])]
             
             return []
             
@@ -951,7 +893,7 @@ class ActionShowDoctorInfoInForm(Action):
     def name(self) -> Text:
         return "action_show_doctor_info_in_form"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         # 1. Lấy thông tin (Ưu tiên ID trước, sau đó đến tên)
         entities = tracker.latest_message.get('entities', [])
         doctor_id_input = next((e['value'] for e in entities if e['entity'] == 'doctor_id'), None)
@@ -961,44 +903,28 @@ class ActionShowDoctorInfoInForm(Action):
         if not doctor_id_input and not doctor_name_input:
             doctor_name_input = tracker.get_slot("doctor_name")
 
-        # 2. Xử lý query
+        # 2. Tra cứu từ snapshot dữ liệu tham chiếu (bacsi LEFT JOIN chuyenmon/chuyenkhoa)
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
-            
-            query_base = """
-            SELECT bs.maBS, bs.tenBS, ck.tenCK, bs.sdtBS, bs.emailBS, bs.gioithieu
-            FROM bacsi bs
-            LEFT JOIN chuyenmon cm ON bs.maBS = cm.maBS
-            LEFT JOIN chuyenkhoa ck ON cm.maCK = ck.maCK
-            WHERE bs.vaiTro = 'DOCTOR' AND bs.xoa = 0 
-            """
-            
-            params = ()
+            snapshot = await get_reference_data()
 
             if doctor_id_input:
                 # ===== KỊCH BẢN 1: TÌM THEO ID (Sau khi user chọn từ nút bấm) =====
                 print(f"[DEBUG] Showing doctor info for ID: {doctor_id_input}")
-                query_full = query_base + " AND bs.maBS = %s"
-                params = (doctor_id_input,)
+                doctor = snapshot.doctor_by_id(doctor_id_input)
+                candidates = [doctor] if doctor else []
             
             elif doctor_name_input:
-                # ===== KỊCH BẢN 2: TÌM THEO TÊN (Lần đầu user hỏi) =====
+                # ===== KỊCH BẢN 2: TÌM THEO TÊN (Lần đầu user hỏi) - chỉ mục tên không dấu =====
                 print(f"[DEBUG] Showing doctor info for Name: {doctor_name_input}")
-                query_full = query_base + " AND bs.tenBS LIKE %s"
-                params = (f"%{doctor_name_input}%",)
+                candidates = snapshot.doctors_matching(doctor_name_input)
             
             else:
                 # Không có input
                 dispatcher.utter_message(text="Vui lòng cung cấp tên bác sĩ bạn muốn tra cứu.")
-                if 'conn' in locals() and conn.is_connected():
-                    conn.close()
                 return []
             
-            cursor.execute(query_full, params)
-            doctors_found = cursor.fetchall()
-            cursor.close()
-            conn.close()
+            candidates = [d for d in candidates if d.get('vaiTro') == 'DOCTOR' and not d.get('xoa')]
+            doctors_found = snapshot.doctor_specialty_rows(candidates, outer=True)
 
             # 3. Phân tích kết quả
             if not doctors_found:
@@ -1085,7 +1011,7 @@ class ActionExplainSpecialtyInForm(Action):
     def name(self) -> Text:
         return "action_explain_specialty_in_form"
 
-    def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+    async def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         specialty = tracker.get_slot("specialty")
         
         if not specialty:
@@ -1093,26 +1019,17 @@ class ActionExplainSpecialtyInForm(Action):
         
         print(f"[DEBUG] Explaining specialty: {specialty}")
         
-        # Query DB
+        # Snapshot dữ liệu tham chiếu trước, chỉ truy vấn DB khi không khớp chính xác tên
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
-            query = "SELECT tenCK, maCK, mota FROM chuyenkhoa WHERE tenCK LIKE %s"
-            cursor.execute(query, (f"%{specialty}%",))
-            result = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            result = await find_specialty(specialty)
+            if not result:
+                query = "SELECT tenCK, maCK, mota FROM chuyenkhoa WHERE tenCK LIKE %s"
+                result = await fetch_one(query, (f"%{specialty}%",))
             
             if result:
                 ten_ck = result['tenCK']
-                explanation = result.get('mota')
-                
-                if not explanation:  # If mota is None or empty
-                    # Use Gemini API to generate explanation
-                    model = genai.GenerativeModel('models/gemini-flash-latest')  # Or your preferred model
-                    prompt = f"Giải thích ngắn gọn về chuyên khoa y tế '{specialty}' bằng tiếng Việt."
-                    response = model.generate_content(prompt)
-                    explanation = response.text.strip() if response else f"Chuyên khoa {specialty}..."
+                # mota được sinh trước bởi migrations/generate_specialty_explanations.py - không gọi LLM trong hội thoại
+                explanation = (result.get('mota') or '').strip() or f"Chuyên khoa {ten_ck}..."
                 
                 dispatcher.utter_message(
                     text=f"""
@@ -1221,89 +1138,99 @@ class ActionRecommendDoctor(Action):
     def name(self) -> Text:
         return "action_recommend_doctor"
 
-    def _get_all_specialties(self):
-        """Lấy danh sách tất cả tên chuyên khoa từ DB"""
+    async def _get_all_specialties(self):
+        """
+        Danh sách tên chuyên khoa + version nội dung của danh sách (khóa cache) + bộ phân loại cục bộ
+        + codec prompt gọn cho Gemini
+        """
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor()
-            cursor.execute("SELECT tenCK FROM chuyenkhoa")
-            rows = [row[0] for row in cursor.fetchall()]
-            cursor.close()
-            conn.close()
-            return rows
+            snapshot = await get_reference_data()
+            # Thường đã được listener dựng sẵn; chưa có thì dựng ngoài event loop
+            classifier = await asyncio.to_thread(get_symptom_classifier, snapshot)
+            return (snapshot.specialty_names(), snapshot.specialty_list_version,
+                    classifier, get_specialty_codec(snapshot))
         except Error as e:
             print(f"[ERROR] Cannot fetch specialties: {e}")
-            return []
+            return [], None, None, None
 
-    def _consult_gemini_for_specialty(self, symptom_text, valid_specialties):
-        """Hỏi Gemini để map triệu chứng vào danh sách chuyên khoa (Trả về LIST)"""
-        try:
-            specialties_str = ", ".join([f'"{s}"' for s in valid_specialties])
-            
-            # --- SỬA ĐỔI 1: Prompt yêu cầu trả về JSON List ---
-            prompt = f"""
-            Bạn là hệ thống điều phối bệnh nhân.
-            
-            DỮ LIỆU:
-            1. Danh sách chuyên khoa hiện có: [{specialties_str}]
-            2. Triệu chứng người dùng: "{symptom_text}"
-            
-            YÊU CẦU:
-            - Phân tích triệu chứng và chọn ra các chuyên khoa phù hợp từ danh sách trên.
-            - Nếu người dùng có nhiều triệu chứng (ví dụ: mẹ đau lưng, con sốt), hãy liệt kê TẤT CẢ chuyên khoa phù hợp.
-            - Ưu tiên: "Con/Bé" -> "Nhi khoa".
-            - OUTPUT FORMAT: Chỉ trả về một mảng JSON (JSON Array) chứa tên các chuyên khoa. 
-            - Ví dụ: ["Nội khoa"] hoặc ["Nhi khoa", "Sản phụ khoa"].
-            - Không giải thích thêm.
-            """
-
-            model = genai.GenerativeModel('models/gemini-flash-latest')
-            response = model.generate_content(prompt)
-            
-            raw_text = response.text.strip()
-            
-            # --- SỬA ĐỔI 2: Xử lý chuỗi JSON trả về ---
-            # Gemini thường trả về dạng ```json [...] ```, cần cắt bỏ markdown
-            if "```" in raw_text:
-                match = re.search(r'\[.*\]', raw_text, re.DOTALL)
-                if match:
-                    raw_text = match.group(0)
-                else:
-                    raw_text = "[]"
-            
-            # Parse string thành List Python
-            try:
-                suggested_list = json.loads(raw_text)
-            except json.JSONDecodeError:
-                # Nếu lỗi parse, thử fallback về text thuần nếu nó khớp với 1 chuyên khoa
-                for spec in valid_specialties:
-                    if spec.lower() in raw_text.lower():
-                        return [spec]
-                return ["Nội khoa"]
-
-            # --- SỬA ĐỔI 3: Validate lại với DB ---
-            final_list = []
-            if isinstance(suggested_list, list):
-                for item in suggested_list:
-                    # Tìm item trong valid_specialties (so sánh không phân biệt hoa thường)
-                    for db_spec in valid_specialties:
-                        if str(item).lower() == db_spec.lower():
-                            final_list.append(db_spec)
-                            break
-            
-            # Nếu list rỗng hoặc lỗi, fallback
-            if not final_list:
-                return ["Nội khoa"] if "Nội khoa" in valid_specialties else ([valid_specialties[0]] if valid_specialties else [])
-            
-            # Xóa trùng lặp và trả về LIST
-            return list(set(final_list))
+    async def _consult_gemini_for_specialty(self, symptom_text, valid_specialties, sender_id=None, codec=None):
+        """
+        Hỏi Gemini để map triệu chứng vào danh sách chuyên khoa (Trả về LIST). Lỗi API -> ném LLMError.
+        Prompt dùng mã ngắn cho từng chuyên khoa (actions/specialty_prompt.py), Gemini trả về mảng mã
+        và được map ngược về tên; không có codec từ snapshot thì dựng tạm từ danh sách tên.
+        """
+        codec = codec or SpecialtyPromptCodec.from_names(valid_specialties)
+        raw_text = await gemini_client.generate(codec.build(symptom_text), sender_id=sender_id, purpose="specialty")
+        return codec.decode(raw_text)
 
-        except Exception as e:
+    async def _suggest_specialties(self, symptom_text, valid_specialties, list_version, classifier=None,
+                                   sender_id=None, codec=None):
+        """
+        Bộ phân loại cục bộ -> chỉ mục vector -> cache (bộ nhớ + SQLite) -> Gemini.
+        Chỉ lưu kết quả Gemini trả về thành công và nhận ra được chuyên khoa; lỗi API / câu trả lời
+        không chứa mã hợp lệ được xử lý như Gemini lỗi (dùng dự đoán cục bộ / fallback) và không được cache.
+        Khi phải hỏi Gemini mà đã có dự đoán cục bộ (độ tin cậy thấp): chạy đua (hedge), quá
+        SPECIALTY_HEDGE_BUDGET thì trả lời bằng dự đoán cục bộ, Gemini chạy nốt trong nền để ghi cache.
+        Gemini lỗi / bị admission control từ chối -> hạ cấp về dự đoán cục bộ.
+        """
+        if list_version is None:
+            # Không có danh sách chuyên khoa (lỗi DB) -> không dùng / không ghi cache
+            return await self._consult_gemini_safe(symptom_text, valid_specialties, sender_id, codec) or []
+
+        local_started = _time.perf_counter()
+        local_guess = []
+        # Tầng 1: bộ phân loại cục bộ, chỉ hỏi tiếp khi độ tin cậy thấp
+        if classifier is not None:
+            local, confidence = classifier.predict(symptom_text)
+            print(f"[DEBUG] Local classifier: {local} (confidence={confidence:.2f})")
+            if local and confidence >= SYMPTOM_CONFIDENCE_THRESHOLD:
+                return local
+            local_guess = local
+
+        # Tầng 2: chỉ mục vector (chưa dựng / thiếu numpy -> None, bỏ qua)
+        index = await asyncio.to_thread(get_symptom_index)  # stat meta.json, lần đầu mmap + np.load
+        if index is not None:
+            retrieved, confidence = index.predict(symptom_text, allowed=valid_specialties)
+            print(f"[DEBUG] Symptom index: {retrieved} (confidence={confidence:.2f})")
+            if retrieved and confidence >= SYMPTOM_INDEX_THRESHOLD:
+                return retrieved
+            local_guess = local_guess or retrieved
+        specialty_hedge.latency("local", (_time.perf_counter() - local_started) * 1000)
+
+        # Cache SQLite là blocking -> chạy ngoài event loop
+        cached = await asyncio.to_thread(symptom_specialty_cache.get, symptom_text, list_version)
+        if cached is not None:
+            return cached
+
+        async def consult_and_cache():
+            result = await self._consult_gemini_safe(symptom_text, valid_specialties, sender_id, codec)
+            if not result:
+                return None  # Lỗi hoặc câu trả lời không có mã nào -> không cache, hedge dùng dự đoán cục bộ
+            await asyncio.to_thread(symptom_specialty_cache.put, symptom_text, list_version, result)
+            return result
+
+        suggested, path = await hedge(consult_and_cache(), local_guess, recorder=specialty_hedge)
+        print(f"[DEBUG] Specialty hedge: {path} -> {suggested}")
+        if suggested:
+            return suggested
+        # Luôn trả về LIST, kể cả khi lỗi
+        return [FALLBACK_SPECIALTY] if FALLBACK_SPECIALTY in valid_specialties else []
+
+    async def _consult_gemini_safe(self, symptom_text, valid_specialties, sender_id=None, codec=None):
+        """
+        Như _consult_gemini_for_specialty nhưng trả về None khi lỗi API / hết deadline / breaker mở
+        / bị admission control từ chối (quota sender, ngân sách ngày, hàng chờ đầy).
+        """
+        try:
+            return await self._consult_gemini_for_specialty(symptom_text, valid_specialties, sender_id, codec)
+        except LLMRejectedError as e:
+            print(f"[WARN] Gemini call shed ({e.reason}): {e}")
+            return None
+        except LLMError as e:
             print(f"[ERROR] Gemini API Error: {e}")
-            # Luôn trả về LIST, kể cả khi lỗi
-            return ["Nội khoa"] if "Nội khoa" in valid_specialties else []
+            return None
 
-    def run(
+    async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict]:
         
@@ -1323,10 +1250,13 @@ class ActionRecommendDoctor(Action):
 
         # dispatcher.utter_message(text=f"⏳ Đang phân tích: \"{final_symptom_text}\"...")
 
-        valid_specialties = self._get_all_specialties()
+        valid_specialties, list_version, classifier, codec = await self._get_all_specialties()
         
         # Gọi hàm (Bây giờ chắc chắn trả về List)
-        suggested_specialties = self._consult_gemini_for_specialty(final_symptom_text, valid_specialties)
+        suggested_specialties = await self._suggest_specialties(
+            final_symptom_text, valid_specialties, list_version, classifier, sender_id=tracker.sender_id,
+            codec=codec,
+        )
 
         print(f"[DEBUG] Input: {final_symptom_text} -> Gemini: {suggested_specialties}")
 
@@ -1352,69 +1282,38 @@ class ActionRecommendDoctor(Action):
                 html=True
             )
 
-        # Query DB và hiển thị bác sĩ
+        # Top 3 bác sĩ của TẤT CẢ chuyên khoa được đề xuất: một lượt tra trên snapshot, không N truy vấn
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
-            
-            for spec in suggested_specialties:
-                query = """
-                SELECT bs.maBS, bs.tenBS, ck.tenCK, bs.sdtBS
-                FROM bacsi bs
-                JOIN chuyenmon cm ON bs.maBS = cm.maBS
-                JOIN chuyenkhoa ck ON cm.maCK = ck.maCK
-                WHERE ck.tenCK = %s
-                LIMIT 3
-                """
-                cursor.execute(query, (spec,))
-                doctors = cursor.fetchall()
-                
-                if doctors:
-                    # 1. Khởi tạo khối HTML (Container) đẹp mắt
-                    # Bao gồm cả Tiêu đề (Header) và nội dung bên trong
-                    html_block = f"""
-                    <div style="font-family: Arial, sans-serif; border: 1px solid #cce0ff; border-radius: 10px; overflow: hidden; margin-bottom: 15px; box-shadow: 0 2px 5px rgba(0,0,0,0.05);">
-                        <div style="background-color: #e7f3ff; color: #0056b3; padding: 10px 15px; font-weight: bold; border-bottom: 1px solid #cce0ff;">
-                            🏥 Danh sách bác sĩ {spec}
-                        </div>
-                        <div style="padding: 10px 15px; background-color: #fff;">
-                    """
-                    
-                    # 2. Danh sách nút bấm (sẽ gom lại để hiển thị cuối tin nhắn)
-                    buttons_list = []
-
-                    # 3. Lặp qua từng bác sĩ để nối chuỗi HTML và tạo nút
-                    for i, doc in enumerate(doctors):
-                        # Tạo đường kẻ mờ giữa các bác sĩ (trừ người cuối cùng)
-                        border_style = "border-bottom: 1px dashed #eee; padding-bottom: 8px; margin-bottom: 8px;" if i < len(doctors) - 1 else ""
-                        
-                        html_block += f"""
-                        <div style="{border_style}">
-                            <div style="font-weight: bold; color: #333; font-size: 15px;">👨‍⚕️ BS {doc['tenBS']}</div>
-                            <div style="color: #666; font-size: 14px;">📞 SĐT: {doc['sdtBS']}</div>
-                        </div>
-                        """
-                        
-                        # Thêm nút đặt lịch cho bác sĩ này
-                        buttons_list.append({
-                            "title": f"📅 Đặt lịch BS {doc['tenBS']}", 
-                            "payload": f"/book_with_doctor{{\"doctor_id\":\"{doc['maBS']}\", \"specialty\":\"{doc['tenCK']}\"}}"
-                        })
-
-                    # 4. Đóng thẻ div
-                    html_block += "</div></div>"
-
-                    # 5. Gửi MỘT LẦN DUY NHẤT cho chuyên khoa này
-                    dispatcher.utter_message(text=html_block, buttons=buttons_list, html=True)
-
-                else:
-                    dispatcher.utter_message(text=f"⚠️ Hiện chưa có bác sĩ trực thuộc khoa {spec}.")
-
-            cursor.close()
-            conn.close()
-
+            snapshot = await get_reference_data()
+            doctors_by_specialty = snapshot.top_doctors_by_specialty(suggested_specialties, limit=3)
         except Error as e:
             dispatcher.utter_message(text=f"Lỗi DB: {e}")
+            doctors_by_specialty = {}
+
+        for spec, doctors in doctors_by_specialty.items():
+            if not doctors:
+                dispatcher.utter_message(text=f"⚠️ Hiện chưa có bác sĩ trực thuộc khoa {spec}.")
+                continue
+
+            # 1. Nút đặt lịch cho từng bác sĩ
+            buttons_list = [
+                {
+                    "title": f"📅 Đặt lịch BS {doc['tenBS']}",
+                    "payload": f"/book_with_doctor{{\"doctor_id\":\"{doc['maBS']}\", \"specialty\":\"{doc['tenCK']}\"}}"
+                }
+                for doc in doctors
+            ]
+
+            # 2. Gửi MỘT LẦN DUY NHẤT cho chuyên khoa này: payload JSON (nút nằm cạnh từng bác sĩ)
+            #    hoặc khối HTML từ template (nút hiển thị cuối tin nhắn)
+            if json_mode():
+                dispatcher.utter_message(json_message=doctor_list_payload(
+                    f"Danh sách bác sĩ {spec}", doctors, ["tenBS", "sdtBS"],
+                    buttons=[[button] for button in buttons_list], specialty=spec,
+                ))
+            else:
+                html_block = stylesheets.wrap(tracker, render_specialty_doctors(spec, doctors), "doctor")
+                dispatcher.utter_message(text=html_block, buttons=buttons_list, html=True)
         
         # Reset slots
         return [
@@ -1428,7 +1327,7 @@ class ActionBookWithDoctor(Action):
     def name(self) -> Text:
         return "action_book_with_doctor"
 
-    def run(
+    async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict]:
         # Extract entities từ latest_message
@@ -1449,8 +1348,6 @@ class ActionBookWithDoctor(Action):
 
         # Query DB lấy tenBS và verify specialty
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
             query = """
             SELECT tenBS, ck.tenCK as specialty 
             FROM bacsi bs 
@@ -1458,10 +1355,7 @@ class ActionBookWithDoctor(Action):
             JOIN chuyenkhoa ck ON cm.maCK = ck.maCK 
             WHERE bs.maBS = %s
             """
-            cursor.execute(query, (doctor_id,))
-            doctor = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            doctor = await fetch_one(query, (doctor_id,))
         except Error as e:
             dispatcher.utter_message(text=f"Lỗi kết nối DB: {e}")
             return []
@@ -1521,115 +1415,78 @@ class ValidateBookAppointmentForm(FormValidationAction):
         keywords = WRONG_INPUT_KEYWORDS.get(slot_name, [])
         return any(kw in input_lower for kw in keywords)
 
-    def _handle_form_interruption(self, dispatcher, tracker):
+    async def _handle_form_interruption(self, dispatcher, tracker):
         latest_intent = tracker.latest_message.get('intent', {}).get('name')
 
         if latest_intent == "explain_specialty":
-            ActionExplainSpecialtyInForm().run(dispatcher, tracker, {})
+            await ActionExplainSpecialtyInForm().run(dispatcher, tracker, {})
             return {"specialty": tracker.get_slot("specialty"), "just_explained": False}
         
         if latest_intent == "ask_doctor_info":
-            ActionShowDoctorInfoInForm().run(dispatcher, tracker, {})
+            await ActionShowDoctorInfoInForm().run(dispatcher, tracker, {})
             return {"doctor_name": tracker.get_slot("doctor_name"), "just_asked_doctor_info": False}
         
         if latest_intent == "list_doctors_by_specialty":
-            ActionListDoctorsInForm().run(dispatcher, tracker, {})
+            await ActionListDoctorsInForm().run(dispatcher, tracker, {})
             return {"specialty": tracker.get_slot("specialty"), "just_listed_doctors": False}
         
         if latest_intent == "ask_who_examined_me":
-            ActionShowExaminingDoctorInForm().run(dispatcher, tracker, {})
+            await ActionShowExaminingDoctorInForm().run(dispatcher, tracker, {})
             return {"just_asked_examining_doctor": False}
         
         if latest_intent == "list_all_doctors":
-            ActionListAllDoctors().run(dispatcher, tracker, {})
+            await ActionListAllDoctors().run(dispatcher, tracker, {})
             return {"just_listed_all_doctors_dummy": False}
         
         if latest_intent == "ask_doctor_schedule":
-            ActionShowDoctorSchedule().run(dispatcher, tracker, {})
+            await ActionShowDoctorSchedule().run(dispatcher, tracker, {})
             return {"just_asked_doctor_schedule_dummy": False}
 
         # === THÊM MỚI: Xử lý list_all_specialties ===
         if latest_intent == "list_all_specialties":
             list_action = ActionListAllSpecialties()
-            list_action.run(dispatcher, tracker, {})
+            await list_action.run(dispatcher, tracker, {})
             # Trả về slot dummy để form tiếp tục mà không bị gãy flow
             return {"just_listed_all_specialties_dummy": False}
         
         return {}
 
-    def _show_doctor_schedule_in_form(self, maBS: str, tenBS: str, dispatcher: CollectingDispatcher):
+    async def _show_doctor_schedule_in_form(self, maBS: str, tenBS: str, dispatcher: CollectingDispatcher,
+                                            tracker: Tracker):
         """Hiển thị lịch làm việc (Helper)"""
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
             today = datetime.now().date()
             start_of_week = today - timedelta(days=today.weekday())
             end_of_week = start_of_week + timedelta(days=6)
 
-            query = """
-            SELECT ngaythangnam, giobatdau, gioketthuc, trangthai
-            FROM thoigiankham
-            WHERE maBS = %s AND DATE(ngaythangnam) BETWEEN %s AND %s
-            ORDER BY ngaythangnam, giobatdau
-            """
-            cursor.execute(query, (maBS, start_of_week, end_of_week))
-            schedule_rows = cursor.fetchall()
-            cursor.close()
-            conn.close()
+            schedule_rows = await schedule_cache.week(maBS, today)
 
-            # Xử lý HTML
+            # Nhóm theo ngày, mỗi ca kèm trạng thái (template tô màu theo trạng thái)
             schedule_by_date = {}
-            if schedule_rows:
-                for row in schedule_rows:
-                    d = row['ngaythangnam']
-                    if d not in schedule_by_date: schedule_by_date[d] = []
-                    schedule_by_date[d].append(row)
-
-            html_table = f"""
-            <style>
-                .schedule-table {{ width: 100%; max-width: 450px; border-collapse: collapse; font-family: Arial, sans-serif; background: white; border-radius: 8px; overflow: hidden; box-shadow: 0 2px 5px rgba(0,0,0,0.1); margin-top: 8px; }}
-                .schedule-table th, .schedule-table td {{ padding: 10px 12px; text-align: left; border-bottom: 1px solid #eee; }}
-                .schedule-table th {{ background-color: #f8faff; color: #007bff; font-size: 14px; }}
-                .schedule-table .date-cell {{ font-weight: bold; color: #333; font-size: 14px; width: 40%; }}
-                .status-ghi {{ color: #dc3545; font-weight: bold; font-style: italic; }}
-                .status-ok {{ color: #28a745; font-weight: bold; }}
-                .status-full {{ color: #6c757d; text-decoration: line-through; }}
-                .empty-schedule {{ text-align: center; color: #888; font-style: italic; padding: 20px; }}
-            </style>
-            <div style="font-family: Arial, sans-serif; font-size: 15px; margin-bottom: 8px; margin-top: 8px;">
-                📅 <strong>Lịch làm việc tuần này của Bác sĩ {tenBS}</strong><br>(Từ {start_of_week.strftime('%d/%m')} đến {end_of_week.strftime('%d/%m')})
-            </div>
-            <table class="schedule-table">
-                <thead><tr><th>Ngày</th><th>Ca làm việc</th></tr></thead><tbody>
-            """
-            
-            if not schedule_rows:
-                html_table += "<tr><td colspan='2' class='empty-schedule'>Không có lịch làm việc trong tuần này.</td></tr>"
+            for row in schedule_rows or []:
+                schedule_by_date.setdefault(row['ngaythangnam'], []).append(row)
+            days = [
+                (f"{self._get_vietnamese_day_name(date_obj.weekday())} ({date_obj.strftime('%d/%m')})",
+                 [(self._format_time(shift['giobatdau']), self._format_time(shift['gioketthuc']), shift['trangthai'])
+                  for shift in shifts])
+                for date_obj, shifts in sorted(schedule_by_date.items())
+            ]
+            week = (start_of_week.strftime('%d/%m'), end_of_week.strftime('%d/%m'))
+            if json_mode():
+                dispatcher.utter_message(json_message=doctor_schedule_payload(tenBS, *week, days))
             else:
-                for date_obj, shifts in sorted(schedule_by_date.items()):
-                    day_vn = self._get_vietnamese_day_name(date_obj.weekday())
-                    d_str = date_obj.strftime('%d/%m')
-                    shifts_html = ""
-                    for shift in shifts:
-                        s_start = self._format_time(shift['giobatdau'])
-                        s_end = self._format_time(shift['gioketthuc'])
-                        stt = shift['trangthai']
-                        cls = "status-ghi" if stt == "Nghỉ" else ("status-full" if stt in ["Đã đầy", "Hoàn thành"] else "status-ok")
-                        shifts_html += f"<div class='shift-item'>{s_start} - {s_end} <span class='{cls}'>({stt})</span></div>"
-                    html_table += f"<tr><td class='date-cell'>{day_vn} ({d_str})</td><td>{shifts_html}</td></tr>"
-            
-            html_table += "</tbody></table>"
-            dispatcher.utter_message(text=html_table, html=True)
+                html_table = render_week_schedule(tenBS, *week, days)
+                dispatcher.utter_message(text=stylesheets.wrap(tracker, html_table, "schedule"), html=True)
         except Exception as e:
             print(f"[ERROR] Helper Schedule: {e}")
 
     # ============================================================
     # 2. VALIDATE DOCTOR NAME
     # ============================================================
-    def validate_doctor_name(
+    async def validate_doctor_name(
         self, slot_value: Any, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> Dict[Text, Any]:
-        interruption = self._handle_form_interruption(dispatcher, tracker)
+        interruption = await self._handle_form_interruption(dispatcher, tracker)
         if interruption: return interruption
 
         if not slot_value:
@@ -1640,31 +1497,25 @@ class ValidateBookAppointmentForm(FormValidationAction):
         specialty = tracker.get_slot("specialty")
 
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
+            # JOIN bacsi - chuyenmon - chuyenkhoa phục vụ từ cache dữ liệu tham chiếu
+            snapshot = await get_reference_data()
+            name_matches = snapshot.doctors_matching(doctor_input)
 
             if specialty:
-                query = "SELECT bs.maBS, bs.tenBS, ck.tenCK, bs.sdtBS FROM bacsi bs JOIN chuyenmon cm ON bs.maBS = cm.maBS JOIN chuyenkhoa ck ON cm.maCK = ck.maCK WHERE ck.tenCK = %s AND LOWER(bs.tenBS) LIKE %s"
-                cursor.execute(query, (specialty, f"%{doctor_input.lower()}%"))
-                matched = cursor.fetchall()
-                cursor.close()
-                conn.close()
+                matched = snapshot.doctor_specialty_rows(name_matches, specialty)
 
                 if matched:
                     doc = matched[0]
-                    confirm_html = f"""<div style="font-family: Arial, sans-serif; background: #d1ecf1; border-left: 5px solid #0c5460; border-radius: 8px; padding: 12px 16px;"><p style="font-weight: bold; color: #0c5460; margin: 0;">✅ Xác nhận bác sĩ:</p><p style="margin: 2px 0;"><strong>👨‍⚕️ {doc['tenBS']}</strong></p><p style="margin: 2px 0;">🏥 {doc['tenCK']}</p></div>"""
-                    dispatcher.utter_message(text=confirm_html, html=True)
-                    self._show_doctor_schedule_in_form(doc["maBS"], doc["tenBS"], dispatcher)
+                    confirm_html = render_doctor_confirmation(doc['tenBS'], doc['tenCK'])
+                    dispatcher.utter_message(text=stylesheets.wrap(tracker, confirm_html, "booking"), html=True)
+                    await self._show_doctor_schedule_in_form(doc["maBS"], doc["tenBS"], dispatcher, tracker)
+                    remember_doctor_id(tracker, snapshot, doc)
                     return {"doctor_name": doc["tenBS"]}
                 else:
                     dispatcher.utter_message(text=f"Bác sĩ '{doctor_input}' không thuộc khoa {specialty}.")
                     return {"doctor_name": None}
             else:
-                query = "SELECT bs.tenBS, ck.tenCK, bs.maBS, bs.sdtBS FROM bacsi bs JOIN chuyenmon cm ON bs.maBS = cm.maBS JOIN chuyenkhoa ck ON cm.maCK = ck.maCK WHERE LOWER(bs.tenBS) LIKE %s"
-                cursor.execute(query, (f"%{doctor_input.lower()}%",))
-                doctors = cursor.fetchall()
-                cursor.close()
-                conn.close()
+                doctors = snapshot.doctor_specialty_rows(name_matches)
 
                 if not doctors:
                     dispatcher.utter_message(text=f"Không tìm thấy bác sĩ '{doctor_input}'.")
@@ -1675,17 +1526,18 @@ class ValidateBookAppointmentForm(FormValidationAction):
 
                 if len(unique_names) == 1 and len(unique_specs) == 1:
                     doc = doctors[0]
-                    confirm_html = f"""<div style="font-family: Arial, sans-serif; background: #d1ecf1; border-left: 5px solid #0c5460; border-radius: 8px; padding: 12px 16px;"><p style="font-weight: bold; color: #0c5460; margin: 0;">✅ Xác nhận bác sĩ:</p><p style="margin: 2px 0;"><strong>👨‍⚕️ {doc['tenBS']}</strong></p><p style="margin: 2px 0;">🏥 Tự động chọn: {doc['tenCK']}</p></div>"""
-                    dispatcher.utter_message(text=confirm_html, html=True)
-                    self._show_doctor_schedule_in_form(doc["maBS"], doc["tenBS"], dispatcher)
+                    confirm_html = render_doctor_confirmation(doc['tenBS'], doc['tenCK'], auto_selected=True)
+                    dispatcher.utter_message(text=stylesheets.wrap(tracker, confirm_html, "booking"), html=True)
+                    await self._show_doctor_schedule_in_form(doc["maBS"], doc["tenBS"], dispatcher, tracker)
+                    remember_doctor_id(tracker, snapshot, doc)
                     return {"doctor_name": list(unique_names)[0], "specialty": list(unique_specs)[0]}
                 
                 if len(unique_names) == 1 and len(unique_specs) > 1:
                     doc = doctors[0]
-                    specs_str = ", ".join(unique_specs)
-                    msg = f"""<div style="font-family: Arial, sans-serif; background: #fff3cd; border-left: 5px solid #ffc107; border-radius: 8px; padding: 12px 16px;"><p style="font-weight: bold; margin: 0;">✅ Xác nhận: 👨‍⚕️ {doc['tenBS']}</p><p>⚠️ Bác sĩ làm nhiều khoa: <i>{specs_str}</i></p><p>👉 Vui lòng chọn chuyên khoa.</p></div>"""
-                    dispatcher.utter_message(text=msg, html=True)
-                    # KHÔNG hiện lịch ở đây
+                    msg = render_doctor_specialty_choice(doc['tenBS'], unique_specs)
+                    dispatcher.utter_message(text=stylesheets.wrap(tracker, msg, "booking"), html=True)
+                    # KHÔNG hiện lịch ở đây; chưa biết khoa nên chưa ghi maBS (các dòng có thể là
+                    # nhiều bác sĩ trùng tên) - resolve_doctor_id tra theo (tenBS, tenCK) sau khi chọn khoa
                     return {"doctor_name": list(unique_names)[0]}
 
                 dispatcher.utter_message(text=f"Tên '{doctor_input}' chưa rõ ràng. Vui lòng nhập đầy đủ hơn.")
@@ -1698,14 +1550,14 @@ class ValidateBookAppointmentForm(FormValidationAction):
     # ============================================================
     # 3. VALIDATE SPECIALTY
     # ============================================================
-    def validate_specialty(
+    async def validate_specialty(
         self, slot_value: Any, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> Dict[Text, Any]:
         
         latest_intent = tracker.latest_message.get('intent', {}).get('name')
         old_specialty = tracker.get_slot("specialty")
         if latest_intent in ["explain_specialty", "ask_doctor_info", "list_doctors_by_specialty", "ask_who_examined_me", "list_all_doctors", "ask_doctor_schedule"]:
-            interruption_result = self._handle_form_interruption(dispatcher, tracker)
+            interruption_result = await self._handle_form_interruption(dispatcher, tracker)
             if interruption_result: return {"specialty": old_specialty}
 
         if not slot_value:
@@ -1717,15 +1569,10 @@ class ValidateBookAppointmentForm(FormValidationAction):
             return {"specialty": None}
 
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
-            query = "SELECT tenCK FROM chuyenkhoa WHERE LOWER(tenCK) = %s"
-            cursor.execute(query, (specialty_input,))
-            result = cursor.fetchone()
+            result = await find_specialty(specialty_input)
             
             if not result:
                 dispatcher.utter_message(text=f"Chuyên khoa '{slot_value}' không tồn tại.")
-                cursor.close(); conn.close()
                 return {"specialty": None}
 
             validated_specialty = result['tenCK']
@@ -1736,14 +1583,12 @@ class ValidateBookAppointmentForm(FormValidationAction):
             has_doctor_entity = any(e['entity'] in ['doctor_name', 'doctor_id'] for e in entities)
 
             if doctor_name and not has_doctor_entity:
-                query_doc = "SELECT bs.maBS, bs.tenBS FROM bacsi bs JOIN chuyenmon cm ON bs.maBS = cm.maBS JOIN chuyenkhoa ck ON cm.maCK = ck.maCK WHERE ck.tenCK = %s AND LOWER(bs.tenBS) LIKE %s"
-                cursor.execute(query_doc, (validated_specialty, f"%{doctor_name.lower()}%"))
-                doc_match = cursor.fetchone()
+                snapshot = await get_reference_data()
+                doc_rows = snapshot.doctor_specialty_rows(snapshot.doctors_matching(doctor_name), validated_specialty)
+                doc_match = doc_rows[0] if doc_rows else None
                 if doc_match:
-                    self._show_doctor_schedule_in_form(doc_match["maBS"], doc_match["tenBS"], dispatcher)
+                    await self._show_doctor_schedule_in_form(doc_match["maBS"], doc_match["tenBS"], dispatcher, tracker)
             
-            cursor.close()
-            conn.close()
             return {"specialty": validated_specialty}
 
         except Exception as e:
@@ -1756,7 +1601,7 @@ class ValidateBookAppointmentForm(FormValidationAction):
     # ============================================================
     # 4. VALIDATE DATE (ĐÃ SỬA LỖI UNREAD RESULT)
     # ============================================================
-    def validate_date(
+    async def validate_date(
         self, slot_value: Any, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> Dict[Text, Any]:
         
@@ -1779,59 +1624,25 @@ class ValidateBookAppointmentForm(FormValidationAction):
             return {"date": None}
 
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            
-            # 👇 FIX QUAN TRỌNG: Thêm buffered=True để tránh lỗi "Unread result found"
-            cursor = conn.cursor(dictionary=True, buffered=True) 
-            
-            # 1. Lấy mã bác sĩ
-            cursor.execute("SELECT maBS FROM bacsi WHERE tenBS = %s", (doctor_name,))
+            # 1. Lấy mã bác sĩ (đã resolve ở validate_doctor_name -> lấy lại từ cache hội thoại)
+            maBS = await resolve_doctor_id(tracker, doctor_name, tracker.get_slot("specialty"))
             
-            # Dùng fetchall() cho an toàn, sau đó lấy phần tử đầu tiên
-            bs_results = cursor.fetchall() 
-            
-            if not bs_results:
-                cursor.close(); conn.close()
+            if not maBS:
                 dispatcher.utter_message(text=f"Không tìm thấy bác sĩ {doctor_name}.")
                 return {"date": None}
             
-            # Lấy maBS đầu tiên tìm thấy
-            maBS = bs_results[0]['maBS']
-            
-            # 2. Lấy lịch làm việc
-            query = """
-            SELECT giobatdau, gioketthuc, trangthai
-            FROM thoigiankham
-            WHERE maBS = %s AND DATE(ngaythangnam) = %s
-            ORDER BY giobatdau
-            """
-            cursor.execute(query, (maBS, parsed_date))
-            schedule = cursor.fetchall()
-            
-            cursor.close()
-            conn.close()
+            # 2. Lấy lịch làm việc trong ngày
+            schedule = await schedule_cache.day(maBS, parsed_date)
             
             if not schedule:
                 dispatcher.utter_message(text=f"Bác sĩ {doctor_name} không có lịch vào ngày {date_input}.")
                 return {"date": None}
 
-            # Hiển thị HTML
-            html = f"""<div style="font-family: Arial, sans-serif; background: #e7f3ff; border-left: 5px solid #007bff; border-radius: 8px; padding: 12px 16px; margin: 10px 0;"><p style="font-weight: bold; color: #007bff; margin: 0 0 8px 0;">✅ Các khung giờ ngày {date_input}:</p><div style="display: flex; flex-wrap: wrap; gap: 8px;">"""
-            
-            for slot in schedule:
-                s_start = self._format_time(slot['giobatdau'])
-                s_end = self._format_time(slot['gioketthuc'])
-                stt = slot['trangthai']
-                
-                # Tô màu trạng thái
-                cls = "status-ok"
-                if stt == "Nghỉ": cls = "status-ghi"
-                elif stt in ["Đã đầy", "Hoàn thành", "Full"]: cls = "status-full"
-
-                html += f"""<span style="background: white; border: 1px solid #007bff; color: #007bff; padding: 4px 8px; border-radius: 4px; font-size: 14px;">{s_start} - {s_end} <small style='color:#666'>({stt})</small></span>"""
-            
-            html += """</div><p style="margin: 8px 0 0 0; font-size: 14px;">👉 Vui lòng nhập giờ (HH:MM).</p></div>"""
-            dispatcher.utter_message(text=html, html=True)
+            # Hiển thị các khung giờ trong ngày
+            slots = [(self._format_time(slot['giobatdau']), self._format_time(slot['gioketthuc']), slot['trangthai'])
+                     for slot in schedule]
+            html = render_day_slots(date_input, slots)
+            dispatcher.utter_message(text=stylesheets.wrap(tracker, html, "booking"), html=True)
             
             return {"date": date_input}
 
@@ -1843,7 +1654,7 @@ class ValidateBookAppointmentForm(FormValidationAction):
     # ============================================================
     # 5. VALIDATE TIME & DESCRIPTION
     # ============================================================
-    def validate_appointment_time(self, slot_value: Any, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> Dict[Text, Any]:
+    async def validate_appointment_time(self, slot_value: Any, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> Dict[Text, Any]:
         if not slot_value: return {"appointment_time": None}
         time_input = str(slot_value).strip()
         try:
@@ -1852,11 +1663,34 @@ class ValidateBookAppointmentForm(FormValidationAction):
             dispatcher.utter_message(text="Giờ sai định dạng HH:MM.")
             return {"appointment_time": None}
             
-        # Check logic giờ nằm trong ca làm việc...
-        # (Giản lược để test DB trước, bạn có thể paste lại logic cũ vào đây nếu muốn check chặt chẽ)
+        time_input = parsed_time.strftime('%H:%M')
+
+        doctor_name = tracker.get_slot("doctor_name")
+        date_str = tracker.get_slot("date")
+        if not doctor_name or not date_str:
+            return {"appointment_time": time_input}
+
+        try:
+            parsed_date = datetime.strptime(date_str, '%d/%m/%Y').date()
+            maBS = await resolve_doctor_id(tracker, doctor_name, tracker.get_slot("specialty"))
+            if not maBS:
+                dispatcher.utter_message(text=f"Không tìm thấy bác sĩ {doctor_name}.")
+                return {"appointment_time": None}
+
+            # Giờ phải nằm trong ca làm việc và khung giờ chưa có người đặt
+            # (giữ chỗ thật sự được thực hiện có khóa lúc ghi lịch hẹn)
+            slot_error = await check_slot_available(maBS, parsed_date, time_input)
+        except (ValueError, Error) as e:
+            print(f"[ERROR] Validate appointment time: {e}")
+            dispatcher.utter_message(text="Không kiểm tra được khung giờ, vui lòng thử lại.")
+            return {"appointment_time": None}
+
+        if slot_error:
+            dispatcher.utter_message(text=slot_error)
+            return {"appointment_time": None}
         return {"appointment_time": time_input}
 
-    def validate_decription(self, slot_value: Any, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> Dict[Text, Any]:
+    async def validate_decription(self, slot_value: Any, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> Dict[Text, Any]:
         if not slot_value: return {"decription": None}
         desc = str(slot_value).strip()
         if len(desc) < 4: 
@@ -1911,68 +1745,51 @@ class ActionSearchDoctor(Action):
     def name(self) -> Text:
         return "action_search_doctor"
 
-    def run(
+    async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict]:
-        doctor_name_search = tracker.get_slot("doctor_name")  # Reuse doctor_name slot for search
+        # Nút chuyển trang gửi lại từ khóa qua entity doctor_name (slot đã bị reset sau lần tìm trước)
+        entities = tracker.latest_message.get('entities', [])
+        doctor_name_search = (next((e['value'] for e in entities if e['entity'] == 'doctor_name'), None)
+                              or tracker.get_slot("doctor_name"))  # Reuse doctor_name slot for search
         if not doctor_name_search:
             dispatcher.utter_message(text="Không nhận được tên bác sĩ để tra cứu. Hãy thử lại.")
             return [SlotSet("doctor_name", None)]
 
-        # Query MySQL để tìm bác sĩ matching tên (LIKE %name%)
+        # Tìm bác sĩ matching tên qua chỉ mục tên không dấu (không quét bảng bacsi);
+        # chỉ các bác sĩ của MỘT trang (phân trang keyset) được dựng thành dòng
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
-            query = """
-            SELECT bs.maBS, bs.tenBS, ck.tenCK, bs.sdtBS
-            FROM bacsi bs
-            JOIN chuyenmon cm ON bs.maBS = cm.maBS
-            JOIN chuyenkhoa ck ON cm.maCK = ck.maCK
-            WHERE bs.tenBS LIKE %s
-            """
-            cursor.execute(query, (f"%{doctor_name_search}%",))
-            doctors = cursor.fetchall()
-            cursor.close()
-            conn.close()
+            snapshot = await get_reference_data()
+            keys = snapshot.doctor_keys_matching(doctor_name_search)
         except Error as e:
             dispatcher.utter_message(text=f"Lỗi kết nối DB: {e}")
             return [SlotSet("doctor_name", None)]
 
-        if not doctors:
+        if not keys:
             dispatcher.utter_message(text=f"Không tìm thấy bác sĩ nào có tên chứa '{doctor_name_search}'. Hãy thử tên khác.")
             return [SlotSet("doctor_name", None)]
 
-        dispatcher.utter_message(
-            text=f"""
-            <div style="font-family: Arial, sans-serif; font-size: 15px; color: #333;">
-                <div style="font-weight: bold; color: #0d6efd; margin-bottom: 8px;">
-                    🔍 Tìm thấy {len(doctors)} bác sĩ phù hợp với từ khóa "<span style='color:#dc3545;'>{doctor_name_search}</span>":
-                </div>
-            </div>
-            """,
-            metadata={"html": True}
-        )
+        page = keyset_page(keys, page_cursor(tracker), snapshot.doctor_key)
+        doctors = snapshot.doctor_specialty_rows([snapshot.doctors[ma_bs] for _, ma_bs in page.keys])
+        pager = page_buttons(page, "search_doctor_info", doctor_name=doctor_name_search)
 
-        for doc in doctors:
-            doc_card = f"""
-                <div style="background: #f8f9fa; border-left: 4px solid #0d6efd;
-                            border-radius: 8px; padding: 10px 14px; margin-bottom: 8px;">
-                    <div style="font-weight: bold; color: #0d6efd; margin-bottom: 4px;">
-                        🩺 Bác sĩ {doc['tenBS']}
-                    </div>
-                    <div><strong>Chuyên khoa:</strong> {doc['tenCK']}</div>
-                    <div><strong>SĐT:</strong> {doc['sdtBS']}</div>
-                </div>
-            """
+        # Cả trang kết quả trong MỘT tin nhắn, nút "xem chi tiết" ghi tên bác sĩ
+        buttons = [
+            {
+                "title": f"📄 Xem chi tiết BS {doc['tenBS']}",
+                "payload": f"/view_doctor_detail{{\"doctor_id\":\"{doc['maBS']}\"}}"
+            }
+            for doc in doctors
+        ]
+        if json_mode():
+            dispatcher.utter_message(json_message=doctor_list_payload(
+                f"Tìm thấy {page.total} bác sĩ phù hợp", doctors, ["tenBS", "tenCK", "sdtBS"],
+                buttons=[[button] for button in buttons], query=doctor_name_search, page=page.info(), pager=pager,
+            ))
+        else:
+            html_list = render_doctor_search(doctor_name_search, doctors, page.total, page.start + 1, len(page.keys))
             dispatcher.utter_message(
-                text=doc_card,
-                buttons=[
-                    {
-                        "title": "📄 Xem chi tiết",
-                        "payload": f"/view_doctor_detail{{\"doctor_id\":\"{doc['maBS']}\"}}"
-                    }
-                ],
-                metadata={"html": True}
+                text=stylesheets.wrap(tracker, html_list, "list"), buttons=buttons + pager, metadata={"html": True}
             )
 
         return [SlotSet("current_task", None),
@@ -1983,7 +1800,7 @@ class ActionViewDoctorDetail(Action):
     def name(self) -> Text:
         return "action_view_doctor_detail"
 
-    def run(
+    async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict]:
         # Lấy doctor_id từ latest_message entities (giả sử NLU extract entity doctor_id từ payload)
@@ -1996,8 +1813,6 @@ class ActionViewDoctorDetail(Action):
 
         # Query MySQL để lấy chi tiết bác sĩ theo maBS (thêm fields nếu có: email, kinhnghiem, dia_chi, etc.)
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
             query = """
             SELECT bs.maBS, bs.tenBS, ck.tenCK, bs.sdtBS, bs.emailBS
             FROM bacsi bs
@@ -2005,10 +1820,7 @@ class ActionViewDoctorDetail(Action):
             JOIN chuyenkhoa ck ON cm.maCK = ck.maCK
             WHERE bs.maBS = %s
             """
-            cursor.execute(query, (doctor_id,))
-            doctor = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            doctor = await fetch_one(query, (doctor_id,))
         except Error as e:
             dispatcher.utter_message(text=f"Lỗi kết nối DB: {e}")
             return []
@@ -2050,7 +1862,7 @@ class ActionSearchSpecialty(Action):
     def name(self) -> Text:
         return "action_search_specialty"
 
-    def run(
+    async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict]:
         print(f"[DEBUG] action_search_specialty START")
@@ -2066,13 +1878,8 @@ class ActionSearchSpecialty(Action):
 
         # Query DB...
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
             query = "SELECT tenCK, mo_ta FROM chuyenkhoa WHERE tenCK = %s"
-            cursor.execute(query, (specialty,))
-            result = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            result = await fetch_one(query, (specialty,))
         except Error as e:
             dispatcher.utter_message(text=f"Lỗi DB: {e}")
             return [SlotSet("just_explained", False), FollowupAction("book_appointment_form")]
@@ -2103,7 +1910,7 @@ class ActionSubmitBooking(Action):
     def name(self) -> Text:
         return "action_submit_booking"
 
-    def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict]:
+    async def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict]:
         # ... (Phần lấy slot giữ nguyên) ...
         doctor_name = tracker.get_slot("doctor_name")
         specialty_name = tracker.get_slot("specialty")
@@ -2126,81 +1933,33 @@ class ActionSubmitBooking(Action):
             dispatcher.utter_message(text="Ngày không hợp lệ.")
             return []
 
-        # ================= SỬA LỖI TẠI ĐÂY =================
-        # Lấy maBS từ tenBS
-        try:
-            conn_bs = mysql.connector.connect(**DB_CONFIG)
-            
-            # THÊM buffered=True ĐỂ TRÁNH LỖI "Unread result found"
-            cursor_bs = conn_bs.cursor(dictionary=True, buffered=True) 
-            
-            query_bs = "SELECT maBS FROM bacsi WHERE tenBS = %s"
-            cursor_bs.execute(query_bs, (doctor_name,))
-            bs_result = cursor_bs.fetchone()
-            
-            cursor_bs.close() # Đóng cursor an toàn vì đã buffer
-            conn_bs.close()
-            
-            if not bs_result:
-                dispatcher.utter_message(text=f"Không tìm thấy bác sĩ tên {doctor_name} trong hệ thống.")
-                return []
-            maBS = bs_result['maBS']
-            
-        except Error as e:
-            dispatcher.utter_message(text=f"Lỗi DB (lấy mã BS): {e}")
-            return []
-        # ===================================================
+        # Khóa idempotency: webhook bị Rasa gửi lại sẽ nhận lại đúng mahen cũ
+        idem_key = booking_idempotency_key(tracker)
 
-        # Bắt đầu khối Transaction để Insert
+        # Resolve ID + insert lichhen + ghi khóa trong MỘT transaction trên MỘT kết nối
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            # Cũng nên thêm buffered=True ở đây cho an toàn
-            cursor = conn.cursor(dictionary=True, buffered=True) 
-            
-            # === BƯỚC 1: Tạo mahen tuần tự ===
-            query_max_id = "SELECT MAX(CAST(SUBSTRING(mahen, 3) AS UNSIGNED)) as max_id FROM lichhen"
-            cursor.execute(query_max_id)
-            result = cursor.fetchone()
-
-            current_max_id = 0 
-            if result and result['max_id'] is not None:
-                current_max_id = int(result['max_id'])
-            
-            next_id_num = current_max_id + 1
-            mahen = f"LH{next_id_num:08d}"
-
-            # === BƯỚC 2: Lấy maCK ===
-            maCK = None
-            if specialty_name:
-                cursor.execute("SELECT maCK FROM chuyenkhoa WHERE tenCK = %s", (specialty_name,))
-                ck_result = cursor.fetchone()
-                if ck_result:
-                    maCK = ck_result['maCK']
-            
-            if not maCK:
-                dispatcher.utter_message(text=f"Lỗi nghiêm trọng: Không tìm thấy mã chuyên khoa cho '{specialty_name}'.")
-                cursor.close()
-                conn.close()
-                return []
-
-            # === BƯỚC 3: Insert vào DB ===
-            query_insert = """
-            INSERT INTO lichhen (mahen, maBN, maBS, ngaythangnam, khunggio, trangthai, maCK, mota)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            
-            cursor.execute(query_insert, (mahen, patient_id, maBS, parsed_date, appointment_time, 'ChuaKham', maCK, decription))
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
-            
-            dispatcher.utter_message(text=f"Đặt lịch thành công! Mã hẹn của bạn là: {mahen}. Cảm ơn bạn.")
-            
+            snap = await get_reference_data()
+            ids = resolve_booking_ids(snap, doctor_name, specialty_name)
+            # Cấp mahen (LH%08d) từ block đã giữ trước - không quét lichhen, không trùng giữa các server
+            mahen = await run_db(appointment_ids.next_id)
+            outcome = await transaction(
+                write_booking, idem_key, mahen, patient_id, doctor_name, specialty_name,
+                parsed_date, appointment_time, decription, ids["maBS"], ids["maCK"]
+            )
         except Error as e:
             dispatcher.utter_message(text=f"Lỗi đặt lịch: {e}")
             return []
 
+        if "error" in outcome:
+            dispatcher.utter_message(text=outcome["error"])
+            return []
+
+        if outcome.get("replayed"):
+            print(f"[DEBUG] Booking replay (idempotency key {idem_key[:12]}...) -> {outcome['mahen']}")
+
+        dispatcher.utter_message(text=f"Đặt lịch thành công! Mã hẹn của bạn là: {outcome['mahen']}. Cảm ơn bạn.")
+        conversation_cache.finish(tracker.sender_id, "book_appointment_form")
+
         # Reset slots
         events = [
             SlotSet("current_task", None),
@@ -2218,6 +1977,7 @@ class ActionResetBooking(Action):
 
     def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict]:
         dispatcher.utter_message(text="Đã hủy yêu cầu đặt lịch. Bạn có thể bắt đầu lại.")
+        conversation_cache.finish(tracker.sender_id, "book_appointment_form")
         events = [
             SlotSet("current_task", None),
             SlotSet("doctor_name", None),
@@ -2235,6 +1995,7 @@ class ActionResetCancel(Action):
 
     def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict]:
         dispatcher.utter_message(text="Đã hủy hành động hủy lịch. Lịch hẹn vẫn giữ nguyên.")
+        conversation_cache.finish(tracker.sender_id, "cancel_appointment_form")
         events = [
             SlotSet("selected_appointment_id", None),
             SlotSet("current_task", None),
@@ -2250,7 +2011,7 @@ class ValidateSearchPrescriptionForm(FormValidationAction):
     def name(self) -> Text:
         return "validate_search_prescription_form"
 
-    def _handle_form_interruption(self, dispatcher, tracker):
+    async def _handle_form_interruption(self, dispatcher, tracker):
         """Xử lý interruption trong prescription form"""
         latest_message = tracker.latest_message
         
@@ -2262,14 +2023,14 @@ class ValidateSearchPrescriptionForm(FormValidationAction):
         # === THÊM MỚI: Xử lý list_all_specialties ===
         if latest_intent == "list_all_specialties":
             list_action = ActionListAllSpecialties()
-            list_action.run(dispatcher, tracker, {})
+            await list_action.run(dispatcher, tracker, {})
             # Trả về slot dummy để form tiếp tục mà không bị gãy flow
             return {"just_listed_all_specialties_dummy": False}
 
         # === Xử lý explain_specialty ===
         if latest_intent == "explain_specialty":
             explain_action = ActionExplainSpecialtyInForm()
-            explain_action.run(dispatcher, tracker, {})
+            await explain_action.run(dispatcher, tracker, {})
             return {
                 "prescription_date": tracker.get_slot("prescription_date"),
                 "just_explained": False,
@@ -2278,7 +2039,7 @@ class ValidateSearchPrescriptionForm(FormValidationAction):
         # === Xử lý ask_doctor_info ===
         if latest_intent == "ask_doctor_info":
             info_action = ActionShowDoctorInfoInForm()
-            info_action.run(dispatcher, tracker, {})
+            await info_action.run(dispatcher, tracker, {})
             return {
                 "prescription_date": tracker.get_slot("prescription_date"),
                 "just_asked_doctor_info": False,
@@ -2287,7 +2048,7 @@ class ValidateSearchPrescriptionForm(FormValidationAction):
         # === Xử lý list_doctors_by_specialty ===
         if latest_intent == "list_doctors_by_specialty":
             list_action = ActionListDoctorsInForm()
-            list_action.run(dispatcher, tracker, {})
+            await list_action.run(dispatcher, tracker, {})
             return {
                 "prescription_date": tracker.get_slot("prescription_date"),
                 "just_listed_doctors": False,
@@ -2296,23 +2057,23 @@ class ValidateSearchPrescriptionForm(FormValidationAction):
         # === THÊM MỚI: Xử lý ask_who_examined_me ===
         if latest_intent == "ask_who_examined_me":
             info_action = ActionShowExaminingDoctorInForm()
-            info_action.run(dispatcher, tracker, {})
+            await info_action.run(dispatcher, tracker, {})
             # Trả về slot dummy để form tiếp tục
             return {"just_asked_examining_doctor": False}
 
         if latest_intent == "list_all_doctors":
             list_action = ActionListAllDoctors()
-            list_action.run(dispatcher, tracker, {}) # Dùng {} cho domain
+            await list_action.run(dispatcher, tracker, {}) # Dùng {} cho domain
             return {"just_listed_all_doctors_dummy": False} # Trả về slot dummy để form tiếp tục
         
         if latest_intent == "ask_doctor_schedule":
             schedule_action = ActionShowDoctorSchedule()
-            schedule_action.run(dispatcher, tracker, {})
+            await schedule_action.run(dispatcher, tracker, {})
             return {"just_asked_doctor_schedule_dummy": False}
 
         return {}
 
-    def validate_prescription_date(
+    async def validate_prescription_date(
         self, 
         slot_value: Any, 
         dispatcher: CollectingDispatcher, 
@@ -2329,7 +2090,7 @@ class ValidateSearchPrescriptionForm(FormValidationAction):
             return [] # Dừng action
         
         # === CHECK INTERRUPTION TRƯỚC ===
-        interruption_result = self._handle_form_interruption(dispatcher, tracker)
+        interruption_result = await self._handle_form_interruption(dispatcher, tracker)
         if interruption_result:
             return interruption_result
         
@@ -2399,7 +2160,7 @@ class ActionShowPrescriptionResults(Action):
     def name(self) -> Text:
         return "action_show_prescription_results"
 
-    def run(
+    async def run(
         self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict]:
         
@@ -2418,9 +2179,6 @@ class ActionShowPrescriptionResults(Action):
             return []
 
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
-            
             if search_latest or prescription_date == "latest":
                 # Tìm toa thuốc mới nhất
                 query = """
@@ -2440,15 +2198,12 @@ class ActionShowPrescriptionResults(Action):
                 ORDER BY lk.ngaythangnamkham DESC
                 LIMIT 20
                 """
-                cursor.execute(query, (patient_id,))
-                prescriptions = cursor.fetchall()
+                prescriptions = await fetch_all(query, (patient_id,))
                 
                 if not prescriptions:
                     dispatcher.utter_message(
                         text="Không tìm thấy toa thuốc nào trong hồ sơ của bạn."
                     )
-                    cursor.close()
-                    conn.close()
                     return self._reset_slots()
                 
                 # Lấy ngày khám mới nhất
@@ -2459,24 +2214,9 @@ class ActionShowPrescriptionResults(Action):
                 # Tìm toa thuốc theo ngày cụ thể
                 parsed_date = datetime.strptime(prescription_date, '%d/%m/%Y').date()
                 
-                query = """
-                SELECT 
-                    lk.maLanKham,
-                    lk.ngaythangnamkham,
-                    t.tenThuoc,
-                    tt.lieuluong,
-                    tt.soluong,
-                    tt.donvi,
-                    tt.thoigianSD
-                FROM lankham lk
-                JOIN hosobenhnhan hs ON lk.maHS = hs.maHS
-                JOIN toathuoc tt ON lk.maLanKham = tt.maLanKham
-                JOIN thuoc t ON tt.maThuoc = t.maThuoc
-                WHERE hs.maBN = %s AND DATE(lk.ngaythangnamkham) = %s
-                ORDER BY t.tenThuoc
-                """
-                cursor.execute(query, (patient_id, parsed_date))
-                prescriptions = cursor.fetchall()
+                prescriptions = await fetch_all(
+                    PATIENT_PRESCRIPTIONS_ON_DAY_QUERY, (patient_id, *day_bounds(parsed_date))
+                )
                 
                 if not prescriptions:
                     dispatcher.utter_message(
@@ -2491,17 +2231,12 @@ class ActionShowPrescriptionResults(Action):
                         text="Bạn có muốn thử cách khác không?", 
                         buttons=buttons
                     )
-                    cursor.close()
-                    conn.close()
                     return self._reset_slots()
                 
                 title = f"Toa thuốc ngày {prescription_date}"
             
-            cursor.close()
-            conn.close()
-            
             # Hiển thị kết quả bằng HTML table
-            self._display_prescription_table(dispatcher, prescriptions, title)
+            self._display_prescription_table(dispatcher, tracker, prescriptions, title)
             
             # Offer next action
             buttons = [
@@ -2517,144 +2252,13 @@ class ActionShowPrescriptionResults(Action):
             dispatcher.utter_message(text=f"❌ Lỗi kết nối cơ sở dữ liệu: {e}")
             return self._reset_slots()
 
-    def _display_prescription_table(self, dispatcher, prescriptions, title):
-        """Hiển thị toa thuốc dưới dạng bảng HTML"""
-        
-        # Tạo HTML table với styling đẹp
-        html_table = f"""
-        <style>
-            .prescription-container {{
-                font-family: Arial, sans-serif;
-                /* SỬA ĐỔI: 
-                   - Bỏ max-width để khung co lại
-                   - Thêm width: fit-content để tự động co theo nội dung
-                   - Thêm min-width để không bị quá hẹp
-                   - Chuyển box-shadow, border-radius, overflow từ con sang cha
-                */
-                width: fit-content;
-                min-width: 350px; 
-                margin: 10px 0;
-                border-radius: 8px;
-                overflow: hidden;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-                
-                /* ================================= */
-                /* ===== THÊM MỚI THEO YÊU CẦU ===== */
-                border: 1px solid #dee2e6; /* <-- Thêm đường viền này */
-                /* ================================= */
-            }}
-            .prescription-title {{
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                color: white;
-                padding: 12px 16px;
-                font-weight: bold;
-                font-size: 16px;
-                /* SỬA ĐỔI: Bỏ border-radius, container cha sẽ xử lý */
-            }}
-            .prescription-table {{
-                /* SỬA ĐỔI: Bỏ width: 100% để bảng co lại theo nội dung */
-                border-collapse: collapse;
-                background: white;
-                /* SỬA ĐỔI: Bỏ box-shadow, border-radius, overflow */
-            }}
-            .prescription-table thead {{
-                background: #f8f9fa;
-            }}
-            .prescription-table th {{
-                padding: 12px 8px;
-                text-align: left;
-                font-weight: bold;
-                color: #495057;
-                border-bottom: 2px solid #dee2e6;
-                font-size: 14px;
-            }}
-            .prescription-table td {{
-                padding: 10px 8px;
-                border-bottom: 1px solid #e9ecef;
-                font-size: 14px;
-                color: #333;
-            }}
-            .prescription-table tr:last-child td {{
-                border-bottom: none;
-            }}
-            .prescription-table tr:hover {{
-                background: #f8f9fa;
-            }}
-            .medicine-name {{
-                font-weight: 600;
-                color: #667eea;
-            }}
-            .dosage {{
-                color: #28a745;
-                font-weight: 500;
-            }}
-            .prescription-footer {{
-                background: #f8f9fa;
-                padding: 10px 16px;
-                font-size: 13px;
-                color: #6c757d;
-                border-top: 2px solid #dee2e6;
-                /* SỬA ĐỔI: Bỏ border-radius và margin-top */
-            }}
-            @media screen and (max-width: 600px) {{
-                /* SỬA ĐỔI: Đảm bảo container vẫn chiếm 100% trên màn hình nhỏ */
-                .prescription-container {{
-                    width: 100%; 
-                    min-width: 0;
-                }}
-                .prescription-table th,
-                .prescription-table td {{
-                    font-size: 12px;
-                    padding: 8px 6px;
-                }}
-                .prescription-title {{
-                    font-size: 14px;
-                }}
-            }}
-        </style>
-        
-        <div class="prescription-container">
-            <div class="prescription-title">
-                💊 {title}
-            </div>
-            <table class="prescription-table">
-                <thead>
-                    <tr>
-                        <th>STT</th>
-                        <th>Tên thuốc</th>
-                        <th>Liều lượng</th>
-                        <th>Số lượng</th>
-                        <th>Đơn vị</th>
-                        <th>Thời gian SD</th>
-                    </tr>
-                </thead>
-                <tbody>
-        """
-        
-        # Thêm các dòng dữ liệu
-        for idx, med in enumerate(prescriptions, 1):
-            html_table += f"""
-                    <tr>
-                        <td>{idx}</td>
-                        <td class="medicine-name">{med['tenThuoc']}</td>
-                        <td class="dosage">{med['lieuluong']}</td>
-                        <td>{med['soluong']}</td>
-                        <td>{med['donvi']}</td>
-                        <td>{med['thoigianSD']}</td>
-                    </tr>
-            """
-        
-        html_table += f"""
-                </tbody>
-            </table>
-            <div class="prescription-footer">
-                <strong>Tổng số thuốc:</strong> {len(prescriptions)} loại | 
-                <strong>Mã lần khám:</strong> {prescriptions[0]['maLanKham']}
-            </div>
-        </div>
-        """
-        
-        dispatcher.utter_message(text=html_table)
+    def _display_prescription_table(self, dispatcher, tracker, prescriptions, title):
+        """Hiển thị toa thuốc: payload JSON, hoặc bảng HTML (template HTML, CSS gửi một lần mỗi phiên)"""
+        if json_mode():
+            dispatcher.utter_message(json_message=prescription_payload(title, prescriptions))
+            return
+        html_table = render_prescription_table(title, prescriptions)
+        dispatcher.utter_message(text=stylesheets.wrap(tracker, html_table, "prescription"))
 
     def _reset_slots(self):
         """Reset các slots sau khi hoàn thành"""
@@ -2758,7 +2362,7 @@ class ActionCheckUpcomingAppointments(Action):
         days_vn = ["Thứ 2", "Thứ 3", "Thứ 4", "Thứ 5", "Thứ 6", "Thứ 7", "Chủ Nhật"]
         return days_vn[weekday_index]
 
-    def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict]:
+    async def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict]:
         
         # 1. Lấy maBN (patient_id) từ metadata
         patient_id = get_patient_id(tracker)
@@ -2773,96 +2377,37 @@ class ActionCheckUpcomingAppointments(Action):
         print(f"[DEBUG] Đang chạy ActionCheckUpcomingAppointments cho bệnh nhân: {patient_id}")
         
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
-            
             # 3. Lấy ngày hôm nay
             today_date = datetime.now().date()
             
-            # 4. Query lịch hẹn SẮP TỚI (từ hôm nay) và CHƯA KHÁM
-            query = """
-            SELECT 
-                lh.mahen, 
-                lh.ngaythangnam, 
-                lh.khunggio, 
-                bs.tenBS, 
-                ck.tenCK,
-                lh.mota
-            FROM lichhen lh
-            JOIN bacsi bs ON lh.maBS = bs.maBS
-            JOIN chuyenkhoa ck ON lh.maCK = ck.maCK
-            WHERE lh.maBN = %s 
-              AND DATE(lh.ngaythangnam) >= %s
-              AND lh.trangthai = 'ChuaKham'
-            ORDER BY lh.ngaythangnam, lh.khunggio
-            LIMIT 3 
-            """ # Giới hạn 3 lịch hẹn gần nhất cho gọn
-            
-            cursor.execute(query, (patient_id, today_date))
-            appointments = cursor.fetchall()
-            cursor.close()
-            conn.close()
+            # 4. Query lịch hẹn SẮP TỚI (từ hôm nay) và CHƯA KHÁM - giới hạn 3 lịch hẹn gần nhất cho gọn
+            appointments = await fetch_all(PATIENT_UPCOMING_APPOINTMENTS_QUERY, (patient_id, today_date))
 
             # 5. Nếu có lịch hẹn, gửi thông báo
             if appointments:
-                # ===============================================
-                # === SỬA ĐỔI: CHIA NHỎ LOGIC HIỂN THỊ ===
-                # ===============================================
-                
-                # Hiển thị tiêu đề trước
-                title_message = f"""
-                <div style="font-family: Arial, sans-serif; font-size: 15px; color: #333;
-                            background: #fffbef; border-left: 5px solid #ffc107; border-radius: 8px;
-                            padding: 12px 16px; margin: 10px 0 4px 0;">
-                    <div style="font-weight: bold; color: #856404; margin-bottom: 8px;">
-                        🔔 **Thông báo lịch hẹn sắp tới:**
-                    </div>
-                </div>
-                """
-                dispatcher.utter_message(text=title_message, html=True)
-
-                # Lặp qua từng lịch hẹn và gửi kèm nút bấm
+                items, buttons = [], []
                 for appt in appointments:
                     date_obj = appt['ngaythangnam']
-                    day_name_vn = self._get_vietnamese_day_name(date_obj.weekday())
-                    date_str = date_obj.strftime('%d/%m/%Y')
-                    time_str = self._format_time(appt['khunggio'])
-                    
-                    # HTML cho 1 lịch hẹn
-                    html_appt = f"""
-                    <div style="font-family: Arial, sans-serif; font-size: 15px; color: #333;
-                                background: #fffbef; border-left: 5px solid #ffc107; border-radius: 8px; 
-                                padding: 8px 10px; margin: 0 0 4px 0;">
-                        <div><strong>Ngày:</strong> {day_name_vn}, {date_str}</div>
-                        <div><strong>Giờ:</strong> {time_str}</div>
-                        <div><strong>Bác sĩ:</strong> {appt['tenBS']} ({appt['tenCK']})</div>
-                        <div><strong>Mã hẹn:</strong> {appt['mahen']}</div>
-                        <div><strong>Mô tả:</strong> {appt['mota']}</div>
-                    </div>
-                    """
-                    
+                    items.append({
+                        "day": f"{self._get_vietnamese_day_name(date_obj.weekday())}, {date_obj.strftime('%d/%m/%Y')}",
+                        "time": self._format_time(appt['khunggio']),
+                        "tenBS": appt['tenBS'], "tenCK": appt['tenCK'], "mahen": appt['mahen'], "mota": appt['mota'],
+                    })
                     # Nút bấm với payload chứa mahen
-                    buttons = [
-                        {
-                            "title": f"❌ Hủy lịch hẹn này ({appt['mahen']})",
-                            # Intent mới sẽ được tạo ở nlu.yml
-                            "payload": f"/cancel_specific_appointment{{\"appointment_id\":\"{appt['mahen']}\"}}"
-                        }
-                    ]
-                    
-                    # Gửi tin nhắn
-                    dispatcher.utter_message(text=html_appt, buttons=buttons, html=True)
-
-                # Hiển thị footer
-                footer_message = """
-                <div style="font-family: Arial, sans-serif; font-size: 14px; color: #333; margin-top: 4px;">
-                    👉 Vui lòng đến đúng giờ.
-                </div>
-                """
-                dispatcher.utter_message(text=footer_message, html=True)
-                # ===============================================
-                # === KẾT THÚC SỬA ĐỔI ===
-                # ===============================================
+                    buttons.append({
+                        "title": f"❌ Hủy lịch hẹn {appt['mahen']}",
+                        # Intent mới sẽ được tạo ở nlu.yml
+                        "payload": f"/cancel_specific_appointment{{\"appointment_id\":\"{appt['mahen']}\"}}"
+                    })
+
+                # MỘT tin nhắn cho cả danh sách (tiêu đề + từng lịch hẹn + footer, các nút hủy gộp lại)
+                if json_mode():
+                    dispatcher.utter_message(json_message=appointments_payload(items, [[button] for button in buttons]))
+                else:
+                    html_list = render_upcoming_appointments(items)
+                    dispatcher.utter_message(
+                        text=stylesheets.wrap(tracker, html_list, "appointment"), buttons=buttons, html=True
+                    )
             else:
                 # ⚠️ THÊM DÒNG NÀY ĐỂ DEBUG ⚠️
                 print(f"[DEBUG] ActionCheckUpcomingAppointments: Không tìm thấy lịch hẹn nào cho {patient_id}.")
@@ -2881,44 +2426,19 @@ class ActionListAllSpecialties(Action):
     def name(self) -> Text:
         return "action_list_all_specialties"
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         print(f"[DEBUG] Running ActionListAllSpecialties")
         
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
-            # Query lấy tên chuyên khoa và mô tả
-            query = "SELECT tenCK, mota FROM chuyenkhoa ORDER BY tenCK"
-            cursor.execute(query)
-            specialties = cursor.fetchall()
-            cursor.close()
-            conn.close()
+            # Danh sách đã render sẵn theo version nội dung của dữ liệu tham chiếu
+            snapshot = await get_reference_data()
+            listing = listing_cache.get(snapshot, "all_specialties")
             
-            if specialties:
-                html_list = f"""
-                <div style="font-family: Arial, sans-serif; font-size: 15px; color: #333; background: #f0fdf4; border-radius: 10px; padding: 12px; border: 1px solid #bbf7d0;">
-                    <div style="color: #16a34a; font-weight: bold; margin-bottom: 8px; font-size: 16px;">
-                        🏥 Danh sách các chuyên khoa hiện có:
-                    </div>
-                """
-                
-                for spec in specialties:
-                    desc = spec['mota'] if spec['mota'] else "Chuyên điều trị các bệnh lý liên quan."
-                    # Cắt ngắn mô tả nếu quá dài
-                    if len(desc) > 60: desc = desc[:60] + "..."
-                    
-                    html_list += f"""
-                    <div style="background: #ffffff; border-left: 4px solid #16a34a; border-radius: 6px; padding: 8px 12px; margin-bottom: 8px; box-shadow: 0 1px 2px rgba(0,0,0,0.05);">
-                        <div style="font-weight: bold; color: #15803d;">🩺 {spec['tenCK']}</div>
-                        <div style="font-size: 13px; color: #555;">{desc}</div>
-                    </div>
-                    """
-                
-                html_list += """
-                    <div style="margin-top: 6px; font-style: italic; color: #666;">👉 Vui lòng tiếp tục yêu cầu của bạn...</div>
-                </div>
-                """
-                dispatcher.utter_message(text=html_list, html=True)
+            if listing:
+                if json_mode():
+                    dispatcher.utter_message(json_message=listing.payload)
+                else:
+                    dispatcher.utter_message(text=stylesheets.wrap(tracker, listing.html, "specialty"), html=True)
             else:
                 dispatcher.utter_message(text="Hiện tại hệ thống chưa cập nhật danh sách chuyên khoa.")
                 
@@ -2934,7 +2454,7 @@ class ActionCheckReexaminationDate(Action):
     def name(self) -> Text:
         return "action_check_reexamination_date"
 
-    def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict]:
+    async def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict]:
         
         patient_id = get_patient_id(tracker)
         if not patient_id:
@@ -2942,9 +2462,6 @@ class ActionCheckReexaminationDate(Action):
             return []
 
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
-            
             today_date = datetime.now().date()
             
             # 1. SỬA CÂU QUERY: Thêm bs.maBS vào SELECT
@@ -2968,10 +2485,7 @@ class ActionCheckReexaminationDate(Action):
             LIMIT 1
             """
             
-            cursor.execute(query, (patient_id, today_date))
-            result = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            result = await fetch_one(query, (patient_id, today_date))
 
             if result:
                 date_taikham_str = result['ngaytaikham'].strftime('%d/%m/%Y')
@@ -2985,23 +2499,7 @@ class ActionCheckReexaminationDate(Action):
                 diagnosis = result['chuandoan']
                 note = result['lieutrinhdieutri']
 
-                message = f"""
-                <div style="font-family: Arial, sans-serif; font-size: 15px; color: #333;
-                            background: #e3f2fd; border-left: 5px solid #2196f3; border-radius: 8px; 
-                            padding: 12px 16px; margin: 10px 0;">
-                    <div style="font-weight: bold; color: #1976d2; margin-bottom: 8px;">
-                        🩺 Thông báo tái khám:
-                    </div>
-                    <div><strong>📅 Ngày hẹn tái khám:</strong> <span style="color: #d32f2f; font-weight: bold;">{date_taikham_str}</span></div>
-                    <hr style="border: 0; border-top: 1px solid #bbdefb; margin: 8px 0;">
-                    <div style="font-size: 14px; color: #555;">
-                        <em>Thông tin lần khám trước ({date_kham_cu_str}):</em><br>
-                        - <strong>Bác sĩ:</strong> {ten_bs} ({ten_ck})<br>
-                        - <strong>Chẩn đoán:</strong> {diagnosis}<br>
-                        - <strong>Lời dặn:</strong> {note}
-                    </div>
-                </div>
-                """
+                message = render_reexamination(date_taikham_str, date_kham_cu_str, ten_bs, ten_ck, diagnosis, note)
                 
                 # 2. SỬA PAYLOAD NÚT BẤM: Truyền doctor_id và specialty vào
                 # Bot sẽ hiểu là "Tôi muốn đặt với bác sĩ này", và sẽ bỏ qua bước hỏi tên bác sĩ
@@ -3012,7 +2510,9 @@ class ActionCheckReexaminationDate(Action):
                     }
                 ]
                 
-                dispatcher.utter_message(text=message, buttons=buttons, html=True)
+                dispatcher.utter_message(
+                    text=stylesheets.wrap(tracker, message, "appointment"), buttons=buttons, html=True
+                )
                 
             else:
                 dispatcher.utter_message(
@@ -0,0 +1,146 @@
+"""
+Đường ghi đặt lịch: MỘT transaction trên MỘT kết nối.
+
+- maBS / maCK lấy từ snapshot dữ liệu tham chiếu (không tốn round trip), bác sĩ xác định theo
+  tên + chuyên khoa đã chọn; chỉ khi snapshot chưa có mới tra DB ngay trong transaction.
+- Khóa idempotency = sha256(sender_id | sự kiện user kích hoạt action) được ghi
+  cùng transaction với lichhen (migrations/003_booking_idempotency.sql).
+  Rasa gửi lại webhook -> cùng khóa -> trả về mahen cũ thay vì tạo lịch trùng.
+- Khung giờ được giữ chỗ nguyên tử ngay trong transaction (actions/slots.py);
+  deadlock / lock wait timeout được thử lại tối đa BOOKING_RETRIES lần.
+"""
+import hashlib
+import os
+from typing import Any, Dict, Optional
+
+from mysql.connector import errors
+from rasa_sdk import Tracker
+
+from .refdata import ReferenceSnapshot
+from .slots import RETRYABLE_ERRNOS, check_slot
+
+BOOKING_RETRIES = int(os.getenv('BOOKING_RETRIES', '3'))
+
+# Snapshot chưa có bác sĩ (vừa thêm) -> tra trong transaction, cũng theo tên + chuyên khoa
+BOOKING_DOCTOR_QUERY = """
+SELECT DISTINCT bs.maBS
+FROM bacsi bs
+JOIN chuyenmon cm ON cm.maBS = bs.maBS
+JOIN chuyenkhoa ck ON ck.maCK = cm.maCK
+WHERE bs.tenBS = %s AND ck.tenCK = %s
+"""
+
+
+def booking_idempotency_key(tracker: Tracker) -> str:
+    """Khóa ổn định cho một lần đặt lịch: sender_id + tin nhắn user gần nhất."""
+    trigger = None
+    for event in reversed(tracker.events or []):
+        if event.get("event") == "user":
+            trigger = event.get("message_id") or event.get("timestamp")
+            break
+    if trigger is None:
+        trigger = tracker.latest_message.get("message_id") or tracker.latest_message.get("text")
+    raw = f"{tracker.sender_id}|{trigger}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def resolve_booking_ids(snap: ReferenceSnapshot, doctor_name: str, specialty_name: str) -> Dict[str, Optional[str]]:
+    """
+    maBS: bác sĩ khớp nguyên tên VÀ thuộc chuyên khoa đã chọn (hai bác sĩ trùng tên ở hai khoa vẫn
+    phân biệt được). Không xác định được đúng một bác sĩ -> None, write_booking tra lại trong transaction.
+    """
+    specialty = snap.find_specialty(specialty_name)
+    name = str(doctor_name or '').strip()
+    same_name = [doc for doc in snap.doctors.values() if doc.get('tenBS') == name]
+    if specialty:
+        ma_bs = {row['maBS'] for row in snap.doctor_specialty_rows(same_name, specialty['tenCK'])}
+    else:
+        ma_bs = {doc['maBS'] for doc in same_name}
+    return {
+        "maBS": ma_bs.pop() if len(ma_bs) == 1 else None,
+        "maCK": specialty['maCK'] if specialty else None,
+    }
+
+
+def _write_booking_once(conn, idem_key: str, mahen: str, patient_id: str, doctor_name: str,
+                        specialty_name: str, parsed_date, appointment_time: str, decription: str,
+                        maBS: Optional[str] = None, maCK: Optional[str] = None,
+                        commit: bool = True) -> Dict[str, Any]:
+    """
+    Trả về:
+      {"mahen": ...}                     - đặt lịch mới
+      {"mahen": ..., "replayed": True}   - khóa đã tồn tại (webhook gửi lại)
+      {"error": ...}                     - dữ liệu không hợp lệ (đã rollback)
+    """
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        conn.start_transaction()
+
+        # Ghi khóa trước: request trùng đang chạy song song sẽ chờ khóa dòng ở đây
+        cursor.execute(
+            "INSERT IGNORE INTO booking_idempotency (idem_key, mahen, maBN) VALUES (%s, %s, %s)",
+            (idem_key, mahen, patient_id),
+        )
+        if cursor.rowcount == 0:
+            cursor.execute("SELECT mahen FROM booking_idempotency WHERE idem_key = %s", (idem_key,))
+            existing = cursor.fetchone()
+            conn.rollback()
+            return {"mahen": existing['mahen'], "replayed": True}
+
+        if not maBS:
+            cursor.execute(BOOKING_DOCTOR_QUERY, (doctor_name, specialty_name))
+            rows = cursor.fetchall()
+            if not rows:
+                conn.rollback()
+                return {"error": f"Không tìm thấy bác sĩ tên {doctor_name} trong hệ thống."}
+            if len(rows) > 1:
+                conn.rollback()
+                return {"error": f"Có nhiều bác sĩ tên {doctor_name} thuộc khoa {specialty_name}. "
+                                 f"Vui lòng chọn lại bác sĩ."}
+            maBS = rows[0]['maBS']
+
+        if not maCK and specialty_name:
+            cursor.execute("SELECT maCK FROM chuyenkhoa WHERE tenCK = %s", (specialty_name,))
+            row = cursor.fetchone()
+            if row:
+                maCK = row['maCK']
+        if not maCK:
+            conn.rollback()
+            return {"error": f"Lỗi nghiêm trọng: Không tìm thấy mã chuyên khoa cho '{specialty_name}'."}
+
+        # Giữ chỗ: khóa ca làm việc rồi đếm lịch hẹn đã có trong khung giờ
+        slot_error = check_slot(cursor, maBS, parsed_date, appointment_time, lock=True)
+        if slot_error:
+            conn.rollback()
+            return {"error": slot_error}
+
+        cursor.execute(
+            """
+            INSERT INTO lichhen (mahen, maBN, maBS, ngaythangnam, khunggio, trangthai, maCK, mota)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            (mahen, patient_id, maBS, parsed_date, appointment_time, 'ChuaKham', maCK, decription),
+        )
+        if commit:
+            conn.commit()
+        return {"mahen": mahen}
+    finally:
+        cursor.close()
+
+
+def write_booking(conn, idem_key: str, mahen: str, patient_id: str, doctor_name: str, specialty_name: str,
+                  parsed_date, appointment_time: str, decription: str, maBS: Optional[str] = None,
+                  maCK: Optional[str] = None, commit: bool = True) -> Dict[str, Any]:
+    """
+    Chạy trên executor DB (qua transaction()). Kết quả xem _write_booking_once.
+    commit=False dùng cho benchmark: người gọi tự rollback.
+    """
+    for attempt in range(BOOKING_RETRIES + 1):
+        try:
+            return _write_booking_once(conn, idem_key, mahen, patient_id, doctor_name, specialty_name,
+                                       parsed_date, appointment_time, decription, maBS, maCK, commit)
+        except errors.DatabaseError as e:
+            conn.rollback()
+            if e.errno not in RETRYABLE_ERRNOS or attempt == BOOKING_RETRIES:
+                raise
+            print(f"[WARN] Đặt lịch gặp lỗi khóa ({e.errno}), thử lại lần {attempt + 1}")
@@ -0,0 +1,354 @@
+"""
+Tầng kết nối MySQL dùng chung cho toàn bộ action server.
+
+Mọi action/validator mượn kết nối từ một pool duy nhất (theo tiến trình)
+thay vì tự gọi mysql.connector.connect() cho từng truy vấn.
+"""
+import asyncio
+import functools
+import os
+import threading
+import time as _time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Sequence
+
+import mysql.connector
+from mysql.connector import errors
+from dotenv import load_dotenv
+
+# Load file .env
+load_dotenv()
+
+# Kết nối DB từ .env
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST'),
+    'user': os.getenv('DB_USER'),
+    'password': os.getenv('DB_PASSWORD'),
+    'database': os.getenv('DB_NAME')
+}
+
+if None in DB_CONFIG.values():
+    raise ValueError("Thiếu thông tin kết nối DB trong file .env.")
+
+# Cấu hình pool (có thể chỉnh trong .env)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))               # Số kết nối giữ sẵn
+DB_POOL_MAX_OVERFLOW = int(os.getenv('DB_POOL_MAX_OVERFLOW', '10'))  # Số kết nối vượt mức tối đa khi cao điểm
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))      # Giây chờ tối đa khi pool cạn
+DB_POOL_RECYCLE = float(os.getenv('DB_POOL_RECYCLE', '3600'))    # Giây sống tối đa của 1 kết nối
+# Số thread chạy I/O MySQL ngoài event loop (mặc định = số kết nối tối đa của pool)
+DB_EXECUTOR_WORKERS = int(os.getenv('DB_EXECUTOR_WORKERS', str(DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW)))
+
+
+class PooledConnection:
+    """
+    Bọc một kết nối mysql.connector. Gọi close() sẽ TRẢ kết nối về pool
+    thay vì đóng hẳn, nên code cũ (conn.cursor(), conn.commit(), conn.close())
+    vẫn dùng được nguyên vẹn.
+    """
+
+    def __init__(self, pool: "ConnectionPool", raw_conn, created_at: float):
+        self._pool = pool
+        self._raw = raw_conn
+        self._created_at = created_at
+
+    def __getattr__(self, item):
+        if item.startswith('_'):
+            raise AttributeError(item)
+        if self._raw is None:
+            raise errors.OperationalError("Kết nối đã được trả về pool.")
+        return getattr(self._raw, item)
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool._checkin(raw, self._created_at)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # Lưới an toàn: action quên close() (ví dụ khi có exception) vẫn trả kết nối về pool
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Pool kết nối thread-safe với:
+    - pool_size kết nối thường trực + max_overflow kết nối tạm khi cao điểm
+    - health check (ping) khi lấy kết nối ra, tự thay kết nối chết
+    - metrics: số lần checkout, thời gian chờ, số lần timeout...
+    """
+
+    def __init__(self, db_config: Dict[str, Any], pool_size: int = DB_POOL_SIZE,
+                 max_overflow: int = DB_POOL_MAX_OVERFLOW, timeout: float = DB_POOL_TIMEOUT,
+                 recycle: float = DB_POOL_RECYCLE):
+        self._db_config = dict(db_config)
+        self.pool_size = max(1, pool_size)
+        self.max_overflow = max(0, max_overflow)
+        self.timeout = timeout
+        self.recycle = recycle
+
+        self._idle = deque()  # (raw_conn, created_at)
+        self._opened = 0      # Tổng số kết nối đang tồn tại (idle + đang dùng)
+        self._cond = threading.Condition()
+
+        self._metrics = {
+            "checkouts": 0,
+            "connects": 0,
+            "health_check_failures": 0,
+            "recycled": 0,
+            "timeouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "checkout_time_total": 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    def _connect(self):
+        raw = mysql.connector.connect(**self._db_config)
+        with self._cond:
+            self._metrics["connects"] += 1
+        return raw, _time.monotonic()
+
+    def _is_healthy(self, raw, created_at: float) -> bool:
+        if self.recycle and _time.monotonic() - created_at > self.recycle:
+            with self._cond:
+                self._metrics["recycled"] += 1
+            return False
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception:
+            with self._cond:
+                self._metrics["health_check_failures"] += 1
+            return False
+
+    @staticmethod
+    def _discard(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def get_connection(self) -> PooledConnection:
+        """Mượn 1 kết nối (chặn tối đa `timeout` giây nếu pool đã cạn)."""
+        started = _time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+
+        while True:
+            raw = None
+            created_at = 0.0
+            must_open = False
+            with self._cond:
+                while True:
+                    if self._idle:
+                        raw, created_at = self._idle.pop()
+                        break
+                    if self._opened < self.pool_size + self.max_overflow:
+                        self._opened += 1
+                        must_open = True
+                        break
+                    remaining = deadline - _time.monotonic()
+                    if remaining <= 0:
+                        self._metrics["timeouts"] += 1
+                        raise errors.PoolError(
+                            f"Pool kết nối DB đã cạn (size={self.pool_size}, overflow={self.max_overflow})."
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+            if must_open:
+                try:
+                    raw, created_at = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._opened -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(raw, created_at):
+                self._discard(raw)
+                with self._cond:
+                    self._opened -= 1
+                continue
+
+            wait_time = _time.monotonic() - started
+            with self._cond:
+                self._metrics["checkouts"] += 1
+                self._metrics["checkout_time_total"] += wait_time
+                if waited:
+                    self._metrics["waits"] += 1
+                    self._metrics["wait_time_total"] += wait_time
+                    self._metrics["wait_time_max"] = max(self._metrics["wait_time_max"], wait_time)
+            return PooledConnection(self, raw, created_at)
+
+    def _checkin(self, raw, created_at: float):
+        # Không để transaction dở dang rò sang action khác
+        try:
+            if raw.in_transaction:
+                raw.rollback()
+            reusable = True
+        except Exception:
+            reusable = False
+
+        with self._cond:
+            if reusable and len(self._idle) < self.pool_size:
+                self._idle.append((raw, created_at))
+                raw = None
+            else:
+                self._opened -= 1
+            self._cond.notify()
+
+        if raw is not None:
+            self._discard(raw)
+
+    def stats(self) -> Dict[str, Any]:
+        """Metrics của pool (dùng để log/giám sát)."""
+        with self._cond:
+            data = dict(self._metrics)
+            data["idle"] = len(self._idle)
+            data["opened"] = self._opened
+            data["in_use"] = self._opened - len(self._idle)
+            data["overflow"] = max(0, self._opened - self.pool_size)
+        checkouts = data["checkouts"] or 1
+        data["avg_checkout_ms"] = round(data["checkout_time_total"] / checkouts * 1000, 3)
+        data["avg_wait_ms"] = round(data["wait_time_total"] / (data["waits"] or 1) * 1000, 3)
+        return data
+
+    def dispose(self):
+        """Đóng toàn bộ kết nối đang rảnh."""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._opened -= len(idle)
+        for raw, _ in idle:
+            self._discard(raw)
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Pool dùng chung cho cả tiến trình action server (khởi tạo lười).
+
+    Pool gắn với PID tạo ra nó: tiến trình con tạo bằng fork kế thừa các socket MySQL của tiến trình cha,
+    nên khi PID khác thì dựng pool mới. Pool cũ chỉ bị bỏ đi, KHÔNG đóng (đóng sẽ gửi COM_QUIT
+    trên socket mà tiến trình cha vẫn đang dùng).
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool(DB_CONFIG)
+                _pool_pid = pid
+    return _pool
+
+
+def get_connection() -> PooledConnection:
+    """Thay thế cho mysql.connector.connect(**DB_CONFIG)."""
+    return get_pool().get_connection()
+
+
+def pool_stats() -> Dict[str, Any]:
+    return get_pool().stats()
+
+
+# ======================================================================
+# TRUY CẬP DB BẤT ĐỒNG BỘ
+# mysql.connector là driver blocking -> chạy trên một executor có giới hạn
+# để event loop của action server không bị chặn bởi truy vấn chậm.
+# ======================================================================
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=max(1, DB_EXECUTOR_WORKERS), thread_name_prefix="db-io"
+                )
+    return _executor
+
+
+async def run_db(func: Callable, *args, **kwargs):
+    """Chạy một hàm DB đồng bộ trên executor và await kết quả."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def run_in_connection(func: Callable, *args, **kwargs):
+    """Mượn 1 kết nối, gọi func(conn, *args) rồi trả kết nối về pool (đồng bộ)."""
+    conn = get_connection()
+    try:
+        return func(conn, *args, **kwargs)
+    finally:
+        conn.close()
+
+
+def _fetch(conn, query: str, params: Sequence, dictionary: bool, one: bool):
+    cursor = conn.cursor(dictionary=dictionary, buffered=True)
+    try:
+        cursor.execute(query, tuple(params))
+        return cursor.fetchone() if one else cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def _execute(conn, query: str, params: Sequence) -> int:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, tuple(params))
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+def fetch_all_sync(query: str, params: Sequence = (), dictionary: bool = True):
+    return run_in_connection(_fetch, query, params, dictionary, False)
+
+
+def fetch_one_sync(query: str, params: Sequence = (), dictionary: bool = True):
+    return run_in_connection(_fetch, query, params, dictionary, True)
+
+
+def execute_sync(query: str, params: Sequence = ()) -> int:
+    return run_in_connection(_execute, query, params)
+
+
+async def fetch_all(query: str, params: Sequence = (), dictionary: bool = True):
+    """SELECT nhiều dòng (không chặn event loop)."""
+    return await run_db(fetch_all_sync, query, params, dictionary)
+
+
+async def fetch_one(query: str, params: Sequence = (), dictionary: bool = True):
+    """SELECT một dòng (không chặn event loop)."""
+    return await run_db(fetch_one_sync, query, params, dictionary)
+
+
+async def execute(query: str, params: Sequence = ()) -> int:
+    """INSERT/UPDATE/DELETE + commit, trả về số dòng bị ảnh hưởng."""
+    return await run_db(execute_sync, query, params)
+
+
+async def transaction(func: Callable, *args, **kwargs):
+    """
+    Chạy func(conn, *args) trên executor với 1 kết nối riêng.
+    func tự commit; nếu func ném lỗi, transaction dở dang sẽ bị rollback khi trả kết nối.
+    """
+    return await run_db(run_in_connection, func, *args, **kwargs)
@@ -0,0 +1,96 @@
+"""
+Hedging cho gợi ý chuyên khoa: chạy đua kết quả cục bộ (đã có sẵn) với lời gọi Gemini.
+
+- Gemini trả về trong SPECIALTY_HEDGE_BUDGET giây -> dùng kết quả Gemini ("remote").
+- Quá ngân sách -> trả lời ngay bằng kết quả cục bộ ("local"); lời gọi Gemini KHÔNG bị hủy mà chạy
+  nốt trong nền để ghi cache, lần hỏi sau cùng triệu chứng sẽ trúng cache.
+- Không có kết quả cục bộ -> chờ Gemini như bình thường (vẫn bị giới hạn bởi deadline của client LLM).
+
+HedgeRecorder ghi path nào thắng và phân bố độ trễ của từng path (p50/p90/p99).
+"""
+import asyncio
+import os
+import threading
+import time as _time
+from collections import deque
+from typing import Any, Awaitable, Dict, Optional, Set, Tuple
+
+SPECIALTY_HEDGE_BUDGET = float(os.getenv('SPECIALTY_HEDGE_BUDGET', '0.8'))  # Giây
+HEDGE_LATENCY_SAMPLES = int(os.getenv('HEDGE_LATENCY_SAMPLES', '2000'))   # Số mẫu độ trễ giữ lại mỗi path
+
+
+def _percentile(sorted_values, q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+class HedgeRecorder:
+    def __init__(self, samples: int = HEDGE_LATENCY_SAMPLES):
+        self._lock = threading.Lock()
+        self._wins: Dict[str, int] = {}
+        self._latency: Dict[str, deque] = {}
+        self._samples = max(1, samples)
+
+    def win(self, path: str):
+        with self._lock:
+            self._wins[path] = self._wins.get(path, 0) + 1
+
+    def latency(self, path: str, ms: float):
+        with self._lock:
+            self._latency.setdefault(path, deque(maxlen=self._samples)).append(ms)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            wins = dict(self._wins)
+            samples = {path: sorted(values) for path, values in self._latency.items()}
+        latency = {
+            path: {"count": len(values), "p50_ms": round(_percentile(values, 0.5), 3),
+                   "p90_ms": round(_percentile(values, 0.9), 3), "p99_ms": round(_percentile(values, 0.99), 3)}
+            for path, values in samples.items() if values
+        }
+        return {"wins": wins, "latency": latency}
+
+
+# Giữ tham chiếu tới các lời gọi đang chạy nền để không bị GC giữa chừng
+_background: Set["asyncio.Future"] = set()
+
+
+async def hedge(remote: Awaitable, local: Any, budget: float = SPECIALTY_HEDGE_BUDGET,
+                recorder: Optional[HedgeRecorder] = None) -> Tuple[Any, str]:
+    """
+    Trả về (kết quả, path thắng). `remote` trả về None khi lỗi -> dùng `local`.
+    Path: "remote", "local" (hết ngân sách hoặc remote lỗi), "remote_only" (không có local để đua).
+    """
+    started = _time.perf_counter()
+    task = asyncio.ensure_future(remote)
+
+    def _record_remote(t: "asyncio.Future"):
+        _background.discard(t)
+        if recorder is not None and not t.cancelled() and t.exception() is None:
+            recorder.latency("remote", (_time.perf_counter() - started) * 1000)
+
+    task.add_done_callback(_record_remote)
+
+    if not local:
+        result = await task
+        path = "remote_only"
+    else:
+        done, _ = await asyncio.wait({task}, timeout=max(0.0, budget))
+        result = task.result() if done else None
+        if result is not None:
+            path = "remote"
+        else:
+            if not done:
+                _background.add(task)  # Chạy nốt trong nền (ghi cache), không hủy
+            result, path = local, "local"
+
+    if recorder is not None:
+        recorder.win(path)
+        recorder.latency(f"answer_{path}", (_time.perf_counter() - started) * 1000)
+    return result, path
+
+
+specialty_hedge = HedgeRecorder()
+
+
+def specialty_hedge_stats() -> Dict[str, Any]:
+    return specialty_hedge.stats()
@@ -0,0 +1,428 @@
+"""
+Template HTML cho các tin nhắn dạng bảng / thẻ (lịch bác sĩ, toa thuốc, danh sách bác sĩ / chuyên khoa, lịch hẹn).
+
+- Mỗi khối HTML là một hàm trả về f-string (đã viết sẵn dạng gọn, không khoảng trắng thừa giữa các thẻ).
+  Giá trị được escape bằng html.escape ngay tại chỗ chèn; các đoạn HTML đã render (dòng của bảng,
+  danh sách) được nối thẳng. Kết quả là Safe.
+- CSS tách khỏi HTML (tin nhắn chỉ dùng tên class), gom theo nhóm tin nhắn trong STYLESHEETS
+  (schedule / prescription / doctor / list / specialty / appointment / booking). Gửi kèm tin nhắn theo HTML_STYLESHEET_MODE:
+    session  (mặc định): CSS của một nhóm chỉ gửi ở tin nhắn đầu tiên của nhóm đó trong mỗi phiên hội thoại
+                         (sender_id + thời điểm session_started gần nhất, mở lại widget = phiên mới);
+    inline  : gửi kèm mọi tin nhắn (như trước đây);
+    external: không gửi, frontend tự nạp CSS (`python -m actions.html_templates > chat.css`).
+"""
+import html
+import os
+import re
+import threading
+import time as _time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+HTML_STYLESHEET_MODE = os.getenv('HTML_STYLESHEET_MODE', 'session')  # session / inline / external
+HTML_STYLESHEET_MAX_SESSIONS = int(os.getenv('HTML_STYLESHEET_MAX_SESSIONS', '20000'))
+HTML_STYLESHEET_TTL = float(os.getenv('HTML_STYLESHEET_TTL', '86400'))  # Giây nhớ một phiên đã nhận CSS
+
+_BETWEEN_TAGS = re.compile(r'>\s+<')
+_SPACES = re.compile(r'\s+')
+
+_escape = html.escape
+_needs_escape = re.compile(r'[&<>"\']').search
+
+
+def _minify(source: str) -> str:
+    return _SPACES.sub(' ', _BETWEEN_TAGS.sub('><', source)).strip()
+
+
+class Safe(str):
+    """Chuỗi HTML đã an toàn (đã escape / render từ template), chèn nguyên văn."""
+
+
+def _e(value: Any) -> str:
+    """Escape một giá trị trước khi chèn vào HTML (số, ngày, None... đổi sang str trước)."""
+    if value.__class__ is not str:
+        value = str(value)
+    # Đa số giá trị (tên, giờ, số) không có ký tự cần escape: một lần search rẻ hơn 5 lần replace
+    return _escape(value) if _needs_escape(value) else value
+
+
+# CSS theo nhóm tin nhắn: mỗi nhóm chỉ gửi một lần mỗi phiên, khi tin nhắn đầu tiên của nhóm xuất hiện
+STYLESHEETS: Dict[str, str] = {
+    "schedule": _minify("""
+.schedule-title { font-family: Arial, sans-serif; font-size: 15px; margin: 8px 0; }
+.schedule-table { width: 100%; max-width: 450px; border-collapse: collapse; font-family: Arial, sans-serif;
+    background: white; border-radius: 8px; overflow: hidden; box-shadow: 0 2px 5px rgba(0,0,0,0.1); }
+.schedule-table th, .schedule-table td { padding: 10px 12px; text-align: left; border-bottom: 1px solid #eee; }
+.schedule-table th { background-color: #f8faff; color: #007bff; font-size: 14px; }
+.schedule-table .date-cell { font-weight: bold; color: #333; font-size: 14px; width: 40%; }
+.schedule-table .shift-cell div { margin-bottom: 4px; }
+.status-ghi { color: #dc3545; font-weight: bold; font-style: italic; }
+.status-ok { color: #28a745; font-weight: bold; }
+.status-full { color: #6c757d; text-decoration: line-through; }
+.empty-schedule { text-align: center; color: #888; font-style: italic; padding: 20px; }
+"""),
+    "prescription": _minify("""
+.prescription-container { font-family: Arial, sans-serif; width: fit-content; min-width: 350px; margin: 10px 0;
+    border-radius: 8px; overflow: hidden; box-shadow: 0 2px 8px rgba(0,0,0,0.1); border: 1px solid #dee2e6; }
+.prescription-title { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white;
+    padding: 12px 16px; font-weight: bold; font-size: 16px; }
+.prescription-table { border-collapse: collapse; background: white; }
+.prescription-table thead { background: #f8f9fa; }
+.prescription-table th { padding: 12px 8px; text-align: left; font-weight: bold; color: #495057;
+    border-bottom: 2px solid #dee2e6; font-size: 14px; }
+.prescription-table td { padding: 10px 8px; border-bottom: 1px solid #e9ecef; font-size: 14px; color: #333; }
+.prescription-table tr:last-child td { border-bottom: none; }
+.prescription-table tr:hover { background: #f8f9fa; }
+.medicine-name { font-weight: 600; color: #667eea; }
+.dosage { color: #28a745; font-weight: 500; }
+.prescription-footer { background: #f8f9fa; padding: 10px 16px; font-size: 13px; color: #6c757d;
+    border-top: 2px solid #dee2e6; }
+@media screen and (max-width: 600px) {
+    .prescription-container { width: 100%; min-width: 0; }
+    .prescription-table th, .prescription-table td { font-size: 12px; padding: 8px 6px; }
+    .prescription-title { font-size: 14px; }
+}
+"""),
+    "doctor": _minify("""
+.doctor-card { font-family: Arial, sans-serif; border: 1px solid #cce0ff; border-radius: 10px; overflow: hidden;
+    margin-bottom: 15px; box-shadow: 0 2px 5px rgba(0,0,0,0.05); }
+.doctor-card-head { background-color: #e7f3ff; color: #0056b3; padding: 10px 15px; font-weight: bold;
+    border-bottom: 1px solid #cce0ff; }
+.doctor-card-body { padding: 10px 15px; background-color: #fff; }
+.doctor-item { border-bottom: 1px dashed #eee; padding-bottom: 8px; margin-bottom: 8px; }
+.doctor-item:last-child { border-bottom: none; padding-bottom: 0; margin-bottom: 0; }
+.doctor-name { font-weight: bold; color: #333; font-size: 15px; }
+.doctor-phone { color: #666; font-size: 14px; }
+"""),
+    "list": _minify("""
+.list-card { font-family: Arial, sans-serif; font-size: 15px; color: #333; background: #f8faff; border-radius: 10px;
+    padding: 10px; border: 1px solid #cce0ff; }
+.list-title { color: #007bff; font-weight: bold; margin-bottom: 8px; }
+.list-item { background: #ffffff; border-left: 3px solid #007bff; border-radius: 6px; padding: 6px 10px;
+    margin-bottom: 6px; }
+.list-item-name { font-weight: bold; color: #007bff; }
+.list-footer { margin-top: 6px; font-style: italic; }
+.list-summary { margin-top: 8px; font-size: 15px; color: #555; }
+.list-keyword { color: #dc3545; }
+"""),
+    "specialty": _minify("""
+.specialty-card { font-family: Arial, sans-serif; font-size: 15px; color: #333; background: #f0fdf4;
+    border-radius: 10px; padding: 12px; border: 1px solid #bbf7d0; }
+.specialty-title { color: #16a34a; font-weight: bold; margin-bottom: 8px; font-size: 16px; }
+.specialty-item { background: #ffffff; border-left: 4px solid #16a34a; border-radius: 6px; padding: 8px 12px;
+    margin-bottom: 8px; box-shadow: 0 1px 2px rgba(0,0,0,0.05); }
+.specialty-name { font-weight: bold; color: #15803d; }
+.specialty-desc { font-size: 13px; color: #555; }
+.specialty-footer { margin-top: 6px; font-style: italic; color: #666; }
+"""),
+    "appointment": _minify("""
+.appt-card { font-family: Arial, sans-serif; font-size: 15px; color: #333; background: #fffbef;
+    border-left: 5px solid #ffc107; border-radius: 8px; padding: 8px 10px; margin: 0 0 4px 0; }
+.appt-head { padding: 12px 16px; margin: 10px 0 4px 0; }
+.appt-title { font-weight: bold; color: #856404; margin-bottom: 8px; }
+.appt-footer { font-family: Arial, sans-serif; font-size: 14px; color: #333; margin-top: 4px; }
+.reexam-card { font-family: Arial, sans-serif; font-size: 15px; color: #333; background: #e3f2fd;
+    border-left: 5px solid #2196f3; border-radius: 8px; padding: 12px 16px; margin: 10px 0; }
+.reexam-title { font-weight: bold; color: #1976d2; margin-bottom: 8px; }
+.reexam-date { color: #d32f2f; font-weight: bold; }
+.reexam-card hr { border: 0; border-top: 1px solid #bbdefb; margin: 8px 0; }
+.reexam-prev { font-size: 14px; color: #555; }
+"""),
+    "booking": _minify("""
+.booking-note { font-family: Arial, sans-serif; border-left: 5px solid; border-radius: 8px; padding: 12px 16px; }
+.booking-note p { margin: 2px 0; }
+.booking-note .booking-head { font-weight: bold; margin: 0; }
+.booking-confirm { background: #d1ecf1; border-color: #0c5460; }
+.booking-confirm .booking-head { color: #0c5460; }
+.booking-warn { background: #fff3cd; border-color: #ffc107; }
+.booking-warn p { margin: 1em 0; }
+.booking-slots { background: #e7f3ff; border-color: #007bff; margin: 10px 0; }
+.booking-slots .booking-head { color: #007bff; margin: 0 0 8px 0; }
+.slot-list { display: flex; flex-wrap: wrap; gap: 8px; }
+.slot { background: white; border: 1px solid #007bff; color: #007bff; padding: 4px 8px; border-radius: 4px;
+    font-size: 14px; }
+.slot small { color: #666; }
+.booking-note .booking-hint { margin: 8px 0 0 0; font-size: 14px; }
+"""),
+}
+STYLESHEET = "".join(STYLESHEETS.values())
+STYLE_TAGS: Dict[str, Safe] = {name: Safe(f"<style>{css}</style>") for name, css in STYLESHEETS.items()}
+
+
+# ----------------------------------------------------------------------
+# Khối HTML
+# ----------------------------------------------------------------------
+_SCHEDULE_EMPTY_ROW = '<tr><td colspan="2" class="empty-schedule">Không có lịch làm việc trong tuần này.</td></tr>'
+_DOCTOR_LIST_FOOTER = '<div class="list-footer">👉 Vui lòng tiếp tục yêu cầu của bạn...</div>'
+_APPOINTMENTS_HEAD = (
+    '<div class="appt-card appt-head"><div class="appt-title">🔔 **Thông báo lịch hẹn sắp tới:**</div></div>'
+)
+_APPOINTMENTS_FOOTER = '<div class="appt-footer">👉 Vui lòng đến đúng giờ.</div>'
+
+
+def _status_class(status: str) -> str:
+    if status == "Nghỉ":
+        return "status-ghi"
+    return "status-full" if status in ("Đã đầy", "Hoàn thành") else "status-ok"
+
+
+def _shifts(shifts: Sequence[Tuple[str, str, Optional[str]]]) -> str:
+    return "".join([
+        f'<div>{_e(s)} - {_e(e)}</div>' if status is None
+        else f'<div>{_e(s)} - {_e(e)} <span class="{_status_class(status)}">({_e(status)})</span></div>'
+        for s, e, status in shifts
+    ])
+
+
+def render_week_schedule(ten_bs: str, start: str, end: str,
+                         days: Sequence[Tuple[str, Sequence[Tuple[str, str, Optional[str]]]]]) -> Safe:
+    """days: [(nhãn ngày, [(giờ bắt đầu, giờ kết thúc, trạng thái hoặc None)])]. Không có ngày -> dòng trống."""
+    rows = "".join([
+        f'<tr><td class="date-cell">{_e(day)}</td><td class="shift-cell">{_shifts(shifts)}</td></tr>'
+        for day, shifts in days
+    ]) or _SCHEDULE_EMPTY_ROW
+    return Safe(
+        f'<div class="schedule-title"> 📅 <strong>Lịch làm việc tuần này của Bác sĩ {_e(ten_bs)}</strong><br>'
+        f'(Từ {_e(start)} đến {_e(end)}) </div>'
+        '<table class="schedule-table"><thead><tr><th>Ngày</th><th>Ca làm việc</th></tr></thead>'
+        f'<tbody>{rows}</tbody></table>'
+    )
+
+
+def render_prescription_table(title: str, prescriptions: Sequence[Dict[str, Any]]) -> Safe:
+    rows = "".join([
+        f'<tr><td>{idx}</td><td class="medicine-name">{_e(med["tenThuoc"])}</td>'
+        f'<td class="dosage">{_e(med["lieuluong"])}</td><td>{_e(med["soluong"])}</td>'
+        f'<td>{_e(med["donvi"])}</td><td>{_e(med["thoigianSD"])}</td></tr>'
+        for idx, med in enumerate(prescriptions, 1)
+    ])
+    return Safe(
+        f'<div class="prescription-container"><div class="prescription-title">💊 {_e(title)}</div>'
+        '<table class="prescription-table"><thead><tr><th>STT</th><th>Tên thuốc</th><th>Liều lượng</th>'
+        '<th>Số lượng</th><th>Đơn vị</th><th>Thời gian SD</th></tr></thead>'
+        f'<tbody>{rows}</tbody></table>'
+        f'<div class="prescription-footer"><strong>Tổng số thuốc:</strong> {len(prescriptions)} loại | '
+        f'<strong>Mã lần khám:</strong> {_e(prescriptions[0]["maLanKham"])} </div></div>'
+    )
+
+
+def render_specialty_doctors(specialty: str, doctors: Sequence[Dict[str, Any]]) -> Safe:
+    items = "".join([
+        f'<div class="doctor-item"><div class="doctor-name">👨‍⚕️ BS {_e(doc["tenBS"])}</div>'
+        f'<div class="doctor-phone">📞 SĐT: {_e(doc["sdtBS"])}</div></div>'
+        for doc in doctors
+    ])
+    return Safe(
+        f'<div class="doctor-card"><div class="doctor-card-head">🏥 Danh sách bác sĩ {_e(specialty)}</div>'
+        f'<div class="doctor-card-body">{items}</div></div>'
+    )
+
+
+def _list_card(title: str, items: str, footer: str) -> Safe:
+    """Khung chung của các danh sách bác sĩ / lịch hẹn (nhóm CSS "list"); items / footer là HTML đã render."""
+    return Safe(f'<div class="list-card"><div class="list-title">{title}</div>{items}{footer}</div>')
+
+
+def _page_info(shown: int, total: Optional[int], first: int) -> str:
+    """"Bác sĩ 11–20 / 312" khi danh sách chỉ hiển thị một trang; cả danh sách -> rỗng."""
+    if total is None or total <= shown:
+        return ""
+    return f'<div class="list-summary">Bác sĩ {first}–{first + shown - 1} / {total}</div>'
+
+
+def render_all_doctors(doctors: Sequence[Dict[str, Any]], total: Optional[int] = None, first: int = 1) -> Safe:
+    """doctors: [{tenBS, chuyenkhoa}] (chuyenkhoa None -> "Chưa có"); total / first: khi doctors là một trang."""
+    items = "".join([
+        f'<div class="list-item"><div class="list-item-name">🩺 Bác sĩ {_e(doc["tenBS"])}</div>'
+        f'<div><strong>Chuyên khoa:</strong> {_e(doc["chuyenkhoa"] or "Chưa có")}</div></div>'
+        for doc in doctors
+    ])
+    total = len(doctors) if total is None else total
+    return _list_card(f"📋 Danh sách bác sĩ trong hệ thống (Tổng: {total}):", items,
+                      _page_info(len(doctors), total, first) + _DOCTOR_LIST_FOOTER)
+
+
+def render_specialty_doctor_contacts(specialty: str, doctors: Sequence[Dict[str, Any]],
+                                     total: Optional[int] = None, first: int = 1) -> Safe:
+    """doctors: [{tenBS, sdtBS, emailBS}] của một chuyên khoa (hoặc một trang)."""
+    items = "".join([
+        f'<div class="list-item"><div class="list-item-name">🩺 Bác sĩ {_e(doc["tenBS"])}</div>'
+        f'<div>📞 <strong>SĐT:</strong> {_e(doc["sdtBS"])}</div>'
+        f'<div>✉️ <strong>Email:</strong> {_e(doc.get("emailBS", "Chưa có"))}</div></div>'
+        for doc in doctors
+    ])
+    total = len(doctors) if total is None else total
+    return _list_card(f"📋 Danh sách bác sĩ chuyên khoa {_e(specialty)}:", items,
+                      _page_info(len(doctors), total, first)
+                      + f'<div class="list-summary">Tổng cộng: <strong>{total}</strong> bác sĩ<br>'
+                        '👉 Tiếp tục đặt lịch...</div>')
+
+
+def render_all_specialties(specialties: Sequence[Dict[str, Any]]) -> Safe:
+    """specialties: [{tenCK, mota}] (mô tả đã rút gọn)."""
+    items = "".join([
+        f'<div class="specialty-item"><div class="specialty-name">🩺 {_e(spec["tenCK"])}</div>'
+        f'<div class="specialty-desc">{_e(spec["mota"])}</div></div>'
+        for spec in specialties
+    ])
+    return Safe(
+        '<div class="specialty-card"><div class="specialty-title">🏥 Danh sách các chuyên khoa hiện có:</div>'
+        f'{items}<div class="specialty-footer">👉 Vui lòng tiếp tục yêu cầu của bạn...</div></div>'
+    )
+
+
+def render_doctor_search(keyword: str, doctors: Sequence[Dict[str, Any]], total: Optional[int] = None,
+                         first: int = 1, shown: Optional[int] = None) -> Safe:
+    """
+    doctors: [{tenBS, tenCK, sdtBS}] khớp từ khóa (một dòng mỗi cặp bác sĩ - chuyên khoa), cả danh sách
+    trong một khối. total / first / shown: số bác sĩ khớp, vị trí và số bác sĩ của trang đang hiển thị.
+    """
+    total = len(doctors) if total is None else total
+    items = "".join([
+        f'<div class="list-item"><div class="list-item-name">🩺 Bác sĩ {_e(doc["tenBS"])}</div>'
+        f'<div><strong>Chuyên khoa:</strong> {_e(doc["tenCK"])}</div>'
+        f'<div><strong>SĐT:</strong> {_e(doc["sdtBS"])}</div></div>'
+        for doc in doctors
+    ])
+    return _list_card(f'🔍 Tìm thấy {total} bác sĩ phù hợp với từ khóa '
+                      f'"<span class="list-keyword">{_e(keyword)}</span>":',
+                      items, _page_info(len(doctors) if shown is None else shown, total, first))
+
+
+def render_appointment_choices(date_label: str, appointments: Sequence[Dict[str, Any]]) -> Safe:
+    """Các lịch hẹn trong một ngày để chọn lịch cần hủy (đánh số như nút chọn đi kèm)."""
+    items = "".join([
+        f'<div class="list-item"><div class="list-item-name">{idx}. 🩺 Bác sĩ {_e(appt["tenBS"])} '
+        f'({_e(appt["tenCK"])})</div><div>Giờ: {_e(appt["khunggio"])}</div>'
+        f'<div>Mã lịch: {_e(appt["mahen"])}</div><div>Mô tả: {_e(appt["mota"])}</div></div>'
+        for idx, appt in enumerate(appointments, 1)
+    ])
+    return _list_card(f"📋 Danh sách lịch hẹn ngày {_e(date_label)}:", items,
+                      f'<div class="list-summary">Tổng cộng: <strong>{len(appointments)}</strong> lịch hẹn. '
+                      'Vui lòng chọn lịch cần hủy.</div>')
+
+
+def render_upcoming_appointments(appointments: Sequence[Dict[str, Any]]) -> Safe:
+    """appointments: [{day, time, tenBS, tenCK, mahen, mota}] (ngày / giờ đã định dạng); tiêu đề + từng lịch + footer."""
+    items = "".join([
+        f'<div class="appt-card"><div><strong>Ngày:</strong> {_e(appt["day"])}</div>'
+        f'<div><strong>Giờ:</strong> {_e(appt["time"])}</div>'
+        f'<div><strong>Bác sĩ:</strong> {_e(appt["tenBS"])} ({_e(appt["tenCK"])})</div>'
+        f'<div><strong>Mã hẹn:</strong> {_e(appt["mahen"])}</div>'
+        f'<div><strong>Mô tả:</strong> {_e(appt["mota"])}</div></div>'
+        for appt in appointments
+    ])
+    return Safe(_APPOINTMENTS_HEAD + items + _APPOINTMENTS_FOOTER)
+
+
+def render_reexamination(date: str, previous_date: str, ten_bs: str, ten_ck: str,
+                         diagnosis: Any, note: Any) -> Safe:
+    """Thông báo tái khám + tóm tắt lần khám trước (ngày đã định dạng)."""
+    return Safe(
+        '<div class="reexam-card"><div class="reexam-title">🩺 Thông báo tái khám:</div>'
+        f'<div><strong>📅 Ngày hẹn tái khám:</strong> <span class="reexam-date">{_e(date)}</span></div><hr>'
+        f'<div class="reexam-prev"><em>Thông tin lần khám trước ({_e(previous_date)}):</em><br>'
+        f'- <strong>Bác sĩ:</strong> {_e(ten_bs)} ({_e(ten_ck)})<br>'
+        f'- <strong>Chẩn đoán:</strong> {_e(diagnosis)}<br>'
+        f'- <strong>Lời dặn:</strong> {_e(note)}</div></div>'
+    )
+
+
+# Các ghi chú trong form đặt lịch (nhóm CSS "booking")
+def render_doctor_confirmation(ten_bs: str, ten_ck: str, auto_selected: bool = False) -> Safe:
+    """Xác nhận bác sĩ (và chuyên khoa, `auto_selected`: chuyên khoa duy nhất được chọn tự động)."""
+    return Safe(
+        '<div class="booking-note booking-confirm"><p class="booking-head">✅ Xác nhận bác sĩ:</p>'
+        f'<p><strong>👨‍⚕️ {_e(ten_bs)}</strong></p>'
+        f'<p>🏥 {"Tự động chọn: " if auto_selected else ""}{_e(ten_ck)}</p></div>'
+    )
+
+
+def render_doctor_specialty_choice(ten_bs: str, specialties: Iterable[str]) -> Safe:
+    """Bác sĩ làm ở nhiều chuyên khoa: xác nhận tên, yêu cầu chọn chuyên khoa."""
+    return Safe(
+        f'<div class="booking-note booking-warn"><p class="booking-head">✅ Xác nhận: 👨‍⚕️ {_e(ten_bs)}</p>'
+        f'<p>⚠️ Bác sĩ làm nhiều khoa: <i>{_e(", ".join(specialties))}</i></p>'
+        '<p>👉 Vui lòng chọn chuyên khoa.</p></div>'
+    )
+
+
+def render_day_slots(date_label: str, slots: Sequence[Tuple[str, str, str]]) -> Safe:
+    """slots: [(giờ bắt đầu, giờ kết thúc, trạng thái)] của bác sĩ trong một ngày."""
+    items = "".join([
+        f'<span class="slot">{_e(s)} - {_e(e)} <small>({_e(status)})</small></span>' for s, e, status in slots
+    ])
+    return Safe(
+        f'<div class="booking-note booking-slots"><p class="booking-head">✅ Các khung giờ ngày {_e(date_label)}:</p>'
+        f'<div class="slot-list">{items}</div><p class="booking-hint">👉 Vui lòng nhập giờ (HH:MM).</p></div>'
+    )
+
+
+# ----------------------------------------------------------------------
+# Stylesheet theo phiên
+# ----------------------------------------------------------------------
+def session_key(tracker) -> Tuple[str, Any]:
+    """(sender_id, timestamp của session_started gần nhất): mở lại widget / hết phiên -> khóa mới."""
+    started = None
+    for event in reversed(getattr(tracker, "events", None) or []):
+        if event.get("event") == "session_started":
+            started = event.get("timestamp")
+            break
+    return tracker.sender_id, started
+
+
+class StylesheetTracker:
+    def __init__(self, mode: str = HTML_STYLESHEET_MODE, max_sessions: int = HTML_STYLESHEET_MAX_SESSIONS,
+                 ttl: float = HTML_STYLESHEET_TTL):
+        self.mode = mode
+        self.max_sessions = max(1, max_sessions)
+        self.ttl = ttl
+        self._sent: "OrderedDict[Tuple[str, Any, str], float]" = OrderedDict()  # (sender, phiên, nhóm CSS)
+        self._lock = threading.Lock()
+        self._stats = {"messages": 0, "stylesheet_sent": 0, "stylesheet_skipped": 0, "bytes_sent": 0}
+
+    def _needs_stylesheet(self, key) -> bool:
+        if self.mode == "inline":
+            return True
+        if self.mode == "external":
+            return False
+        now = _time.monotonic()
+        with self._lock:
+            sent_at = self._sent.get(key)
+            if sent_at is not None and now - sent_at <= self.ttl:
+                self._sent.move_to_end(key)
+                return False
+            self._sent[key] = now
+            self._sent.move_to_end(key)
+            while len(self._sent) > self.max_sessions:
+                self._sent.popitem(last=False)
+            return True
+
+    def wrap(self, tracker, body: str, sheet: str) -> str:
+        """Gắn <style> của nhóm `sheet` vào đầu tin nhắn nếu phiên này chưa nhận CSS của nhóm đó."""
+        send = self._needs_stylesheet(session_key(tracker) + (sheet,))
+        message = STYLE_TAGS[sheet] + body if send else body
+        with self._lock:
+            self._stats["messages"] += 1
+            self._stats["stylesheet_sent" if send else "stylesheet_skipped"] += 1
+            self._stats["bytes_sent"] += len(message.encode("utf-8"))
+        return message
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            data = dict(self._stats)
+            data["tracked_sessions"] = len(self._sent)
+        data["mode"] = self.mode
+        data["stylesheet_bytes"] = {name: len(tag.encode("utf-8")) for name, tag in STYLE_TAGS.items()}
+        return data
+
+
+stylesheets = StylesheetTracker()
+
+
+def html_template_stats() -> Dict[str, Any]:
+    return stylesheets.stats()
+
+
+if __name__ == "__main__":
+    print(STYLESHEET)
@@ -0,0 +1,78 @@
+"""
+Cấp mã tuần tự (vd. mahen = LH00000123) không cần quét bảng và không trùng
+giữa nhiều action server.
+
+Mỗi tiến trình giữ trước một block mã bằng MỘT câu UPDATE nguyên tử trên
+bảng id_sequences (xem migrations/002_id_sequences.sql), rồi cấp dần trong
+bộ nhớ. Mã chưa dùng của block sẽ bị bỏ qua khi tiến trình dừng (chấp nhận
+mã có khoảng trống, nhưng không bao giờ trùng).
+"""
+import os
+import threading
+from typing import Optional
+
+from mysql.connector import errors
+
+from .db import run_in_connection
+
+ID_BLOCK_SIZE = int(os.getenv('ID_BLOCK_SIZE', '20'))
+
+
+class SequenceIdAllocator:
+    def __init__(self, sequence: str, prefix: str, width: int, block_size: int = ID_BLOCK_SIZE,
+                 seed_query: Optional[str] = None):
+        self.sequence = sequence
+        self.prefix = prefix
+        self.width = width
+        self.block_size = max(1, block_size)
+        self.seed_query = seed_query  # Trả về giá trị khởi đầu nếu sequence chưa có dòng
+
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0  # exclusive
+
+    def _reserve_block(self, conn):
+        cursor = conn.cursor(buffered=True)
+        try:
+            for _ in range(2):
+                # UPDATE ... LAST_INSERT_ID(expr): đọc-và-tăng nguyên tử, khóa dòng chỉ trong 1 câu lệnh
+                cursor.execute(
+                    "UPDATE id_sequences SET next_value = LAST_INSERT_ID(next_value + %s) WHERE name = %s",
+                    (self.block_size, self.sequence),
+                )
+                if cursor.rowcount == 1:
+                    cursor.execute("SELECT LAST_INSERT_ID()")
+                    block_end = int(cursor.fetchone()[0])
+                    conn.commit()
+                    return block_end - self.block_size, block_end
+
+                if not self.seed_query:
+                    break
+                # Sequence chưa được khởi tạo -> seed từ dữ liệu hiện có rồi thử lại
+                cursor.execute(
+                    f"INSERT IGNORE INTO id_sequences (name, next_value) SELECT %s, ({self.seed_query})",
+                    (self.sequence,),
+                )
+                conn.commit()
+        finally:
+            cursor.close()
+        raise errors.ProgrammingError(f"Sequence '{self.sequence}' chưa được khởi tạo trong id_sequences.")
+
+    def next_value(self) -> int:
+        """Số tiếp theo (đồng bộ, thread-safe; chỉ chạm DB khi hết block)."""
+        with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = run_in_connection(self._reserve_block)
+            value = self._next
+            self._next += 1
+            return value
+
+    def next_id(self) -> str:
+        return f"{self.prefix}{self.next_value():0{self.width}d}"
+
+
+# Mã lịch hẹn: LH%08d
+appointment_ids = SequenceIdAllocator(
+    "lichhen", prefix="LH", width=8,
+    seed_query="SELECT COALESCE(MAX(CAST(SUBSTRING(mahen, 3) AS UNSIGNED)), 0) + 1 FROM lichhen",
+)
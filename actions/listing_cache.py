@@ -0,0 +1,117 @@
+"""
+Cache fragment đã render sẵn cho các danh sách tĩnh: tất cả chuyên khoa (ActionListAllSpecialties)
+và tất cả bác sĩ (ActionListAllDoctors).
+
+- Nội dung chỉ phụ thuộc bacsi / chuyenkhoa / chuyenmon -> khóa theo ReferenceSnapshot.content_version
+  (hash nội dung, giữ nguyên qua các lần refresh TTL nếu dữ liệu không đổi).
+- Mỗi danh sách giữ cả bản HTML (chưa kèm <style>; stylesheets.wrap gắn CSS theo phiên), payload JSON và
+  nút chuyển trang. Danh sách bác sĩ được phân trang (pagination.py): chỉ TRANG ĐẦU được render sẵn,
+  các trang sau render khi được bấm (all_doctors_page).
+- Render trước mỗi khi reference_cache nạp xong snapshot mới (khởi động: warm_up_reference_data;
+  sau invalidate_reference_data: nạp lại ở nền); action chỉ đọc từ bộ nhớ. Snapshot có version
+  chưa render (listener chưa chạy xong) -> render ngay trong request rồi dùng lại.
+"""
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from .html_templates import Safe, render_all_doctors, render_all_specialties
+from .pagination import keyset_page, page_buttons
+from .payloads import doctor_list_payload, specialty_list_payload
+from .refdata import ReferenceSnapshot, reference_cache
+
+SPECIALTY_DESC_MAX = 60  # Ký tự mô tả hiển thị trong danh sách chuyên khoa
+
+
+class Listing(NamedTuple):
+    html: Safe
+    payload: Dict[str, Any]
+    count: int
+    buttons: List[Dict[str, str]] = []
+
+
+def _all_specialties(snapshot: ReferenceSnapshot) -> Optional[Listing]:
+    specialties = []
+    for spec in snapshot.sorted_specialties():
+        desc = spec['mota'] if spec['mota'] else "Chuyên điều trị các bệnh lý liên quan."
+        # Cắt ngắn mô tả nếu quá dài
+        if len(desc) > SPECIALTY_DESC_MAX:
+            desc = desc[:SPECIALTY_DESC_MAX] + "..."
+        specialties.append({'tenCK': spec['tenCK'], 'mota': desc})
+    if not specialties:
+        return None
+    return Listing(render_all_specialties(specialties),
+                   specialty_list_payload("Danh sách các chuyên khoa hiện có", specialties), len(specialties))
+
+
+def all_doctors_page(snapshot: ReferenceSnapshot, cursor: Optional[str] = None) -> Optional[Listing]:
+    """Một trang bác sĩ đang làm việc, GOM NHÓM chuyên khoa (tương đương GROUP_CONCAT) chỉ cho các dòng của trang."""
+    page = keyset_page(snapshot.active_doctor_keys, cursor, snapshot.doctor_key)
+    doctors = [
+        {
+            'tenBS': ten_bs,
+            'chuyenkhoa': ", ".join(dict.fromkeys(snapshot.specialty_names_of(ma_bs))) or None,
+        }
+        for ten_bs, ma_bs in page.keys
+    ]
+    if not doctors:
+        return None
+    buttons = page_buttons(page, "list_all_doctors")
+    return Listing(render_all_doctors(doctors, page.total, page.start + 1),
+                   doctor_list_payload("Danh sách bác sĩ trong hệ thống", doctors, ["tenBS", "chuyenkhoa"],
+                                       page=page.info(), pager=buttons),
+                   len(doctors), buttons)
+
+
+LISTINGS: Dict[str, Callable[[ReferenceSnapshot], Optional[Listing]]] = {
+    "all_specialties": _all_specialties,
+    "all_doctors": all_doctors_page,
+}
+
+
+class ListingCache:
+    """Giữ fragment của MỘT content_version (version cũ bị thay khi dữ liệu đổi)."""
+
+    def __init__(self, builders: Dict[str, Callable[[ReferenceSnapshot], Optional[Listing]]] = LISTINGS):
+        self.builders = builders
+        self._version: Optional[str] = None
+        self._fragments: Dict[str, Optional[Listing]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "prerenders": 0}
+
+    def prerender(self, snapshot: ReferenceSnapshot):
+        """Render toàn bộ danh sách cho snapshot (bỏ qua nếu version này đã có)."""
+        if self._version == snapshot.content_version:
+            return
+        fragments = {name: build(snapshot) for name, build in self.builders.items()}
+        with self._lock:
+            self._version, self._fragments = snapshot.content_version, fragments
+            self._stats["prerenders"] += 1
+
+    def get(self, snapshot: ReferenceSnapshot, name: str) -> Optional[Listing]:
+        """Fragment của danh sách `name` cho snapshot; None nếu danh sách rỗng."""
+        with self._lock:
+            if self._version == snapshot.content_version:
+                self._stats["hits"] += 1
+                return self._fragments[name]
+            self._stats["misses"] += 1
+        self.prerender(snapshot)
+        with self._lock:
+            if self._version == snapshot.content_version:
+                return self._fragments[name]
+        return self.builders[name](snapshot)  # Snapshot mới hơn vừa thay chỗ: render riêng cho request này
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            data = dict(self._stats)
+            data["version"] = self._version
+            data["bytes"] = {name: len(frag.html.encode("utf-8")) if frag else 0
+                             for name, frag in self._fragments.items()}
+        return data
+
+
+listing_cache = ListingCache()
+reference_cache.add_listener(listing_cache.prerender)
+
+
+def listing_cache_stats() -> Dict[str, Any]:
+    return listing_cache.stats()
@@ -0,0 +1,195 @@
+"""
+Kiểm soát lượt gọi LLM (admission control) trước khi request lên Gemini.
+
+- Giới hạn theo sender_id: token bucket LLM_SENDER_BURST lượt, nạp lại LLM_SENDER_RATE lượt/phút.
+- Ngân sách ngày (theo giờ địa phương, reset lúc 0h): LLM_DAILY_CALL_BUDGET lượt gọi upstream
+  và LLM_DAILY_TOKEN_BUDGET token ước lượng (≈ số ký tự / LLM_CHARS_PER_TOKEN). 0 = không giới hạn.
+- Hàng chờ có giới hạn: tối đa LLM_MAX_CONCURRENCY request đang chạy, LLM_QUEUE_MAX lần gọi chờ slot,
+  mỗi lần chờ tối đa LLM_QUEUE_TIMEOUT giây.
+
+Vượt giới hạn -> AdmissionRejected ngay (LLMClient chuyển thành LLMRejectedError), action hạ cấp về gợi ý cục bộ.
+Bộ đếm admitted / queued / shed (theo lý do) lấy qua stats(). Ngân sách tính theo tiến trình action server.
+"""
+import asyncio
+import os
+import threading
+import time as _time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, Optional
+
+LLM_SENDER_RATE = float(os.getenv('LLM_SENDER_RATE', '6'))              # Lượt / phút / sender
+LLM_SENDER_BURST = int(os.getenv('LLM_SENDER_BURST', '3'))              # Lượt dồn tối đa / sender
+LLM_SENDER_MAX_TRACKED = int(os.getenv('LLM_SENDER_MAX_TRACKED', '10000'))
+LLM_DAILY_CALL_BUDGET = int(os.getenv('LLM_DAILY_CALL_BUDGET', '2000'))
+LLM_DAILY_TOKEN_BUDGET = int(os.getenv('LLM_DAILY_TOKEN_BUDGET', '2000000'))
+LLM_CHARS_PER_TOKEN = float(os.getenv('LLM_CHARS_PER_TOKEN', '3'))     # Tiếng Việt có dấu ~3 ký tự / token
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv('LLM_EXPECTED_OUTPUT_TOKENS', '256'))
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))       # Số request đồng thời tối đa lên Gemini
+LLM_QUEUE_MAX = int(os.getenv('LLM_QUEUE_MAX', '32'))                  # Số lần gọi được chờ slot
+LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', '3'))         # Giây chờ slot tối đa
+
+
+class AdmissionRejected(Exception):
+    """Lượt gọi bị từ chối trước khi gửi lên upstream. reason: sender_rate / daily_calls / daily_tokens / queue_full / queue_timeout."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, int(len(text or "") / LLM_CHARS_PER_TOKEN))
+
+
+class AdmissionController:
+    def __init__(self, sender_rate: float = LLM_SENDER_RATE, sender_burst: int = LLM_SENDER_BURST,
+                 daily_calls: int = LLM_DAILY_CALL_BUDGET, daily_tokens: int = LLM_DAILY_TOKEN_BUDGET,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, queue_max: int = LLM_QUEUE_MAX,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT, max_senders: int = LLM_SENDER_MAX_TRACKED,
+                 clock=_time.monotonic, today=date.today):
+        self.sender_rate = sender_rate / 60.0  # lượt / giây
+        self.sender_burst = max(1, sender_burst)
+        self.daily_calls = daily_calls
+        self.daily_tokens = daily_tokens
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_max = max(0, queue_max)
+        self.queue_timeout = queue_timeout
+        self.max_senders = max(1, max_senders)
+        self._clock = clock
+        self._today = today
+        self._lock = threading.Lock()
+
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # sender_id -> [tokens, last_refill]
+        self._day = today()
+        self._calls_today = 0
+        self._tokens_today = 0
+
+        # Slot + hàng chờ gắn với event loop đang chạy
+        self._loop = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self._active = 0
+        self._peak_active = 0
+
+        self._stats = {"admitted": 0, "queued": 0, "shed": 0}
+        self._shed_by_reason: Dict[str, int] = {}
+
+    # ------------------------------------------------------------------
+    def _shed(self, reason: str, message: str) -> AdmissionRejected:
+        with self._lock:
+            self._stats["shed"] += 1
+            self._shed_by_reason[reason] = self._shed_by_reason.get(reason, 0) + 1
+        return AdmissionRejected(reason, message)
+
+    def check_sender(self, sender_id: Optional[str]):
+        """Trừ 1 lượt của sender (token bucket). sender_id None (job nền) không bị giới hạn."""
+        if not sender_id or self.sender_rate <= 0:
+            return
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(sender_id)
+            if bucket is None:
+                bucket = [float(self.sender_burst), now]
+                self._buckets[sender_id] = bucket
+                while len(self._buckets) > self.max_senders:
+                    self._buckets.popitem(last=False)
+            else:
+                bucket[0] = min(self.sender_burst, bucket[0] + (now - bucket[1]) * self.sender_rate)
+                bucket[1] = now
+            self._buckets.move_to_end(sender_id)
+            allowed = bucket[0] >= 1.0
+            if allowed:
+                bucket[0] -= 1.0
+        if not allowed:
+            raise self._shed("sender_rate", f"Sender {sender_id} vượt {self.sender_rate * 60:g} lượt gọi LLM/phút")
+
+    def _roll_day(self):
+        # Gọi khi đang giữ self._lock
+        today = self._today()
+        if today != self._day:
+            self._day, self._calls_today, self._tokens_today = today, 0, 0
+
+    def reserve_budget(self, prompt: str) -> int:
+        """Giữ chỗ 1 lượt gọi + token ước lượng trong ngân sách ngày; trả về số token đã giữ."""
+        tokens = estimate_tokens(prompt) + LLM_EXPECTED_OUTPUT_TOKENS
+        with self._lock:
+            self._roll_day()
+            over_calls = self.daily_calls and self._calls_today >= self.daily_calls
+            over_tokens = self.daily_tokens and self._tokens_today + tokens > self.daily_tokens
+            if not over_calls and not over_tokens:
+                self._calls_today += 1
+                self._tokens_today += tokens
+                self._stats["admitted"] += 1  # Cửa cuối cùng: đã có slot và còn ngân sách
+        if over_calls:
+            raise self._shed("daily_calls", f"Hết ngân sách {self.daily_calls} lượt gọi LLM hôm nay")
+        if over_tokens:
+            raise self._shed("daily_tokens", f"Hết ngân sách {self.daily_tokens} token LLM hôm nay")
+        return tokens
+
+    def refund(self, reserved: int):
+        """Trả lại phần đã giữ khi lượt gọi không được gửi đi."""
+        with self._lock:
+            self._roll_day()
+            self._calls_today = max(0, self._calls_today - 1)
+            self._tokens_today = max(0, self._tokens_today - reserved)
+
+    def settle(self, reserved: int, prompt: str, output: Optional[str], used: Optional[int] = None):
+        """
+        Điều chỉnh token đã giữ theo thực tế: `used` (số token upstream báo về) nếu có,
+        không thì ước lượng từ độ dài câu trả lời (output None = lỗi, vẫn tính prompt).
+        """
+        if used is None:
+            used = estimate_tokens(prompt) + (estimate_tokens(output) if output else 0)
+        with self._lock:
+            self._roll_day()
+            self._tokens_today = max(0, self._tokens_today + used - reserved)
+
+    # ------------------------------------------------------------------
+    def _bind_loop(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._waiting = 0
+        return self._semaphore
+
+    async def acquire_slot(self, timeout: float):
+        """Lấy 1 slot gọi upstream; chờ trong hàng có giới hạn, tối đa min(timeout, queue_timeout) giây."""
+        semaphore = self._bind_loop()
+        if not semaphore.locked():
+            await semaphore.acquire()  # Còn slot: lấy ngay, không nhường event loop
+        else:
+            if self._waiting >= self.queue_max:
+                raise self._shed("queue_full", f"Hàng chờ gọi LLM đầy ({self.queue_max})")
+            self._waiting += 1
+            with self._lock:
+                self._stats["queued"] += 1
+            wait = min(timeout, self.queue_timeout)
+            try:
+                await asyncio.wait_for(semaphore.acquire(), max(0.0, wait))
+            except asyncio.TimeoutError:
+                raise self._shed("queue_timeout", f"Chờ slot gọi LLM quá {wait:.1f}s") from None
+            finally:
+                self._waiting -= 1
+        with self._lock:
+            self._active += 1
+            self._peak_active = max(self._peak_active, self._active)
+
+    def release_slot(self):
+        with self._lock:
+            self._active -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._roll_day()
+            data = dict(self._stats)
+            data["shed_by_reason"] = dict(self._shed_by_reason)
+            data["waiting"] = self._waiting
+            data["active"] = self._active
+            data["peak_active"] = self._peak_active
+            data["calls_today"] = self._calls_today
+            data["tokens_today"] = self._tokens_today
+            data["tracked_senders"] = len(self._buckets)
+        return data
@@ -0,0 +1,143 @@
+"""
+Cache kết quả "triệu chứng -> danh sách chuyên khoa" đứng trước Gemini.
+
+Khóa = câu triệu chứng đã chuẩn hóa + version của danh sách chuyên khoa
+(ReferenceSnapshot.specialty_list_version), nên thêm / đổi tên chuyên khoa
+thì kết quả cũ tự động không còn được dùng.
+
+- Tầng 1: LRU trong bộ nhớ (LLM_CACHE_MEMORY_SIZE mục).
+- Tầng 2: SQLite trên đĩa (LLM_CACHE_PATH), giữ qua các lần khởi động lại.
+- Cả hai tầng hết hạn sau LLM_CACHE_TTL giây; stats() trả về hit rate từng tầng.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time as _time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', os.path.join('.cache', 'llm_cache.sqlite3'))
+LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 3600)))  # Giây
+LLM_CACHE_MEMORY_SIZE = int(os.getenv('LLM_CACHE_MEMORY_SIZE', '1000'))
+
+
+def normalize_symptom(text: str) -> str:
+    """
+    'Đau  bụng!!' -> 'đau bụng'. GIỮ dấu tiếng Việt (bỏ dấu dễ gộp nhầm từ khác nghĩa),
+    chỉ chuẩn hóa Unicode, chữ thường, bỏ dấu câu và khoảng trắng thừa.
+    """
+    text = unicodedata.normalize("NFC", str(text or "")).lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class LLMResultCache:
+    def __init__(self, path: Optional[str] = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL,
+                 memory_size: int = LLM_CACHE_MEMORY_SIZE, namespace: str = "symptom_specialty"):
+        self.ttl = ttl
+        self.memory_size = max(1, memory_size)
+        self.namespace = namespace
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (created_at, value)
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "disk_errors": 0}
+
+        self._db = None
+        if path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache ("
+                    " key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"[WARN] Không mở được cache LLM trên đĩa ({path}), chỉ dùng bộ nhớ: {e}")
+                self._db = None
+
+    def make_key(self, text: str, version: str) -> str:
+        raw = f"{self.namespace}|{version}|{normalize_symptom(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, created_at: float, value: Any):
+        # Gọi khi đang giữ self._lock
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, text: str, version: str) -> Optional[List[str]]:
+        key = self.make_key(text, version)
+        now = _time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return list(entry[1])
+
+            row = None
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT value, created_at FROM llm_cache WHERE key = ? AND created_at > ?",
+                        (key, now - self.ttl),
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    self._stats["disk_errors"] += 1
+                    print(f"[WARN] Lỗi đọc cache LLM: {e}")
+            if row:
+                value = json.loads(row[0])
+                self._remember(key, row[1], value)
+                self._stats["disk_hits"] += 1
+                return list(value)
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, text: str, version: str, value: List[str]):
+        key = self.make_key(text, version)
+        now = _time.time()
+        with self._lock:
+            self._remember(key, now, list(value))
+            self._stats["writes"] += 1
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(value, ensure_ascii=False), now),
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    self._stats["disk_errors"] += 1
+                    print(f"[WARN] Lỗi ghi cache LLM: {e}")
+
+    def purge_expired(self) -> int:
+        """Xóa các mục hết hạn trên đĩa, trả về số dòng đã xóa."""
+        if self._db is None:
+            return 0
+        with self._lock:
+            cur = self._db.execute("DELETE FROM llm_cache WHERE created_at <= ?", (_time.time() - self.ttl,))
+            self._db.commit()
+            return cur.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            data = dict(self._stats)
+            data["memory_entries"] = len(self._memory)
+        lookups = data["memory_hits"] + data["disk_hits"] + data["misses"]
+        hits = data["memory_hits"] + data["disk_hits"]
+        data["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        data["memory_hit_rate"] = round(data["memory_hits"] / lookups, 4) if lookups else 0.0
+        return data
+
+
+symptom_specialty_cache = LLMResultCache()
+
+
+def llm_cache_stats() -> Dict[str, Any]:
+    return symptom_specialty_cache.stats()
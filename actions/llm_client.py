@@ -0,0 +1,405 @@
+"""
+Client bất đồng bộ cho Gemini dùng chung bởi các action.
+
+Mỗi lần gọi generate():
+- mỗi lượt thử bị giới hạn LLM_TIMEOUT giây, toàn bộ lần gọi (kể cả retry) bị giới hạn LLM_DEADLINE giây;
+- lỗi tạm thời (timeout, 429, 5xx, lỗi mạng) được thử lại tối đa LLM_MAX_RETRIES lần,
+  backoff lũy thừa có jitter, không vượt quá deadline còn lại;
+- sau LLM_BREAKER_THRESHOLD lượt thử lỗi liên tiếp, circuit breaker mở: các lần gọi tiếp theo
+  ném CircuitOpenError ngay (action dùng fallback "Nội khoa") cho tới khi hết LLM_BREAKER_RESET giây,
+  lúc đó một lượt thử "half-open" quyết định đóng lại hay mở tiếp.
+
+Client sống suốt tiến trình (gemini_client) và dùng lại một model handle. Các lần gọi đồng thời với
+CÙNG prompt được gộp (single-flight): chỉ một request lên Gemini, mọi người chờ dùng chung kết quả.
+Trước mỗi lượt gọi upstream là admission control (actions/llm_admission.py): quota theo sender_id,
+ngân sách lượt gọi / token trong ngày, và hàng chờ có giới hạn cho LLM_MAX_CONCURRENCY slot đồng thời.
+Bị từ chối -> LLMRejectedError ngay, không chờ.
+Mỗi lượt thử lên upstream được ghi token prompt / câu trả lời (usageMetadata của Gemini, thiếu thì ước lượng)
+và độ trễ theo `purpose` vào actions/llm_usage.py.
+
+Backend mặc định gọi SDK google.generativeai (generate_content_async). Đặt GEMINI_API_BASE để gọi
+REST API :generateContent tại địa chỉ khác (proxy, hoặc stub server trong benchmarks/stress_llm_client.py).
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time as _time
+import urllib.error
+import urllib.request
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Union
+
+from .llm_admission import LLM_MAX_CONCURRENCY, AdmissionController, AdmissionRejected, estimate_tokens
+from .llm_usage import UsageMeter, llm_usage
+
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'models/gemini-flash-latest')
+GEMINI_API_BASE = os.getenv('GEMINI_API_BASE')  # Ví dụ: http://127.0.0.1:8089 ; trống = dùng SDK
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '8'))                     # Giây tối đa cho 1 lượt thử
+LLM_DEADLINE = float(os.getenv('LLM_DEADLINE', '15'))                  # Giây tối đa cho cả lần gọi
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))               # Số lần thử lại sau lượt đầu
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '0.5'))         # Giây
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', '4'))             # Giây
+LLM_BREAKER_THRESHOLD = int(os.getenv('LLM_BREAKER_THRESHOLD', '5'))   # Lượt lỗi liên tiếp để mở breaker
+LLM_BREAKER_RESET = float(os.getenv('LLM_BREAKER_RESET', '30'))        # Giây breaker mở trước khi thử lại
+
+
+class LLMError(Exception):
+    """Lỗi gọi LLM. retryable=False nghĩa là thử lại cũng vô ích (ví dụ 400, sai API key)."""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class LLMTimeoutError(LLMError):
+    pass
+
+
+class CircuitOpenError(LLMError):
+    def __init__(self, message: str = "Circuit breaker LLM đang mở."):
+        super().__init__(message, retryable=False)
+
+
+class LLMRejectedError(LLMError):
+    """Bị admission control từ chối trước khi gọi upstream (quota sender, ngân sách ngày, hàng chờ)."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message, retryable=False)
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """closed -> (threshold lỗi liên tiếp) -> open -> (hết reset_timeout) -> half_open -> closed/open."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, reset_timeout: float = LLM_BREAKER_RESET,
+                 clock: Callable[[], float] = _time.monotonic):
+        self.threshold = max(1, threshold)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._stats = {"opened": 0, "rejected": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """True nếu được phép gửi một lượt thử. Khi half-open chỉ cho đúng 1 lượt thăm dò."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.threshold:
+                if self._state != self.OPEN:
+                    self._stats["opened"] += 1
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            data = dict(self._stats)
+            data["consecutive_failures"] = self._failures
+        data["state"] = state
+        return data
+
+
+# ----------------------------------------------------------------------
+# Backend: async (prompt, timeout) -> LLMResponse (hoặc text thuần, token sẽ được ước lượng)
+# ----------------------------------------------------------------------
+class LLMResponse(NamedTuple):
+    text: str
+    prompt_tokens: Optional[int] = None  # Theo usageMetadata của upstream; None = không có
+    output_tokens: Optional[int] = None
+
+
+Backend = Callable[[str, float], Awaitable[Union[LLMResponse, str]]]
+
+
+class GeminiSDKBackend:
+    """Gọi google.generativeai; model handle được tạo một lần và dùng lại."""
+
+    def __init__(self, model_name: str = GEMINI_MODEL, api_key: Optional[str] = None):
+        self.model_name = model_name
+        self.api_key = api_key if api_key is not None else os.getenv('GEMINI_API_KEY')
+        self._model = None
+
+    def _get_model(self):
+        if self._model is None:
+            import google.generativeai as genai
+            genai.configure(api_key=self.api_key)
+            self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    async def __call__(self, prompt: str, timeout: float) -> LLMResponse:
+        from google.api_core import exceptions as gexc
+
+        try:
+            response = await self._get_model().generate_content_async(
+                prompt, request_options={"timeout": timeout}
+            )
+        except (gexc.TooManyRequests, gexc.ServerError, gexc.DeadlineExceeded) as e:
+            raise LLMError(f"Gemini: {e}") from e
+        except gexc.GoogleAPICallError as e:
+            raise LLMError(f"Gemini: {e}", retryable=False) from e
+        try:
+            text = response.text
+        except ValueError as e:  # Bị chặn bởi safety filter / không có candidate
+            raise LLMError(f"Gemini không trả về nội dung: {e}", retryable=False) from e
+        usage = getattr(response, "usage_metadata", None)
+        return LLMResponse(text, getattr(usage, "prompt_token_count", None) or None,
+                           getattr(usage, "candidates_token_count", None) or None)
+
+
+class GeminiRestBackend:
+    """Gọi REST API `POST {base}/v1beta/{model}:generateContent` (urllib, chạy trên thread, có timeout)."""
+
+    def __init__(self, base_url: str, model_name: str = GEMINI_MODEL, api_key: Optional[str] = None):
+        self.base_url = base_url.rstrip('/')
+        self.model_name = model_name if model_name.startswith('models/') else f"models/{model_name}"
+        self.api_key = api_key if api_key is not None else os.getenv('GEMINI_API_KEY', '')
+
+    def _post(self, prompt: str, timeout: float) -> LLMResponse:
+        url = f"{self.base_url}/v1beta/{self.model_name}:generateContent"
+        body = json.dumps({"contents": [{"parts": [{"text": prompt}]}]}).encode("utf-8")
+        request = urllib.request.Request(
+            url, data=body, method="POST",
+            headers={"Content-Type": "application/json", "x-goog-api-key": self.api_key},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as resp:
+                payload = json.loads(resp.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            raise LLMError(f"Gemini HTTP {e.code}", retryable=e.code == 429 or e.code >= 500) from e
+        except (urllib.error.URLError, OSError) as e:
+            if isinstance(e, TimeoutError) or isinstance(getattr(e, "reason", None), TimeoutError):
+                raise LLMTimeoutError(f"Gemini không phản hồi sau {timeout:.1f}s") from e
+            raise LLMError(f"Gemini: {e}") from e
+        try:
+            parts = payload["candidates"][0]["content"]["parts"]
+            text = "".join(part.get("text", "") for part in parts)
+        except (KeyError, IndexError, TypeError) as e:
+            raise LLMError("Gemini không trả về nội dung.", retryable=False) from e
+        usage = payload.get("usageMetadata") or {}
+        return LLMResponse(text, usage.get("promptTokenCount"), usage.get("candidatesTokenCount"))
+
+    async def __call__(self, prompt: str, timeout: float) -> LLMResponse:
+        return await asyncio.to_thread(self._post, prompt, timeout)
+
+
+def default_backend() -> Backend:
+    if GEMINI_API_BASE:
+        return GeminiRestBackend(GEMINI_API_BASE)
+    return GeminiSDKBackend()
+
+
+# ----------------------------------------------------------------------
+class LLMClient:
+    def __init__(self, backend: Optional[Backend] = None, timeout: float = LLM_TIMEOUT,
+                 deadline: float = LLM_DEADLINE, max_retries: int = LLM_MAX_RETRIES,
+                 backoff_base: float = LLM_BACKOFF_BASE, backoff_max: float = LLM_BACKOFF_MAX,
+                 breaker: Optional[CircuitBreaker] = None, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 admission: Optional[AdmissionController] = None, usage: Optional[UsageMeter] = None):
+        self._backend = backend
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        # Slot đồng thời, hàng chờ, quota theo sender và ngân sách ngày
+        self.admission = admission or AdmissionController(max_concurrency=max_concurrency)
+        self.usage = usage or llm_usage
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "successes": 0, "failures": 0, "attempts": 0, "retries": 0,
+                       "timeouts": 0, "fast_failed": 0, "coalesced": 0, "rejected": 0}
+        # Bảng request đang bay gắn với event loop đang chạy (tạo lại nếu loop đổi)
+        self._loop = None
+        self._inflight: Dict[str, "asyncio.Future"] = {}
+
+    @property
+    def backend(self) -> Backend:
+        if self._backend is None:
+            self._backend = default_backend()
+        return self._backend
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._inflight = {}
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: random trong [0, min(max, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _rejected(self, error: AdmissionRejected) -> LLMRejectedError:
+        self._count("rejected")
+        self._count("failures")
+        return LLMRejectedError(error.reason, str(error))
+
+    async def generate(self, prompt: str, timeout: Optional[float] = None,
+                       deadline: Optional[float] = None, sender_id: Optional[str] = None,
+                       purpose: str = "default") -> str:
+        """
+        Trả về text của LLM, hoặc ném LLMError (LLMTimeoutError / CircuitOpenError / LLMRejectedError) khi thất bại.
+        sender_id (hội thoại) bị giới hạn số lượt gọi; None = job nền, không giới hạn theo sender.
+        purpose: nhãn ghi chi phí / độ trễ (ví dụ "specialty", "explanation").
+        Nếu cùng prompt đang được gọi, chờ và dùng chung kết quả (timeout/deadline của lần gọi đầu tiên).
+        """
+        self._count("calls")
+        try:
+            self.admission.check_sender(sender_id)
+        except AdmissionRejected as e:
+            raise self._rejected(e) from None
+
+        self._bind_loop()
+        key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        task = self._inflight.get(key)
+        if task is not None:
+            self._count("coalesced")
+        else:
+            task = asyncio.ensure_future(self._generate(prompt, timeout, deadline, purpose))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, k=key, inflight=self._inflight: inflight.pop(k, None))
+        # shield: một người chờ bị hủy (hội thoại kết thúc) không hủy request dùng chung
+        return await asyncio.shield(task)
+
+    async def _generate(self, prompt: str, timeout: Optional[float], deadline: Optional[float],
+                        purpose: str) -> str:
+        per_attempt = timeout if timeout is not None else self.timeout
+        ends_at = _time.monotonic() + (deadline if deadline is not None else self.deadline)
+        last_error: Optional[LLMError] = None
+
+        for attempt in range(self.max_retries + 1):
+            remaining = ends_at - _time.monotonic()
+            if remaining <= 0:
+                break
+            if self.breaker.state == CircuitBreaker.OPEN:
+                self._count("fast_failed")
+                self._count("failures")
+                raise last_error or CircuitOpenError()
+
+            # Hàng chờ có giới hạn -> ngân sách ngày -> breaker (sau cùng, để lượt thăm dò half-open
+            # không bị kẹt trong hàng chờ hoặc bị ngân sách từ chối)
+            try:
+                await self.admission.acquire_slot(remaining)
+            except AdmissionRejected as e:
+                raise self._rejected(e) from None
+            try:
+                reserved = self.admission.reserve_budget(prompt)
+            except AdmissionRejected as e:
+                self.admission.release_slot()
+                raise self._rejected(e) from None
+            if not self.breaker.allow():
+                self.admission.refund(reserved)
+                self.admission.release_slot()
+                self._count("fast_failed")
+                self._count("failures")
+                raise last_error or CircuitOpenError()
+            if attempt:
+                self._count("retries")
+            self._count("attempts")
+
+            attempt_timeout = min(per_attempt, max(0.0, ends_at - _time.monotonic()))
+            response = None
+            started = _time.perf_counter()
+            try:
+                response = await asyncio.wait_for(self.backend(prompt, attempt_timeout), attempt_timeout)
+                if isinstance(response, str):
+                    response = LLMResponse(response)
+            except asyncio.TimeoutError:
+                self._count("timeouts")
+                last_error = LLMTimeoutError(f"LLM không phản hồi sau {attempt_timeout:.1f}s")
+            except LLMError as e:
+                if isinstance(e, LLMTimeoutError):
+                    self._count("timeouts")
+                last_error = e
+            except Exception as e:  # Lỗi không lường trước của SDK -> coi là tạm thời
+                last_error = LLMError(f"LLM: {e}")
+            else:
+                self.breaker.record_success()
+                self._count("successes")
+                return response.text
+            finally:
+                used = self._record_usage(purpose, prompt, response, started, last_error)
+                self.admission.settle(reserved, prompt, response.text if response else None, used)
+                self.admission.release_slot()
+
+            # Lỗi không thử lại được (400, sai key, prompt bị chặn) là lỗi của request chứ không phải
+            # upstream đang sập -> không đếm vào breaker
+            if last_error.retryable:
+                self.breaker.record_failure()
+            if not last_error.retryable or attempt == self.max_retries:
+                break
+            pause = min(self._backoff(attempt), ends_at - _time.monotonic())
+            if pause > 0:
+                await asyncio.sleep(pause)
+
+        self._count("failures")
+        raise last_error or LLMTimeoutError(f"Hết deadline gọi LLM ({self.deadline:.1f}s)")
+
+    def _record_usage(self, purpose: str, prompt: str, response: Optional[LLMResponse], started: float,
+                      error: Optional[LLMError]) -> int:
+        """Ghi 1 lượt thử vào usage meter; trả về tổng token (thật nếu upstream báo, không thì ước lượng)."""
+        latency_ms = (_time.perf_counter() - started) * 1000
+        if response is None:
+            outcome = "timeout" if isinstance(error, LLMTimeoutError) else "error"
+            prompt_tokens, output_tokens, estimated = estimate_tokens(prompt), 0, True
+        else:
+            outcome = "ok"
+            estimated = response.prompt_tokens is None or response.output_tokens is None
+            prompt_tokens = response.prompt_tokens or estimate_tokens(prompt)
+            output_tokens = (response.output_tokens if response.output_tokens is not None
+                             else estimate_tokens(response.text))
+        self.usage.record(purpose, prompt_tokens, output_tokens, latency_ms, outcome=outcome,
+                          estimated=estimated, prompt_chars=len(prompt))
+        return prompt_tokens + output_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            data = dict(self._stats)
+        data["inflight_prompts"] = len(self._inflight)
+        data["admission"] = self.admission.stats()
+        data["breaker"] = self.breaker.stats()
+        return data
+
+
+gemini_client = LLMClient()
+
+
+def llm_client_stats() -> Dict[str, Any]:
+    return gemini_client.stats()
@@ -0,0 +1,82 @@
+"""
+Ghi nhận chi phí / độ trễ của từng lượt gọi LLM lên upstream.
+
+Mỗi lượt thử (kể cả retry) được ghi: mục đích (purpose), token prompt / câu trả lời (số thật từ
+usageMetadata của Gemini, hoặc ước lượng nếu backend không trả về), độ trễ và kết quả.
+- Trong bộ nhớ: tổng theo purpose + p50/p99 độ trễ (stats()).
+- Trên đĩa: mỗi lượt một dòng JSON trong LLM_USAGE_LOG (mặc định .cache/llm_usage.jsonl; đặt rỗng để tắt)
+  để theo dõi chi phí và tốc độ theo thời gian.
+"""
+import json
+import os
+import threading
+import time as _time
+from collections import deque
+from typing import Any, Dict, Optional
+
+LLM_USAGE_LOG = os.getenv('LLM_USAGE_LOG', os.path.join('.cache', 'llm_usage.jsonl'))
+LLM_USAGE_SAMPLES = int(os.getenv('LLM_USAGE_SAMPLES', '2000'))  # Số mẫu độ trễ giữ lại mỗi purpose
+
+
+def _percentile(sorted_values, q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+class UsageMeter:
+    def __init__(self, log_path: Optional[str] = LLM_USAGE_LOG, samples: int = LLM_USAGE_SAMPLES):
+        self._lock = threading.Lock()
+        self._samples = max(1, samples)
+        self._totals: Dict[str, Dict[str, Any]] = {}
+        self._latency: Dict[str, deque] = {}
+        self._log = None
+        if log_path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+                self._log = open(log_path, "a", encoding="utf-8", buffering=1)
+            except OSError as e:
+                print(f"[WARN] Không mở được file log chi phí LLM ({log_path}): {e}")
+
+    def record(self, purpose: str, prompt_tokens: int, output_tokens: int, latency_ms: float,
+               outcome: str = "ok", estimated: bool = False, prompt_chars: int = 0):
+        with self._lock:
+            totals = self._totals.setdefault(purpose, {
+                "calls": 0, "errors": 0, "prompt_tokens": 0, "output_tokens": 0, "estimated_calls": 0,
+                "prompt_chars": 0,
+            })
+            totals["calls"] += 1
+            totals["errors"] += outcome != "ok"
+            totals["prompt_tokens"] += prompt_tokens
+            totals["output_tokens"] += output_tokens
+            totals["estimated_calls"] += estimated
+            totals["prompt_chars"] += prompt_chars
+            self._latency.setdefault(purpose, deque(maxlen=self._samples)).append(latency_ms)
+            if self._log is not None:
+                try:
+                    self._log.write(json.dumps({
+                        "ts": _time.strftime("%Y-%m-%dT%H:%M:%S"), "purpose": purpose, "outcome": outcome,
+                        "prompt_tokens": prompt_tokens, "output_tokens": output_tokens,
+                        "latency_ms": round(latency_ms, 1), "estimated": estimated, "prompt_chars": prompt_chars,
+                    }, ensure_ascii=False) + "\n")
+                except (OSError, ValueError):
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            totals = {purpose: dict(t) for purpose, t in self._totals.items()}
+            samples = {purpose: sorted(values) for purpose, values in self._latency.items()}
+        for purpose, t in totals.items():
+            values = samples.get(purpose)
+            calls = t["calls"] or 1
+            t["avg_prompt_tokens"] = round(t["prompt_tokens"] / calls, 1)
+            t["avg_output_tokens"] = round(t["output_tokens"] / calls, 1)
+            if values:
+                t["p50_ms"] = round(_percentile(values, 0.5), 1)
+                t["p99_ms"] = round(_percentile(values, 0.99), 1)
+        return totals
+
+
+llm_usage = UsageMeter()
+
+
+def llm_usage_stats() -> Dict[str, Any]:
+    return llm_usage.stats()
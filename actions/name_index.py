@@ -0,0 +1,69 @@
+"""
+Chỉ mục tìm tên bác sĩ trong bộ nhớ, không phân biệt dấu tiếng Việt.
+
+"nguyen van a", "Nguyễn Văn A", "van a" đều tìm được bác sĩ "Nguyễn Văn A"
+mà không cần `tenBS LIKE '%...%'` (quét toàn bảng).
+"""
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Set
+
+# Các từ xưng hô người dùng hay gõ kèm trước tên bác sĩ
+_HONORIFIC_TOKENS = {"bac", "si", "bs", "dr", "doctor"}
+
+
+def fold_accents(text: str) -> str:
+    """Bỏ dấu tiếng Việt + chữ thường: 'Nguyễn Văn Đức' -> 'nguyen van duc'."""
+    if not text:
+        return ""
+    text = str(text).replace("đ", "d").replace("Đ", "D")
+    decomposed = unicodedata.normalize("NFD", text)
+    stripped = "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+    return re.sub(r"\s+", " ", stripped).strip().lower()
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", fold_accents(text))
+
+
+class DoctorNameIndex:
+    """
+    Inverted index token/prefix -> tập maBS.
+    Mỗi token trong câu truy vấn phải là tiền tố của một token trong tên bác sĩ.
+    """
+
+    def __init__(self, doctors: Iterable[Dict]):
+        self._prefix_index: Dict[str, Set[str]] = {}
+        self._full_names: Dict[str, str] = {}  # maBS -> tên đã bỏ dấu
+
+        for doc in doctors:
+            ma_bs = doc['maBS']
+            tokens = tokenize(doc.get('tenBS') or "")
+            self._full_names[ma_bs] = " ".join(tokens)
+            for token in tokens:
+                for end in range(1, len(token) + 1):
+                    self._prefix_index.setdefault(token[:end], set()).add(ma_bs)
+
+    def search(self, query: str) -> List[str]:
+        """
+        Trả về danh sách maBS khớp. Nếu có bác sĩ trùng KHỚP NGUYÊN TÊN thì
+        chỉ trả về các bác sĩ đó (tránh "Nguyễn Văn A" bị lẫn với "Nguyễn Văn An").
+        """
+        tokens = tokenize(query)
+        while len(tokens) > 1 and tokens[0] in _HONORIFIC_TOKENS:
+            tokens = tokens[1:]
+        if not tokens:
+            return []
+
+        candidates = None
+        for token in sorted(tokens, key=len, reverse=True):
+            ids = self._prefix_index.get(token)
+            if not ids:
+                return []
+            candidates = set(ids) if candidates is None else candidates & ids
+            if not candidates:
+                return []
+
+        full_query = " ".join(tokens)
+        exact = [ma_bs for ma_bs in candidates if self._full_names[ma_bs] == full_query]
+        return exact or list(candidates)
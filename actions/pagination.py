@@ -0,0 +1,70 @@
+"""
+Phân trang keyset cho các danh sách bác sĩ (tất cả bác sĩ, theo chuyên khoa, kết quả tìm theo tên).
+
+- Khóa sắp xếp (tenBS, maBS) là duy nhất; cursor ">maBS" = trang ngay SAU dòng có maBS đó,
+  "<maBS" = trang ngay TRƯỚC. Cursor theo khóa chứ không theo offset: thêm / bớt bác sĩ giữa hai lần
+  bấm không làm lặp hay sót dòng.
+- Vị trí tìm bằng bisect trên danh sách khóa đã sắp sẵn trong snapshot dữ liệu tham chiếu; chỉ các dòng
+  của MỘT trang được dựng thành dict và render.
+- Nút "Trang trước" / "Trang sau" mang cursor trong payload (entity page_cursor) cùng các entity
+  cần để dựng lại danh sách (chuyên khoa, từ khóa tìm kiếm).
+"""
+import json
+import os
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from .refdata import DoctorKey
+
+DOCTOR_LIST_PAGE_SIZE = int(os.getenv('DOCTOR_LIST_PAGE_SIZE', '10'))
+
+
+class Page(NamedTuple):
+    keys: Sequence[DoctorKey]  # Khóa của các dòng trong trang
+    start: int                 # Vị trí (từ 0) của dòng đầu trang trong cả danh sách
+    total: int
+    prev_cursor: Optional[str]
+    next_cursor: Optional[str]
+
+    @property
+    def paginated(self) -> bool:
+        return self.prev_cursor is not None or self.next_cursor is not None
+
+    def info(self) -> Dict[str, Any]:
+        """Thông tin trang cho payload JSON."""
+        return {"first": self.start + 1, "last": self.start + len(self.keys), "total": self.total,
+                "prev": self.prev_cursor, "next": self.next_cursor}
+
+
+def keyset_page(keys: Sequence[DoctorKey], cursor: Optional[str],
+                key_of: Callable[[str], Optional[DoctorKey]], size: Optional[int] = None) -> Page:
+    """Trang theo cursor trên danh sách khóa đã sắp. Cursor sai / bác sĩ không còn -> trang đầu."""
+    size = max(1, size or DOCTOR_LIST_PAGE_SIZE)
+    start = 0
+    anchor = key_of(cursor[1:]) if cursor and cursor[0] in "<>" else None
+    if anchor is not None:
+        start = bisect_right(keys, anchor) if cursor[0] == ">" else max(0, bisect_left(keys, anchor) - size)
+        if start >= len(keys):
+            start = max(0, len(keys) - size)  # Cursor ở cuối danh sách (dòng cuối vừa bị xóa) -> trang cuối
+    end = min(len(keys), start + size)
+    page_keys = keys[start:end]
+    return Page(
+        page_keys, start, len(keys),
+        f"<{page_keys[0][1]}" if start > 0 and page_keys else None,
+        f">{page_keys[-1][1]}" if end < len(keys) and page_keys else None,
+    )
+
+
+def page_cursor(tracker) -> Optional[str]:
+    entities = tracker.latest_message.get('entities', [])
+    return next((e['value'] for e in entities if e['entity'] == 'page_cursor'), None)
+
+
+def page_buttons(page: Page, intent: str, **entities: str) -> List[Dict[str, str]]:
+    """Nút chuyển trang: payload /intent{...entities, "page_cursor": ...}."""
+    buttons = []
+    for title, cursor in (("⬅️ Trang trước", page.prev_cursor), ("Trang sau ➡️", page.next_cursor)):
+        if cursor:
+            payload = json.dumps(dict(entities, page_cursor=cursor), ensure_ascii=False, separators=(",", ":"))
+            buttons.append({"title": title, "payload": f"/{intent}{payload}"})
+    return buttons
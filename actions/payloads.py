@@ -0,0 +1,77 @@
+"""
+Chế độ trả lời bằng custom payload JSON (json_message) thay cho HTML.
+
+RESPONSE_MODE=json: lịch bác sĩ, danh sách bác sĩ / chuyên khoa, gợi ý bác sĩ theo chuyên khoa, toa thuốc và lịch hẹn sắp tới
+được gửi dưới dạng bản ghi có kiểu, gọn (frontend tự render); mặc định (html) giữ tin nhắn HTML như cũ.
+
+Mọi payload có dạng {"type": ..., "v": PAYLOAD_VERSION, ...}; danh sách dòng dùng "cols" + "rows" (mảng giá trị
+theo đúng thứ tự cột) để không lặp lại tên khóa ở mỗi dòng. Nút bấm nằm trong payload: "buttons"[i] là các nút
+(cùng dạng {title, payload} như nút Rasa) của dòng thứ i, để frontend đặt cạnh đúng bản ghi.
+
+    {"type": "doctor_schedule", "v": 1, "doctor": "Nguyễn Văn A", "from": "03/03", "to": "09/03",
+     "cols": ["day", "start", "end", "status"], "rows": [["Thứ 2 (03/03)", "07:00", "11:00", null], ...]}
+"""
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+RESPONSE_MODE = os.getenv('RESPONSE_MODE', 'html')  # html / json
+PAYLOAD_VERSION = 1
+
+
+def json_mode() -> bool:
+    return RESPONSE_MODE == 'json'
+
+
+def _plain(value: Any) -> Any:
+    """Giá trị từ DB -> kiểu JSON (Decimal, date, timedelta... -> số / chuỗi)."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def _record(kind: str, **fields: Any) -> Dict[str, Any]:
+    return {"type": kind, "v": PAYLOAD_VERSION, **fields}
+
+
+def doctor_schedule_payload(ten_bs: str, start: str, end: str,
+                            days: Sequence[Tuple[str, Sequence[Tuple[str, str, Optional[str]]]]]) -> Dict[str, Any]:
+    """Cùng dữ liệu với html_templates.render_week_schedule: mỗi ca một dòng (ngày, giờ bắt đầu, kết thúc, trạng thái)."""
+    return _record("doctor_schedule", doctor=ten_bs, **{"from": start, "to": end},
+                   cols=["day", "start", "end", "status"],
+                   rows=[[day, s, e, status] for day, shifts in days for s, e, status in shifts])
+
+
+def doctor_list_payload(title: str, doctors: Sequence[Dict[str, Any]], cols: Sequence[str],
+                        buttons: Optional[Sequence[List[Dict[str, str]]]] = None, **fields: Any) -> Dict[str, Any]:
+    """Danh sách bác sĩ; cols là các khóa lấy từ mỗi dòng (ví dụ tenBS, chuyenkhoa / tenBS, sdtBS, emailBS)."""
+    payload = _record("doctor_list", title=title, cols=list(cols),
+                      rows=[[_plain(doc.get(col)) for col in cols] for doc in doctors], **fields)
+    if buttons:
+        payload["buttons"] = [list(b) for b in buttons]
+    return payload
+
+
+def specialty_list_payload(title: str, specialties: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    cols = ["tenCK", "mota"]
+    return _record("specialty_list", title=title, cols=cols,
+                   rows=[[_plain(spec.get(col)) for col in cols] for spec in specialties])
+
+
+def prescription_payload(title: str, prescriptions: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    cols = ["tenThuoc", "lieuluong", "soluong", "donvi", "thoigianSD"]
+    return _record("prescription", title=title, visit=prescriptions[0]['maLanKham'], cols=cols,
+                   rows=[[_plain(med.get(col)) for col in cols] for med in prescriptions])
+
+
+def appointments_payload(items: Sequence[Dict[str, Any]], buttons: Sequence[List[Dict[str, str]]],
+                         **fields: Any) -> Dict[str, Any]:
+    """items: như html_templates.render_upcoming_appointments; buttons[i]: các nút của lịch hẹn thứ i."""
+    cols = ["mahen", "day", "time", "tenBS", "tenCK", "mota"]
+    return _record("appointments", cols=cols, rows=[[_plain(item.get(col)) for col in cols] for item in items],
+                   buttons=[list(b) for b in buttons], **fields)
@@ -0,0 +1,107 @@
+"""
+Các truy vấn "nóng" trên thoigiankham / lichhen / lankham.
+
+Điều kiện ngày viết dạng nửa mở `cot >= bat_dau AND cot < ket_thuc`
+(KHÔNG bọc cột trong DATE()) để MySQL dùng được range scan trên các index
+tạo bởi migrations/001_hot_table_indexes.sql (và các migration sau). migrations/explain_check.py
+chạy EXPLAIN trên chính các hằng số này để kiểm chứng.
+"""
+from datetime import date, timedelta
+from typing import Optional, Tuple
+
+
+def day_bounds(start: date, end: Optional[date] = None) -> Tuple[date, date]:
+    """Khoảng nửa mở [start, end + 1 ngày) thay cho `DATE(col) BETWEEN start AND end`."""
+    return start, (end or start) + timedelta(days=1)
+
+
+# thoigiankham(maBS, ngaythangnam) -> idx_thoigiankham_bs_ngay
+DOCTOR_WORKING_SHIFTS_QUERY = """
+SELECT ngaythangnam, giobatdau, gioketthuc, trangthai
+FROM thoigiankham
+WHERE maBS = %s
+  AND ngaythangnam >= %s AND ngaythangnam < %s
+  AND (trangthai != 'Nghỉ' OR trangthai IS NULL)
+ORDER BY ngaythangnam, giobatdau
+"""
+
+DOCTOR_SHIFTS_QUERY = """
+SELECT ngaythangnam, giobatdau, gioketthuc, trangthai
+FROM thoigiankham
+WHERE maBS = %s AND ngaythangnam >= %s AND ngaythangnam < %s
+ORDER BY ngaythangnam, giobatdau
+"""
+
+# lichhen(maBN, ngaythangnam, trangthai) -> idx_lichhen_bn_ngay_tt
+PATIENT_APPOINTMENTS_ON_DAY_QUERY = """
+SELECT lh.mahen, lh.ngaythangnam, lh.khunggio, bs.tenBS, ck.tenCK, lh.mota
+FROM lichhen lh
+JOIN bacsi bs ON lh.maBS = bs.maBS
+JOIN chuyenkhoa ck ON lh.maCK = ck.maCK
+WHERE lh.maBN = %s AND lh.ngaythangnam >= %s AND lh.ngaythangnam < %s AND lh.trangthai != 'Huy'
+ORDER BY lh.khunggio
+"""
+
+# Một lịch hẹn (chưa hủy) của bệnh nhân - luồng hủy lịch
+PATIENT_APPOINTMENT_BY_ID_QUERY = """
+SELECT lh.mahen, lh.ngaythangnam, lh.khunggio, bs.tenBS, ck.tenCK, lh.mota
+FROM lichhen lh
+JOIN bacsi bs ON lh.maBS = bs.maBS
+JOIN chuyenkhoa ck ON lh.maCK = ck.maCK
+WHERE lh.mahen = %s AND lh.maBN = %s AND lh.trangthai != 'Huy'
+"""
+
+PATIENT_UPCOMING_APPOINTMENTS_QUERY = """
+SELECT
+    lh.mahen,
+    lh.ngaythangnam,
+    lh.khunggio,
+    bs.tenBS,
+    ck.tenCK,
+    lh.mota
+FROM lichhen lh
+JOIN bacsi bs ON lh.maBS = bs.maBS
+JOIN chuyenkhoa ck ON lh.maCK = ck.maCK
+WHERE lh.maBN = %s
+  AND lh.trangthai = 'ChuaKham'
+  AND lh.ngaythangnam >= %s
+ORDER BY lh.ngaythangnam, lh.khunggio
+LIMIT 3
+"""
+
+# lankham(maHS, ngaythangnamkham) -> idx_lankham_hs_ngay
+PATIENT_PRESCRIPTIONS_ON_DAY_QUERY = """
+SELECT
+    lk.maLanKham,
+    lk.ngaythangnamkham,
+    t.tenThuoc,
+    tt.lieuluong,
+    tt.soluong,
+    tt.donvi,
+    tt.thoigianSD
+FROM lankham lk
+JOIN hosobenhnhan hs ON lk.maHS = hs.maHS
+JOIN toathuoc tt ON lk.maLanKham = tt.maLanKham
+JOIN thuoc t ON tt.maThuoc = t.maThuoc
+WHERE hs.maBN = %s AND lk.ngaythangnamkham >= %s AND lk.ngaythangnamkham < %s
+ORDER BY t.tenThuoc
+"""
+
+# Ca làm việc chứa giờ khám (maBS, ngày, giờ) -> idx_thoigiankham_bs_ngay.
+# Bản `... FOR UPDATE` khóa dòng ca làm việc: các lượt đặt cùng ca được xếp hàng.
+DOCTOR_SHIFT_AT_TIME_QUERY = """
+SELECT ngaythangnam, giobatdau, gioketthuc, trangthai
+FROM thoigiankham
+WHERE maBS = %s AND ngaythangnam >= %s AND ngaythangnam < %s
+  AND giobatdau <= %s AND gioketthuc > %s
+ORDER BY giobatdau
+LIMIT 1
+"""
+
+# lichhen(maBS, ngaythangnam, khunggio) -> idx_lichhen_bs_ngay_gio
+SLOT_BOOKINGS_QUERY = """
+SELECT COUNT(*) AS so_luong
+FROM lichhen
+WHERE maBS = %s AND ngaythangnam >= %s AND ngaythangnam < %s AND khunggio = %s
+  AND trangthai != 'Huy'
+"""
@@ -0,0 +1,292 @@
+"""
+Cache trong bộ nhớ cho dữ liệu tham chiếu ít thay đổi: bacsi, chuyenkhoa, chuyenmon.
+
+- Toàn bộ 3 bảng được nạp thành một snapshot bất biến, có số version tăng dần.
+- Snapshot hết hạn sau REFDATA_TTL giây (TTL refresh) hoặc khi gọi invalidate().
+- content_version: hash nội dung 3 bảng, chỉ đổi khi dữ liệu đổi; listener (add_listener) được gọi
+  mỗi khi nạp xong snapshot mới (ví dụ render trước các danh sách tĩnh, xem listing_cache.py).
+- Các action đọc từ snapshot; chỉ khi cache miss mới truy vấn DB.
+- stats() trả về bộ đếm hit/miss để giám sát.
+"""
+import hashlib
+import os
+import threading
+import time as _time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .db import fetch_one, get_executor, run_db, run_in_connection
+from .name_index import DoctorNameIndex
+
+REFDATA_TTL = float(os.getenv('REFDATA_TTL', '300'))  # Giây
+
+DoctorKey = Tuple[str, str]  # (tenBS, maBS): khóa sắp xếp duy nhất của danh sách bác sĩ (phân trang keyset)
+
+
+class ReferenceSnapshot:
+    """Ảnh chụp bất biến của bacsi/chuyenkhoa/chuyenmon + các chỉ mục tra cứu."""
+
+    def __init__(self, version: int, doctors: List[Dict[str, Any]], specialties: List[Dict[str, Any]],
+                 links: List[Dict[str, Any]]):
+        self.version = version
+        self.loaded_at = _time.monotonic()
+
+        self.doctors = {d['maBS']: d for d in doctors}
+        self.doctor_by_name = {d['tenBS']: d for d in doctors if d.get('tenBS')}
+        self.name_index = DoctorNameIndex(doctors)
+        self.specialties = {s['maCK']: s for s in specialties}
+        self.specialty_by_name = {s['tenCK'].lower(): s for s in specialties if s.get('tenCK')}
+        # Version theo NỘI DUNG danh sách chuyên khoa (khác self.version tăng mỗi lần nạp lại):
+        # giữ nguyên qua các lần refresh / khởi động lại nếu danh sách không đổi
+        names = "\n".join(sorted(s['tenCK'] or '' for s in specialties))
+        self.specialty_list_version = hashlib.sha1(names.encode("utf-8")).hexdigest()[:12]
+        # Version theo NỘI DUNG cả 3 bảng: chỉ đổi khi bacsi / chuyenkhoa / chuyenmon thực sự đổi
+        content = repr((
+            [sorted(d.items()) for d in sorted(doctors, key=lambda d: str(d['maBS']))],
+            [sorted(s.items()) for s in sorted(specialties, key=lambda s: str(s['maCK']))],
+            sorted((str(link['maBS']), str(link['maCK'])) for link in links),
+        ))
+        self.content_version = hashlib.sha1(content.encode("utf-8")).hexdigest()[:12]
+
+        self.doctor_specialties: Dict[str, List[str]] = {}
+        self.specialty_doctors: Dict[str, List[str]] = {}
+        for link in links:
+            if link['maBS'] not in self.doctors or link['maCK'] not in self.specialties:
+                continue
+            self.doctor_specialties.setdefault(link['maBS'], []).append(link['maCK'])
+            self.specialty_doctors.setdefault(link['maCK'], []).append(link['maBS'])
+        for ma_bs_list in self.specialty_doctors.values():
+            ma_bs_list.sort(key=self.doctor_key)
+        # Khóa đã sắp sẵn cho phân trang: bác sĩ đang làm việc / bác sĩ theo từng chuyên khoa
+        self.active_doctor_keys: List[DoctorKey] = sorted(
+            self.doctor_key(d['maBS']) for d in doctors if d.get('vaiTro') == 'DOCTOR' and not d.get('xoa')
+        )
+        self.specialty_doctor_keys: Dict[str, List[DoctorKey]] = {
+            ma_ck: [self.doctor_key(ma_bs) for ma_bs in ma_bs_list] for ma_ck, ma_bs_list in self.specialty_doctors.items()
+        }
+
+    # ---------------------------- Chuyên khoa ----------------------------
+    def specialty_names(self) -> List[str]:
+        return [s['tenCK'] for s in self.specialties.values()]
+
+    def sorted_specialties(self) -> List[Dict[str, Any]]:
+        return sorted(self.specialties.values(), key=lambda s: s['tenCK'] or '')
+
+    def find_specialty(self, name: str) -> Optional[Dict[str, Any]]:
+        """Tương đương `WHERE LOWER(tenCK) = %s`."""
+        if not name:
+            return None
+        return self.specialty_by_name.get(str(name).strip().lower())
+
+    def specialty_containing(self, fragment: str) -> Optional[Dict[str, Any]]:
+        """Khớp chính xác trước, sau đó chuyên khoa đầu tiên (theo tên) có tên chứa fragment (`LIKE %x%`)."""
+        found = self.find_specialty(fragment)
+        if found or not fragment:
+            return found
+        needle = str(fragment).strip().lower()
+        return next((s for s in self.sorted_specialties() if needle in (s['tenCK'] or '').lower()), None)
+
+    # ------------------------------ Bác sĩ -------------------------------
+    def specialty_names_of(self, ma_bs: str) -> List[str]:
+        return [self.specialties[ma_ck]['tenCK'] for ma_ck in self.doctor_specialties.get(ma_bs, [])]
+
+    def doctor_key(self, ma_bs: str) -> Optional[DoctorKey]:
+        doc = self.doctors.get(ma_bs)
+        return (doc['tenBS'] or '', doc['maBS']) if doc else None
+
+    def active_doctors(self) -> List[Dict[str, Any]]:
+        """Bác sĩ đang làm việc (vaiTro = DOCTOR, xoa = 0), sắp theo tên."""
+        return [self.doctors[ma_bs] for _, ma_bs in self.active_doctor_keys]
+
+    def doctor_specialty_rows(self, doctors: List[Dict[str, Any]], specialty: Optional[str] = None,
+                              outer: bool = False) -> List[Dict[str, Any]]:
+        """
+        Tương đương JOIN bacsi - chuyenmon - chuyenkhoa: mỗi cặp (bác sĩ, chuyên khoa) một dòng,
+        có thể lọc theo tên chuyên khoa (so khớp chính xác như `ck.tenCK = %s`).
+        outer=True tương đương LEFT JOIN: bác sĩ chưa có chuyên khoa vẫn có 1 dòng với tenCK = None.
+        """
+        rows = []
+        for doc in doctors:
+            ma_ck_list = self.doctor_specialties.get(doc['maBS'], [])
+            if outer and not ma_ck_list and specialty is None:
+                rows.append(dict(doc, maCK=None, tenCK=None))
+                continue
+            for ma_ck in ma_ck_list:
+                ten_ck = self.specialties[ma_ck]['tenCK']
+                if specialty is not None and ten_ck != specialty:
+                    continue
+                row = dict(doc)
+                row['maCK'] = ma_ck
+                row['tenCK'] = ten_ck
+                rows.append(row)
+        return rows
+
+    def top_doctors_by_specialty(self, specialty_names: List[str], limit: int = 3) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Tối đa `limit` bác sĩ cho MỖI chuyên khoa trong danh sách, tra một lượt trên map
+        chuyên khoa -> bác sĩ (thay cho N truy vấn `WHERE ck.tenCK = %s LIMIT 3`).
+        Chuyên khoa không tồn tại / chưa có bác sĩ -> danh sách rỗng.
+        """
+        result = {}
+        for name in specialty_names:
+            specialty = self.find_specialty(name)
+            ma_bs_list = self.specialty_doctors.get(specialty['maCK'], []) if specialty else []
+            result[name] = [
+                dict(self.doctors[ma_bs], maCK=specialty['maCK'], tenCK=specialty['tenCK'])
+                for ma_bs in ma_bs_list[:limit]
+            ]
+        return result
+
+    def doctors_matching(self, name_fragment: str) -> List[Dict[str, Any]]:
+        """Tìm bác sĩ theo tên qua chỉ mục không dấu (thay cho `tenBS LIKE %x%`)."""
+        return [self.doctors[ma_bs] for _, ma_bs in self.doctor_keys_matching(name_fragment)]
+
+    def doctor_keys_matching(self, name_fragment: str) -> List[DoctorKey]:
+        """Như doctors_matching nhưng chỉ trả khóa đã sắp (để phân trang, không dựng các dòng)."""
+        return sorted(self.doctor_key(ma_bs) for ma_bs in self.name_index.search(name_fragment))
+
+    def doctor_by_id(self, ma_bs: str) -> Optional[Dict[str, Any]]:
+        return self.doctors.get(ma_bs)
+
+    def find_doctor(self, name: str) -> Optional[Dict[str, Any]]:
+        """Tương đương `WHERE tenBS = %s` (khớp nguyên tên)."""
+        if not name:
+            return None
+        return self.doctor_by_name.get(str(name).strip())
+
+
+class ReferenceDataCache:
+    """Giữ snapshot hiện hành; nạp lại khi hết TTL hoặc bị invalidate."""
+
+    def __init__(self, ttl: float = REFDATA_TTL):
+        self.ttl = ttl
+        self._snapshot: Optional[ReferenceSnapshot] = None
+        self._version = 0
+        self._load_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "refreshes": 0, "invalidations": 0, "lookup_misses": 0}
+        self._listeners: List[Callable[[ReferenceSnapshot], None]] = []
+
+    def add_listener(self, callback: Callable[[ReferenceSnapshot], None]):
+        """callback(snapshot) chạy sau mỗi lần nạp snapshot mới (ngoài khóa nạp)."""
+        self._listeners.append(callback)
+
+    def _notify(self, snap: ReferenceSnapshot):
+        for callback in list(self._listeners):
+            try:
+                callback(snap)
+            except Exception as e:
+                print(f"[WARN] Listener dữ liệu tham chiếu lỗi: {e}")
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _is_fresh(self, snap: Optional[ReferenceSnapshot]) -> bool:
+        return snap is not None and (_time.monotonic() - snap.loaded_at) < self.ttl
+
+    @staticmethod
+    def _load_tables(conn):
+        cursor = conn.cursor(dictionary=True, buffered=True)
+        try:
+            cursor.execute("SELECT maBS, tenBS, sdtBS, emailBS, gioithieu, vaiTro, xoa FROM bacsi")
+            doctors = cursor.fetchall()
+            cursor.execute("SELECT maCK, tenCK, mota FROM chuyenkhoa")
+            specialties = cursor.fetchall()
+            cursor.execute("SELECT maBS, maCK FROM chuyenmon")
+            links = cursor.fetchall()
+        finally:
+            cursor.close()
+        return doctors, specialties, links
+
+    def get_sync(self) -> ReferenceSnapshot:
+        """Lấy snapshot (đồng bộ, thread-safe). Chỉ truy vấn DB khi miss."""
+        snap = self._snapshot
+        if self._is_fresh(snap):
+            self._count("hits")
+            return snap
+
+        with self._load_lock:
+            snap = self._snapshot
+            if self._is_fresh(snap):
+                # Thread khác vừa nạp xong
+                self._count("hits")
+                return snap
+            self._count("misses")
+            doctors, specialties, links = run_in_connection(self._load_tables)
+            self._version += 1
+            snap = ReferenceSnapshot(self._version, doctors, specialties, links)
+            self._snapshot = snap
+            self._count("refreshes")
+            print(f"[DEBUG] Reference data loaded (version {snap.version}, content {snap.content_version}): "
+                  f"{len(snap.doctors)} bác sĩ, {len(snap.specialties)} chuyên khoa")
+        self._notify(snap)
+        return snap
+
+    async def get(self) -> ReferenceSnapshot:
+        snap = self._snapshot
+        if self._is_fresh(snap):
+            self._count("hits")
+            return snap
+        return await run_db(self.get_sync)
+
+    def invalidate(self):
+        """Bỏ snapshot hiện hành; lần đọc kế tiếp sẽ nạp lại từ DB."""
+        self._snapshot = None
+        self._count("invalidations")
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            data = dict(self._stats)
+        lookups = data["hits"] + data["misses"]
+        data["hit_rate"] = round(data["hits"] / lookups, 4) if lookups else 0.0
+        data["version"] = self._version
+        return data
+
+
+reference_cache = ReferenceDataCache()
+
+
+async def get_reference_data() -> ReferenceSnapshot:
+    return await reference_cache.get()
+
+
+async def find_specialty(name: str) -> Optional[Dict[str, Any]]:
+    """
+    Tra chuyên khoa theo tên (không phân biệt hoa thường) từ snapshot.
+    Không có trong snapshot -> kiểm tra DB một lần; nếu DB có thì snapshot đã cũ -> invalidate.
+    """
+    snap = await get_reference_data()
+    found = snap.find_specialty(name)
+    if found or not name:
+        return found
+
+    reference_cache._count("lookup_misses")
+    row = await fetch_one("SELECT maCK, tenCK, mota FROM chuyenkhoa WHERE LOWER(tenCK) = %s",
+                          (str(name).strip().lower(),))
+    if row:
+        invalidate_reference_data()
+    return row
+
+
+def invalidate_reference_data():
+    """Bỏ snapshot hiện hành và nạp lại ở nền (listener render lại các danh sách tĩnh)."""
+    reference_cache.invalidate()
+    warm_up_reference_data()
+
+
+def warm_up_reference_data():
+    """Nạp snapshot (kèm chỉ mục tên bác sĩ) ngay khi khởi động, không chặn tiến trình."""
+    def _load():
+        try:
+            reference_cache.get_sync()
+        except Exception as e:
+            print(f"[WARN] Không nạp trước được dữ liệu tham chiếu: {e}")
+    get_executor().submit(_load)
+
+
+def reference_cache_stats() -> Dict[str, Any]:
+    return reference_cache.stats()
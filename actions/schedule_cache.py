@@ -0,0 +1,194 @@
+"""
+Cache lịch làm việc theo tuần của từng bác sĩ, khóa (maBS, năm ISO, tuần ISO).
+
+- Một lần nạp = một truy vấn DOCTOR_SHIFTS_QUERY cho cả tuần Thứ 2 -> Chủ nhật;
+  lịch tuần (ActionShowDoctorSchedule, form đặt lịch) và lịch ngày (validate_date)
+  đều đọc từ cùng một entry.
+- Entry hết hạn sau SCHEDULE_CACHE_TTL giây; tối đa SCHEDULE_CACHE_MAX_ENTRIES entry (LRU).
+- thoigiankham thay đổi -> trigger tăng schedule_versions (migrations/005_schedule_versions.sql).
+  Cứ SCHEDULE_POLL_INTERVAL giây cache hỏi DB một lần xem bác sĩ nào vừa đổi lịch
+  và chỉ bỏ entry của các bác sĩ đó. Chưa chạy migration -> chỉ dựa vào TTL.
+- updated_at là lúc ghi dòng chứ không phải lúc commit: mỗi lần poll đọc lại SCHEDULE_POLL_WINDOW giây
+  trước mốc đã thấy (transaction commit muộn vẫn được bắt), bỏ trùng theo cột version.
+- Mỗi bác sĩ có một số thế hệ, tăng khi bị invalidate; lượt nạp tuần mà thế hệ đổi trong lúc
+  truy vấn (lịch vừa đổi) thì không được ghi vào cache.
+"""
+import os
+import threading
+import time as _time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from mysql.connector import Error
+
+from .db import fetch_all_sync, run_db
+from .queries import DOCTOR_SHIFTS_QUERY, day_bounds
+
+SCHEDULE_CACHE_TTL = float(os.getenv('SCHEDULE_CACHE_TTL', '120'))              # Giây
+SCHEDULE_CACHE_MAX_ENTRIES = int(os.getenv('SCHEDULE_CACHE_MAX_ENTRIES', '2000'))
+SCHEDULE_POLL_INTERVAL = float(os.getenv('SCHEDULE_POLL_INTERVAL', '5'))        # Giây, 0 = tắt
+SCHEDULE_POLL_WINDOW = float(os.getenv('SCHEDULE_POLL_WINDOW', '30'))           # Giây đọc lại trước mốc
+
+WeekKey = Tuple[str, int, int]
+
+
+def _as_date(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+class WeeklyScheduleCache:
+    def __init__(self, ttl: float = SCHEDULE_CACHE_TTL, max_entries: int = SCHEDULE_CACHE_MAX_ENTRIES,
+                 poll_interval: float = SCHEDULE_POLL_INTERVAL, poll_window: float = SCHEDULE_POLL_WINDOW):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.poll_interval = poll_interval
+        self.poll_window = timedelta(seconds=max(0.0, poll_window))
+
+        self._entries: "OrderedDict[WeekKey, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._last_poll = 0.0
+        self._watermark: Optional[datetime] = None  # updated_at lớn nhất đã thấy trong schedule_versions
+        self._seen: Dict[str, Tuple[int, datetime]] = {}  # maBS -> (version, updated_at) đã xử lý trong cửa sổ
+        self._generations: Dict[str, int] = {}  # maBS -> số lần bị invalidate
+        self._epoch = 0  # Tăng khi invalidate toàn bộ
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "polls": 0, "stale_loads": 0}
+
+    @staticmethod
+    def key_for(ma_bs: str, day: date) -> WeekKey:
+        iso = day.isocalendar()
+        return ma_bs, iso[0], iso[1]
+
+    def _window_start(self) -> datetime:
+        if self._watermark - datetime.min <= self.poll_window:
+            return datetime.min
+        return self._watermark - self.poll_window
+
+    # ------------------------------------------------------------------
+    def _poll_changes(self):
+        """Hỏi schedule_versions xem bác sĩ nào vừa đổi lịch (tối đa 1 lần / poll_interval)."""
+        if not self._poll_due():
+            return
+        if not self._poll_lock.acquire(blocking=False):
+            return  # Thread khác đang poll
+        try:
+            self._last_poll = _time.monotonic()
+            if self._watermark is None:
+                row = fetch_all_sync("SELECT MAX(updated_at) AS mx FROM schedule_versions")
+                self._watermark = row[0]['mx'] or datetime.min
+            # Đọc lại cả cửa sổ trước mốc: dòng có updated_at cũ nhưng commit sau lần poll trước vẫn hiện ra;
+            # dòng đã xử lý (cùng version) bị bỏ qua
+            since = self._window_start()
+            changed = fetch_all_sync(
+                "SELECT maBS, version, updated_at FROM schedule_versions WHERE updated_at >= %s", (since,)
+            )
+            with self._lock:
+                self._stats["polls"] += 1
+            for row in changed:
+                seen = self._seen.get(row['maBS'])
+                if seen is None or seen[0] != row['version']:
+                    self.invalidate(row['maBS'])
+                    self._seen[row['maBS']] = (row['version'], row['updated_at'])
+                self._watermark = max(self._watermark, row['updated_at'])
+            # Dòng đã ra khỏi cửa sổ sẽ không được đọc lại -> không cần nhớ version
+            horizon = self._window_start()
+            self._seen = {k: v for k, v in self._seen.items() if v[1] >= horizon}
+        except Error as e:
+            # Chưa chạy migration 005 -> tắt poll, chỉ dùng TTL
+            print(f"[WARN] Không đọc được schedule_versions, cache lịch chỉ dùng TTL: {e}")
+            self.poll_interval = 0
+        finally:
+            self._poll_lock.release()
+
+    def _load_week(self, ma_bs: str, monday: date) -> List[Dict[str, Any]]:
+        rows = fetch_all_sync(DOCTOR_SHIFTS_QUERY, (ma_bs, *day_bounds(monday, monday + timedelta(days=6))))
+        for row in rows:
+            row['ngaythangnam'] = _as_date(row['ngaythangnam'])
+        return rows
+
+    def _poll_due(self) -> bool:
+        return bool(self.poll_interval) and _time.monotonic() - self._last_poll >= self.poll_interval
+
+    def _lookup(self, key: WeekKey) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and _time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[1]
+        return None
+
+    def week_sync(self, ma_bs: str, day: date) -> List[Dict[str, Any]]:
+        """Mọi ca (kể cả 'Nghỉ') trong tuần ISO chứa `day`, sắp theo ngày + giờ bắt đầu."""
+        self._poll_changes()
+        key = self.key_for(ma_bs, day)
+        rows = self._lookup(key)
+        if rows is not None:
+            return rows
+
+        with self._lock:
+            generation = (self._epoch, self._generations.get(ma_bs, 0))
+        loaded_at = _time.monotonic()
+        rows = self._load_week(ma_bs, week_start(day))
+        with self._lock:
+            self._stats["misses"] += 1
+            if generation != (self._epoch, self._generations.get(ma_bs, 0)):
+                # Lịch bị invalidate trong lúc đang nạp -> kết quả có thể đã cũ, không ghi cache
+                self._stats["stale_loads"] += 1
+                return rows
+            self._entries[key] = (loaded_at, rows)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return rows
+
+    async def week(self, ma_bs: str, day: date) -> List[Dict[str, Any]]:
+        # Cache hit và chưa tới lượt poll -> trả ngay, không cần qua executor DB
+        if not self._poll_due():
+            rows = self._lookup(self.key_for(ma_bs, day))
+            if rows is not None:
+                return rows
+        return await run_db(self.week_sync, ma_bs, day)
+
+    async def working_week(self, ma_bs: str, day: date) -> List[Dict[str, Any]]:
+        """Như DOCTOR_WORKING_SHIFTS_QUERY: bỏ các ca 'Nghỉ'."""
+        return [r for r in await self.week(ma_bs, day) if r['trangthai'] != 'Nghỉ']
+
+    async def day(self, ma_bs: str, day: date) -> List[Dict[str, Any]]:
+        return [r for r in await self.week(ma_bs, day) if r['ngaythangnam'] == day]
+
+    def invalidate(self, ma_bs: Optional[str] = None):
+        """Bỏ cache của một bác sĩ (hoặc toàn bộ nếu ma_bs=None)."""
+        with self._lock:
+            if ma_bs is None:
+                self._epoch += 1
+            else:
+                self._generations[ma_bs] = self._generations.get(ma_bs, 0) + 1
+            keys = [k for k in self._entries if ma_bs is None or k[0] == ma_bs]
+            for k in keys:
+                del self._entries[k]
+            self._stats["invalidations"] += len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            data = dict(self._stats)
+            data["entries"] = len(self._entries)
+        lookups = data["hits"] + data["misses"]
+        data["hit_rate"] = round(data["hits"] / lookups, 4) if lookups else 0.0
+        return data
+
+
+schedule_cache = WeeklyScheduleCache()
+
+
+def invalidate_doctor_schedule(ma_bs: Optional[str] = None):
+    schedule_cache.invalidate(ma_bs)
+
+
+def schedule_cache_stats() -> Dict[str, Any]:
+    return schedule_cache.stats()
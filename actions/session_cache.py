@@ -0,0 +1,111 @@
+"""
+Cache theo hội thoại (sender_id) cho các giá trị đã resolve trong một form:
+tenBS -> maBS, tenCK -> maCK, mahen -> dòng lichhen...
+
+- Các bước sau của cùng form (validator kế tiếp, action submit/confirm) dùng lại
+  thay vì truy vấn DB lần nữa.
+- Tối đa SESSION_CACHE_MAX_SENDERS hội thoại (LRU), hội thoại không hoạt động quá
+  SESSION_CACHE_TTL giây bị bỏ; khi form hoàn tất / bị hủy thì finish() xóa luôn.
+- Mỗi giá trị nhớ số round trip DB mà một lần dùng lại giúp tránh; mỗi lần dùng lại được
+  cộng vào bộ đếm "round trip tiết kiệm" của hội thoại, báo cáo khi form hoàn tất.
+"""
+import os
+import threading
+import time as _time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+SESSION_CACHE_MAX_SENDERS = int(os.getenv('SESSION_CACHE_MAX_SENDERS', '5000'))
+SESSION_CACHE_TTL = float(os.getenv('SESSION_CACHE_TTL', '1800'))  # Giây không hoạt động
+
+_MISSING = object()
+
+
+class _Session:
+    __slots__ = ("values", "touched_at", "saved")
+
+    def __init__(self):
+        self.values: Dict[Hashable, Any] = {}  # key -> (value, round_trips)
+        self.touched_at = _time.monotonic()
+        self.saved = 0
+
+
+class ConversationCache:
+    def __init__(self, max_senders: int = SESSION_CACHE_MAX_SENDERS, ttl: float = SESSION_CACHE_TTL):
+        self.max_senders = max(1, max_senders)
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "saved_round_trips": 0, "forms_completed": 0, "evicted": 0}
+        self._saved_by_form: Dict[str, Dict[str, int]] = {}
+
+    def _session(self, sender_id: str, create: bool) -> Optional[_Session]:
+        # Gọi khi đang giữ self._lock
+        now = _time.monotonic()
+        session = self._sessions.get(sender_id)
+        if session is not None and now - session.touched_at > self.ttl:
+            del self._sessions[sender_id]
+            self._stats["evicted"] += 1
+            session = None
+        if session is None:
+            if not create:
+                return None
+            session = self._sessions[sender_id] = _Session()
+            while len(self._sessions) > self.max_senders:
+                self._sessions.popitem(last=False)
+                self._stats["evicted"] += 1
+        session.touched_at = now
+        self._sessions.move_to_end(sender_id)
+        return session
+
+    def get(self, sender_id: str, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            session = self._session(sender_id, create=False)
+            entry = session.values.get(key, _MISSING) if session else _MISSING
+            if entry is _MISSING:
+                self._stats["misses"] += 1
+                return default
+            value, round_trips = entry
+            self._stats["hits"] += 1
+            self._stats["saved_round_trips"] += round_trips
+            session.saved += round_trips
+            return value
+
+    def put(self, sender_id: str, key: Hashable, value: Any, round_trips: int = 1):
+        """round_trips: số truy vấn DB mỗi lần dùng lại value giúp tránh (cộng vào bộ đếm tiết kiệm)."""
+        with self._lock:
+            self._session(sender_id, create=True).values[key] = (value, round_trips)
+
+    def discard(self, sender_id: str, key: Hashable):
+        with self._lock:
+            session = self._sessions.get(sender_id)
+            if session:
+                session.values.pop(key, None)
+
+    def finish(self, sender_id: str, form_name: str) -> int:
+        """Form hoàn tất / bị hủy: xóa cache của hội thoại, trả về số round trip đã tiết kiệm."""
+        with self._lock:
+            session = self._sessions.pop(sender_id, None)
+            saved = session.saved if session else 0
+            self._stats["forms_completed"] += 1
+            per_form = self._saved_by_form.setdefault(form_name, {"forms": 0, "saved_round_trips": 0})
+            per_form["forms"] += 1
+            per_form["saved_round_trips"] += saved
+        print(f"[DEBUG] {form_name} hoàn tất ({sender_id}): tiết kiệm {saved} round trip DB")
+        return saved
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            data = dict(self._stats)
+            data["sessions"] = len(self._sessions)
+            data["by_form"] = {name: dict(v) for name, v in self._saved_by_form.items()}
+        for v in data["by_form"].values():
+            v["avg_saved_per_form"] = round(v["saved_round_trips"] / v["forms"], 2) if v["forms"] else 0.0
+        return data
+
+
+conversation_cache = ConversationCache()
+
+
+def conversation_cache_stats() -> Dict[str, Any]:
+    return conversation_cache.stats()
@@ -0,0 +1,60 @@
+"""
+Giữ chỗ khung giờ khám: chống đặt trùng (maBS, ngày, khunggio) khi nhiều bệnh nhân đặt cùng lúc.
+
+- Giờ khám phải nằm trong một ca làm việc (thoigiankham) còn nhận bệnh.
+- Số lịch hẹn chưa hủy trong khung giờ phải nhỏ hơn SLOT_CAPACITY.
+- Khi ghi lịch hẹn (lock=True): khóa dòng ca làm việc bằng SELECT ... FOR UPDATE,
+  nên các transaction đặt cùng ca bác sĩ được xếp hàng; lượt đến sau thấy
+  lịch hẹn đã commit của lượt trước và bị từ chối.
+"""
+import os
+from datetime import date
+from typing import Optional
+
+from .db import run_db, run_in_connection
+from .queries import DOCTOR_SHIFT_AT_TIME_QUERY, SLOT_BOOKINGS_QUERY, day_bounds
+
+SLOT_CAPACITY = int(os.getenv('SLOT_CAPACITY', '1'))  # Số bệnh nhân tối đa mỗi khung giờ
+
+# Trạng thái ca làm việc không nhận thêm lịch (giống cách tô màu trong validate_date)
+UNAVAILABLE_SHIFT_STATUSES = {"Nghỉ", "Đã đầy", "Hoàn thành", "Full"}
+
+# Lỗi InnoDB có thể thử lại: deadlock, chờ khóa quá lâu
+RETRYABLE_ERRNOS = {1213, 1205}
+
+
+def check_slot(cursor, ma_bs: str, day: date, time_str: str, lock: bool = False) -> Optional[str]:
+    """
+    Trả về None nếu khung giờ còn trống, ngược lại là câu thông báo lỗi.
+    cursor phải là cursor dictionary + buffered. lock=True chỉ dùng bên trong transaction ghi.
+    """
+    lo, hi = day_bounds(day)
+    suffix = " FOR UPDATE" if lock else ""
+
+    cursor.execute(DOCTOR_SHIFT_AT_TIME_QUERY + suffix, (ma_bs, lo, hi, time_str, time_str))
+    shift = cursor.fetchone()
+    if not shift:
+        return f"Giờ {time_str} không nằm trong ca làm việc của bác sĩ ngày {day.strftime('%d/%m/%Y')}."
+    if shift.get('trangthai') in UNAVAILABLE_SHIFT_STATUSES:
+        return f"Ca làm việc chứa giờ {time_str} đang ở trạng thái '{shift['trangthai']}', không nhận lịch."
+
+    # Đọc có khóa (FOR UPDATE) luôn thấy dữ liệu mới nhất đã commit,
+    # kể cả khi snapshot REPEATABLE READ của transaction được tạo trước lúc chờ khóa.
+    cursor.execute(SLOT_BOOKINGS_QUERY + suffix, (ma_bs, lo, hi, time_str))
+    booked = cursor.fetchone()['so_luong']
+    if booked >= SLOT_CAPACITY:
+        return f"Khung giờ {time_str} ngày {day.strftime('%d/%m/%Y')} đã có người đặt. Vui lòng chọn giờ khác."
+    return None
+
+
+def _check_slot_in_connection(conn, ma_bs: str, day: date, time_str: str) -> Optional[str]:
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        return check_slot(cursor, ma_bs, day, time_str)
+    finally:
+        cursor.close()
+
+
+async def check_slot_available(ma_bs: str, day: date, time_str: str) -> Optional[str]:
+    """Kiểm tra (không khóa) cho form validator; việc giữ chỗ thật xảy ra lúc ghi lịch hẹn."""
+    return await run_db(run_in_connection, _check_slot_in_connection, ma_bs, day, time_str)
@@ -0,0 +1,101 @@
+"""
+Prompt gọn cho Gemini khi map triệu chứng -> chuyên khoa.
+
+Thay vì chèn nguyên danh sách tên chuyên khoa (trong ngoặc kép) + khối hướng dẫn dài vào mỗi prompt:
+- mỗi chuyên khoa có một mã ngắn, ổn định: maCK nếu đủ ngắn, không thì K1, K2... theo thứ tự tên;
+- phần đầu prompt (hướng dẫn + bảng mã) là chuỗi tĩnh, dựng một lần cho mỗi snapshot dữ liệu tham chiếu
+  và giống hệt nhau giữa các lần gọi; triệu chứng luôn nằm cuối prompt;
+- Gemini trả về mảng JSON các MÃ, decode() map ngược về tên chuyên khoa (vẫn nhận tên nếu model trả tên).
+"""
+import json
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+_CODE_RE = re.compile(r'[A-Za-z0-9]{1,6}')
+_ARRAY_RE = re.compile(r'\[.*?\]', re.DOTALL)
+_TOKEN_RE = re.compile(r'[A-Za-z0-9]+')
+
+FALLBACK_SPECIALTY = "Nội khoa"
+PEDIATRICS = "nhi khoa"
+
+
+class SpecialtyPromptCodec:
+    def __init__(self, specialties: List[Dict[str, Any]]):
+        """specialties: các dòng {maCK?, tenCK}; thiếu maCK (hoặc maCK quá dài / trùng) thì dùng mã K<n>."""
+        rows = sorted((s for s in specialties if s.get('tenCK')), key=lambda s: s['tenCK'])
+        raw_codes = [str(s.get('maCK') or '') for s in rows]
+        use_ma_ck = (all(_CODE_RE.fullmatch(c) for c in raw_codes)
+                     and len({c.upper() for c in raw_codes}) == len(raw_codes))
+        codes = raw_codes if use_ma_ck else [f"K{i}" for i in range(1, len(rows) + 1)]
+
+        self.names = [s['tenCK'] for s in rows]
+        self.code_to_name = {code.upper(): name for code, name in zip(codes, self.names)}
+        self.name_to_code = {name.lower(): code for code, name in zip(codes, self.names)}
+        self.name_by_lower = {name.lower(): name for name in self.names}
+        self.prefix = self._build_prefix(list(zip(codes, self.names)))
+
+    @classmethod
+    def from_names(cls, names: List[str]) -> "SpecialtyPromptCodec":
+        return cls([{'tenCK': name} for name in names])
+
+    def _build_prefix(self, pairs) -> str:
+        table = ";".join(f"{code}={name}" for code, name in pairs)
+        pediatric = self.name_to_code.get(PEDIATRICS)
+        rules = "Nhiều vấn đề -> liệt kê đủ mã."
+        if pediatric:
+            rules += f" Trẻ em (con, bé) -> {pediatric}."
+        example = ", ".join(f'"{code}"' for code, _ in pairs[:2])
+        return (
+            "Chọn chuyên khoa phù hợp với triệu chứng.\n"
+            f"Mã: {table}\n"
+            f"{rules} Chỉ trả về mảng JSON các mã, ví dụ [{example}], không giải thích.\n"
+            "Triệu chứng: "
+        )
+
+    def build(self, symptom_text: str) -> str:
+        return self.prefix + json.dumps(str(symptom_text), ensure_ascii=False)
+
+    def _lookup(self, item: Any) -> Optional[str]:
+        value = str(item).strip()
+        return self.code_to_name.get(value.upper()) or self.name_by_lower.get(value.lower())
+
+    def decode(self, raw_text: str) -> List[str]:
+        """
+        Mảng mã (hoặc tên) trong câu trả lời -> danh sách tên chuyên khoa, bỏ trùng, giữ thứ tự.
+        Không nhận ra mã / tên nào -> [] (người gọi tự chọn fallback, và không cache câu trả lời đó).
+        """
+        raw_text = (raw_text or "").strip()
+        match = _ARRAY_RE.search(raw_text)  # Gemini hay bọc trong ```json ... ```
+        try:
+            items = json.loads(match.group(0)) if match else []
+        except json.JSONDecodeError:
+            items = []
+        if not isinstance(items, list) or not items:
+            # Không phải JSON: nhận các mã / tên xuất hiện trong text thuần
+            items = [t for t in _TOKEN_RE.findall(raw_text) if t.upper() in self.code_to_name]
+            items += [name for name in self.names if name.lower() in raw_text.lower()]
+
+        result = []
+        for item in items:
+            name = self._lookup(item)
+            if name and name not in result:
+                result.append(name)
+        return result
+
+
+# Codec chỉ phụ thuộc tên chuyên khoa -> dựng lại khi specialty_list_version đổi, không theo mỗi lần nạp snapshot
+_codec: Optional[SpecialtyPromptCodec] = None
+_codec_key = None
+_codec_lock = threading.Lock()
+
+
+def get_specialty_codec(snapshot) -> SpecialtyPromptCodec:
+    global _codec, _codec_key
+    if _codec is not None and _codec_key == snapshot.specialty_list_version:
+        return _codec
+    with _codec_lock:
+        if _codec is None or _codec_key != snapshot.specialty_list_version:
+            _codec = SpecialtyPromptCodec(snapshot.sorted_specialties())
+            _codec_key = snapshot.specialty_list_version
+    return _codec
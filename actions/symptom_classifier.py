@@ -0,0 +1,271 @@
+"""
+Bộ phân loại triệu chứng -> chuyên khoa chạy cục bộ (không gọi mạng), tầng đầu trước Gemini.
+
+Hai nguồn tín hiệu, cộng điểm cho từng chuyên khoa:
+1. Từ điển từ khóa (SYMPTOM_LEXICON), so khớp trên văn bản đã bỏ dấu.
+2. TF-IDF + phân loại theo tâm lớp (nearest centroid, cosine), huấn luyện từ
+   chuyenkhoa.mota, chính các từ khóa, và các câu trong data/nlu.yml
+   (provide_medical_info, provide_decription, entity `symptom`) được gán nhãn
+   yếu bằng từ điển khi từ điển đủ chắc chắn.
+
+Câu nhiều vấn đề ("mẹ đau lưng, con sốt") được tách theo mệnh đề; mỗi mệnh đề
+cho một chuyên khoa kèm độ tin cậy. ActionRecommendDoctor chỉ hỏi Gemini khi
+độ tin cậy < SYMPTOM_CONFIDENCE_THRESHOLD.
+"""
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .name_index import tokenize
+
+SYMPTOM_CONFIDENCE_THRESHOLD = float(os.getenv('SYMPTOM_CONFIDENCE_THRESHOLD', '0.6'))
+SYMPTOM_NLU_PATH = os.getenv(
+    'SYMPTOM_NLU_PATH', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'nlu.yml')
+)
+
+_NLU_INTENTS = {"provide_medical_info", "provide_decription"}
+
+# Chuyên khoa chuẩn -> (các tên gọi khác để khớp với chuyenkhoa.tenCK, từ khóa triệu chứng).
+# Từ khóa viết có dấu cho dễ đọc; khi so khớp cả hai phía đều được bỏ dấu.
+# Tránh từ khóa 1 âm tiết dễ trùng sau khi bỏ dấu (vd. "tai"/"tái", "mat"/"mất", "da"/"dạ").
+SYMPTOM_LEXICON: Dict[str, Tuple[List[str], List[str]]] = {
+    "Nhi khoa": (["nhi", "nhi khoa"], [
+        "bé nhà", "con tôi", "con em", "cháu tôi", "trẻ em", "trẻ nhỏ", "sơ sinh", "bú", "bỏ bú",
+        "quấy khóc", "nôn trớ", "biếng ăn",
+    ]),
+    "Tai mũi họng": (["tai mũi họng", "tai - mũi - họng", "tmh"], [
+        "họng", "đau họng", "viêm họng", "amidan", "ù tai", "đau tai", "điếc", "nghe kém", "mũi",
+        "nghẹt mũi", "chảy nước mũi", "hắt xì", "xoang", "khàn tiếng", "khó nuốt",
+    ]),
+    "Da liễu": (["da liễu"], [
+        "ngứa", "mẩn đỏ", "nổi mẩn", "phát ban", "mụn", "mề đay", "bong tróc", "nứt nẻ", "da khô",
+        "mảng đỏ", "ngứa rát", "lang ben", "chàm",
+    ]),
+    "Tiêu hóa": (["tiêu hóa", "nội tiêu hóa"], [
+        "đau bụng", "tiêu chảy", "dạ dày", "ợ chua", "đầy hơi", "khó tiêu", "táo bón", "buồn nôn",
+        "nôn", "nôn ói", "trào ngược", "đi ngoài", "đầy bụng", "phân lỏng",
+    ]),
+    "Hô hấp": (["hô hấp", "phổi", "nội hô hấp"], [
+        "ho", "ho đờm", "ho khan", "khó thở", "khò khè", "đờm", "phổi", "hen", "thở",
+    ]),
+    "Tim mạch": (["tim mạch", "nội tim mạch"], [
+        "tim đập nhanh", "hồi hộp", "đau ngực", "tức ngực", "huyết áp", "trống ngực", "tim",
+    ]),
+    "Thần kinh": (["thần kinh", "nội thần kinh"], [
+        "đau đầu", "nhức đầu", "chóng mặt", "choáng váng", "tê tay", "tê chân", "mất ngủ", "khó ngủ",
+        "co giật", "run tay", "yếu cơ", "đau nửa đầu", "giật mình", "lo âu",
+    ]),
+    "Cơ xương khớp": (["cơ xương khớp", "xương khớp", "chấn thương chỉnh hình"], [
+        "đau khớp", "đau lưng", "thắt lưng", "vai gáy", "đầu gối", "cứng khớp", "chuột rút",
+        "sưng khớp", "thoát vị", "xương", "đau cổ", "sau gáy",
+    ]),
+    "Mắt": (["mắt", "nhãn khoa"], [
+        "đau mắt", "ngứa mắt", "mắt đỏ", "đỏ mắt", "nhìn mờ", "mờ mắt", "nước mắt", "mắt nhìn", "cận thị",
+    ]),
+    "Răng hàm mặt": (["răng hàm mặt", "nha khoa"], [
+        "răng", "đau răng", "nhức răng", "sâu răng", "hàm", "nướu", "chảy máu chân răng", "sưng má",
+    ]),
+    "Sản phụ khoa": (["sản phụ khoa", "phụ sản", "sản khoa", "phụ khoa"], [
+        "kinh nguyệt", "mang thai", "có thai", "thai", "khí hư", "âm đạo", "trễ kinh", "đau bụng kinh",
+    ]),
+    "Tiết niệu": (["tiết niệu", "thận tiết niệu"], [
+        "tiểu buốt", "tiểu ra máu", "bàng quang", "tiểu nhiều lần", "sỏi thận", "thận", "tiểu rắt",
+    ]),
+    "Nội tiết": (["nội tiết"], [
+        "tiểu đường", "đường huyết", "tuyến giáp", "bướu cổ", "khát nước", "sụt cân",
+    ]),
+    "Ngoại khoa": (["ngoại khoa", "ngoại tổng quát", "khoa ngoại"], [
+        "vết thương", "bỏng", "gãy", "chấn thương", "u cục", "ruột thừa", "đau bụng cấp", "chảy dịch",
+    ]),
+    "Nội khoa": (["nội khoa", "nội tổng quát", "khoa nội"], [
+        "sốt", "mệt mỏi", "cảm cúm", "cúm", "ớn lạnh", "lạnh run", "đau người", "sốt cao",
+    ]),
+}
+
+# Mệnh đề bắt đầu bằng chủ ngữ là trẻ em -> ưu tiên Nhi khoa (giống quy tắc trong prompt Gemini)
+_CHILD_SUBJECT = re.compile(r"^(con|bé|be|cháu|chau|trẻ|tre)\s")
+_PUNCT_SPLIT = re.compile(r"[,;.!?\n]+")
+_SUBJECT_SPLIT = re.compile(r"\s(?=(?:con|bé)\s)")
+
+# Khối lượng "không biết" trong công thức độ tin cậy: điểm thấp -> tin cậy thấp
+_UNKNOWN_MASS = 0.5
+_COSINE_WEIGHT = 2.0
+
+
+def split_clauses(text: str) -> List[str]:
+    """'Mẹ đau lưng, con sốt' -> ['mẹ đau lưng', 'con sốt'] (chữ thường, còn dấu)."""
+    clauses = []
+    for part in _PUNCT_SPLIT.split(unicodedata.normalize("NFC", str(text or "")).lower()):
+        # "con"/"bé" giữa câu mở mệnh đề mới và được giữ lại làm chủ ngữ ("còn" thì không)
+        clauses.extend(_SUBJECT_SPLIT.split(part))
+    return [c.strip() for c in clauses if c.strip()]
+
+
+def load_nlu_examples(path: str = SYMPTOM_NLU_PATH, intents: Iterable[str] = _NLU_INTENTS) -> List[str]:
+    """Đọc câu ví dụ của các intent mô tả triệu chứng + giá trị entity `symptom` trong nlu.yml."""
+    if not path or not os.path.exists(path):
+        return []
+    intents = set(intents)
+    examples, current = [], None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            stripped = line.strip()
+            intent_match = re.match(r"-\s*intent:\s*(\S+)", stripped)
+            if intent_match:
+                current = intent_match.group(1)
+                continue
+            if not stripped.startswith("- "):
+                continue
+            text = stripped[2:]
+            for value in re.findall(r"\[([^\]]+)\]\(symptom\)", text):
+                examples.append(value)
+            if current in intents:
+                examples.append(re.sub(r"\[([^\]]+)\]\([^)]*\)", r"\1", text))
+    return examples
+
+
+class SymptomClassifier:
+    def __init__(self, specialties: List[Dict], nlu_examples: Optional[List[str]] = None):
+        """specialties: các dòng chuyenkhoa (tenCK, mota). Chỉ phân loại vào các chuyên khoa này."""
+        self.labels: List[str] = [s['tenCK'] for s in specialties if s.get('tenCK')]
+        by_folded = {" ".join(tokenize(name)): name for name in self.labels}
+
+        # Gắn từ điển chuẩn vào tên chuyên khoa thực tế trong DB
+        self.keywords: Dict[str, List[Tuple[str, int]]] = {}
+        for canonical, (aliases, words) in SYMPTOM_LEXICON.items():
+            target = None
+            for alias in [canonical] + aliases:
+                target = by_folded.get(" ".join(tokenize(alias)))
+                if target:
+                    break
+            if target:
+                folded_words = {" ".join(tokenize(w)) for w in words}
+                self.keywords.setdefault(target, []).extend((w, len(w.split())) for w in folded_words if w)
+        self.child_label = next((l for l in self.labels if self._canonical_of(l) == "Nhi khoa"), None)
+
+        # Tài liệu huấn luyện TF-IDF
+        docs: List[Tuple[str, str]] = []
+        for s in specialties:
+            if s.get('tenCK'):
+                docs.append((s['tenCK'], f"{s['tenCK']} {s.get('mota') or ''}"))
+        for label, words in self.keywords.items():
+            docs.append((label, " ".join(w for w, _ in words)))
+        self.weak_labeled = 0
+        for example in nlu_examples or []:
+            label, confidence = self._lexicon_top(" ".join(tokenize(example)))
+            if label and confidence >= 0.75:
+                docs.append((label, example))
+                self.weak_labeled += 1
+        self._fit(docs)
+
+    def _canonical_of(self, label: str) -> Optional[str]:
+        folded = " ".join(tokenize(label))
+        for canonical, (aliases, _) in SYMPTOM_LEXICON.items():
+            if folded in {" ".join(tokenize(a)) for a in [canonical] + aliases}:
+                return canonical
+        return None
+
+    # ------------------------------ TF-IDF ------------------------------
+    def _fit(self, docs: List[Tuple[str, str]]):
+        doc_tokens = [(label, tokenize(text)) for label, text in docs]
+        df = Counter()
+        for _, tokens in doc_tokens:
+            df.update(set(tokens))
+        n_docs = max(1, len(doc_tokens))
+        self.idf = {t: math.log((1 + n_docs) / (1 + c)) + 1 for t, c in df.items()}
+
+        sums: Dict[str, Counter] = {}
+        for label, tokens in doc_tokens:
+            sums.setdefault(label, Counter()).update(self._vector(tokens))
+        self.centroids = {label: self._normalize(vec) for label, vec in sums.items()}
+
+    def _vector(self, tokens: List[str]) -> Dict[str, float]:
+        tf = Counter(tokens)
+        return self._normalize({t: (1 + math.log(c)) * self.idf[t] for t, c in tf.items() if t in self.idf})
+
+    @staticmethod
+    def _normalize(vec) -> Dict[str, float]:
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {t: v / norm for t, v in vec.items()}
+
+    # ----------------------------- Phân loại ----------------------------
+    def _lexicon_scores(self, folded_clause: str) -> Dict[str, float]:
+        padded = f" {folded_clause} "
+        scores = {}
+        for label, words in self.keywords.items():
+            score = sum(weight for word, weight in words if f" {word} " in padded)
+            if score:
+                scores[label] = score
+        return scores
+
+    def _lexicon_top(self, folded_clause: str) -> Tuple[Optional[str], float]:
+        scores = sorted(self._lexicon_scores(folded_clause).items(), key=lambda kv: kv[1], reverse=True)
+        if not scores:
+            return None, 0.0
+        second = scores[1][1] if len(scores) > 1 else 0.0
+        return scores[0][0], scores[0][1] / (scores[0][1] + second + _UNKNOWN_MASS)
+
+    def classify_clause(self, clause: str) -> Tuple[Optional[str], float]:
+        """(chuyên khoa, độ tin cậy 0..1) cho một mệnh đề (chữ thường, còn dấu)."""
+        if self.child_label and _CHILD_SUBJECT.match(clause + " "):
+            return self.child_label, 0.95
+
+        folded_clause = " ".join(tokenize(clause))
+
+        scores = Counter(self._lexicon_scores(folded_clause))
+        query = self._vector(folded_clause.split())
+        for label, centroid in self.centroids.items():
+            cosine = sum(w * centroid.get(t, 0.0) for t, w in query.items())
+            if cosine > 0:
+                scores[label] += _COSINE_WEIGHT * cosine
+        if not scores:
+            return None, 0.0
+
+        ranked = scores.most_common(2)
+        top_label, top = ranked[0]
+        second = ranked[1][1] if len(ranked) > 1 else 0.0
+        return top_label, top / (top + second + _UNKNOWN_MASS)
+
+    def predict(self, text: str) -> Tuple[List[str], float]:
+        """
+        Danh sách chuyên khoa (không trùng, theo thứ tự xuất hiện) + độ tin cậy chung
+        (= mệnh đề kém chắc chắn nhất trong các mệnh đề có tín hiệu).
+        """
+        results = []
+        for clause in split_clauses(text):
+            label, confidence = self.classify_clause(clause)
+            if label and confidence >= 0.2:  # Mệnh đề không chứa triệu chứng -> bỏ qua
+                results.append((label, confidence))
+        if not results:
+            return [], 0.0
+        labels = list(dict.fromkeys(label for label, _ in results))
+        return labels, min(confidence for _, confidence in results)
+
+
+_classifier: Optional[SymptomClassifier] = None
+_classifier_key = None
+_classifier_lock = threading.Lock()
+_nlu_examples: Optional[List[str]] = None
+
+
+def get_symptom_classifier(snapshot) -> SymptomClassifier:
+    """
+    Classifier dựng từ snapshot dữ liệu tham chiếu. Khóa theo content_version (tenCK + mota là dữ liệu huấn
+    luyện): refresh TTL với dữ liệu không đổi dùng lại classifier cũ thay vì dựng lại.
+    """
+    global _classifier, _classifier_key, _nlu_examples
+    if _classifier is not None and _classifier_key == snapshot.content_version:
+        return _classifier
+    with _classifier_lock:
+        if _classifier is None or _classifier_key != snapshot.content_version:
+            if _nlu_examples is None:
+                _nlu_examples = load_nlu_examples()
+            _classifier = SymptomClassifier(snapshot.sorted_specialties(), _nlu_examples)
+            _classifier_key = snapshot.content_version
+            print(f"[DEBUG] Symptom classifier built: {len(_classifier.labels)} chuyên khoa, "
+                  f"{_classifier.weak_labeled} câu nlu.yml gán nhãn yếu")
+    return _classifier
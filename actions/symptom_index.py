@@ -0,0 +1,264 @@
+"""
+Chỉ mục vector cục bộ "triệu chứng -> chuyên khoa", tầng sau bộ phân loại từ khóa và trước Gemini.
+
+- Mỗi dòng của chỉ mục là một văn bản có nhãn chuyên khoa: chuyenkhoa.mota, các chẩn đoán cũ
+  (lankham.chuandoan của bác sĩ chỉ thuộc MỘT chuyên khoa), từ khóa của SYMPTOM_LEXICON và các câu
+  trong data/nlu.yml được gán nhãn yếu.
+- Vector là hashing embedding (unigram + bigram đã bỏ dấu, băm vào SYMPTOM_INDEX_DIM chiều, có dấu ±,
+  nhân IDF) nên không cần model hay mạng. Ma trận float32 đã chuẩn hóa L2 được lưu bằng np.save và
+  nạp bằng mmap (np.load(mmap_mode='r')).
+- Truy vấn: cosine = vectors @ q, lấy top-k bằng argpartition, bỏ phiếu theo chuyên khoa.
+
+Dựng lại chỉ mục bằng `python migrations/build_symptom_index.py`; action server tự nạp bản mới
+(kiểm tra mtime của meta.json).
+"""
+import json
+import os
+import threading
+import time as _time
+import uuid
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Chưa cài numpy -> tầng chỉ mục vector bị tắt, các tầng khác vẫn chạy
+    np = None
+
+from .name_index import tokenize
+from .symptom_classifier import SymptomClassifier, split_clauses
+
+SYMPTOM_INDEX_DIR = os.getenv('SYMPTOM_INDEX_DIR', os.path.join('.cache', 'symptom_index'))
+SYMPTOM_INDEX_DIM = int(os.getenv('SYMPTOM_INDEX_DIM', '1024'))
+SYMPTOM_INDEX_TOP_K = int(os.getenv('SYMPTOM_INDEX_TOP_K', '15'))
+SYMPTOM_INDEX_THRESHOLD = float(os.getenv('SYMPTOM_INDEX_THRESHOLD', '0.5'))
+
+_META_FILE = "meta.json"
+# Khối lượng "không biết" trong độ tin cậy, cùng ý nghĩa với symptom_classifier
+_UNKNOWN_MASS = 0.5
+
+# Chẩn đoán cũ -> chuyên khoa của bác sĩ điều trị. Bác sĩ thuộc nhiều chuyên khoa bị bỏ qua (không rõ nhãn).
+DIAGNOSES_QUERY = """
+SELECT lk.chuandoan, cm.maCK, COUNT(*) AS so_lan
+FROM lankham lk
+JOIN (
+    SELECT maBS, MIN(maCK) AS maCK FROM chuyenmon GROUP BY maBS HAVING COUNT(*) = 1
+) cm ON cm.maBS = lk.maBS
+WHERE lk.chuandoan IS NOT NULL AND TRIM(lk.chuandoan) <> ''
+GROUP BY lk.chuandoan, cm.maCK
+"""
+
+
+class HashingEmbedder:
+    """Văn bản -> vector float32 chuẩn hóa L2 (feature hashing, không cần từ điển)."""
+
+    def __init__(self, dim: int = SYMPTOM_INDEX_DIM, idf: Optional["np.ndarray"] = None):
+        self.dim = dim
+        self.idf = idf if idf is not None else np.ones(dim, dtype=np.float32)
+
+    @staticmethod
+    def features(text: str) -> List[str]:
+        tokens = tokenize(text)
+        return tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+
+    def _raw(self, text: str) -> "np.ndarray":
+        vec = np.zeros(self.dim, dtype=np.float32)
+        counts: Dict[Tuple[int, float], int] = {}
+        for feature in self.features(text):
+            h = zlib.crc32(feature.encode("utf-8"))  # Ổn định giữa các tiến trình (khác hash())
+            key = (h % self.dim, 1.0 if h >> 31 else -1.0)
+            counts[key] = counts.get(key, 0) + 1
+        for (bucket, sign), count in counts.items():
+            vec[bucket] += sign * (1.0 + np.log(count))
+        return vec
+
+    def embed(self, text: str) -> "np.ndarray":
+        vec = self._raw(text) * self.idf
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else vec
+
+    @classmethod
+    def fit(cls, texts: Sequence[str], dim: int = SYMPTOM_INDEX_DIM) -> "HashingEmbedder":
+        df = np.zeros(dim, dtype=np.float32)
+        plain = cls(dim)
+        for text in texts:
+            df += plain._raw(text) != 0
+        idf = (np.log((1.0 + len(texts)) / (1.0 + df)) + 1.0).astype(np.float32)
+        return cls(dim, idf)
+
+
+class SymptomIndex:
+    def __init__(self, vectors: "np.ndarray", labels: List[str], embedder: HashingEmbedder,
+                 meta: Optional[Dict] = None):
+        self.vectors = vectors          # (N, dim) float32, có thể là memmap
+        self.labels = labels            # nhãn chuyên khoa của từng dòng
+        self.embedder = embedder
+        self.meta = meta or {}
+        self._label_ids = {}
+        self._row_label = np.array([self._label_ids.setdefault(l, len(self._label_ids)) for l in labels],
+                                   dtype=np.int32)
+        self._label_names = list(self._label_ids)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def rank_clause(self, clause: str, k: int = SYMPTOM_INDEX_TOP_K,
+                    allowed: Optional[set] = None) -> List[Tuple[str, float]]:
+        """Các chuyên khoa theo tổng cosine của chúng trong k dòng gần nhất (giảm dần, chỉ phiếu > 0)."""
+        if not len(self):
+            return []
+        query = self.embedder.embed(clause)
+        if not query.any():
+            return []
+        scores = self.vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[scores[top] > 0]
+        if not len(top):
+            return []
+        votes = np.bincount(self._row_label[top], weights=scores[top], minlength=len(self._label_names))
+        ranked = []
+        for i in np.argsort(-votes):
+            if votes[i] <= 0:
+                break
+            if allowed is None or self._label_names[i] in allowed:
+                ranked.append((self._label_names[i], float(votes[i])))
+        return ranked
+
+    def search_clause(self, clause: str, k: int = SYMPTOM_INDEX_TOP_K,
+                      allowed: Optional[set] = None) -> Tuple[Optional[str], float]:
+        """(chuyên khoa, độ tin cậy 0..1) cho một mệnh đề: bỏ phiếu có trọng số của k dòng gần nhất."""
+        ranked = self.rank_clause(clause, k, allowed)
+        if not ranked:
+            return None, 0.0
+        best = ranked[0][1]
+        second = ranked[1][1] if len(ranked) > 1 else 0.0
+        return ranked[0][0], best / (best + second + _UNKNOWN_MASS)
+
+    def predict(self, text: str, allowed: Optional[Sequence[str]] = None,
+                k: int = SYMPTOM_INDEX_TOP_K) -> Tuple[List[str], float]:
+        """Giống SymptomClassifier.predict: chuyên khoa theo từng mệnh đề + độ tin cậy thấp nhất."""
+        allowed_set = set(allowed) if allowed is not None else None
+        results = []
+        for clause in split_clauses(text):
+            label, confidence = self.search_clause(clause, k, allowed_set)
+            if label and confidence >= 0.2:
+                results.append((label, confidence))
+        if not results:
+            return [], 0.0
+        labels = list(dict.fromkeys(label for label, _ in results))
+        return labels, min(confidence for _, confidence in results)
+
+
+# ----------------------------------------------------------------------
+# Dựng / lưu / nạp
+# ----------------------------------------------------------------------
+def collect_documents(specialties: List[Dict], diagnoses: Sequence[Tuple[str, str]] = (),
+                      nlu_examples: Optional[List[str]] = None) -> Tuple[List[str], List[str], Dict[str, int]]:
+    """
+    specialties: dòng chuyenkhoa (tenCK, mota); diagnoses: (chuandoan, tenCK).
+    Trả về (texts, labels, số dòng theo nguồn).
+    """
+    classifier = SymptomClassifier(specialties)  # Dùng từ điển đã gắn với tên chuyên khoa trong DB
+    texts, labels, sources = [], [], {"mota": 0, "chuandoan": 0, "lexicon": 0, "nlu": 0}
+
+    def add(text, label, source):
+        if text and str(text).strip() and label:
+            texts.append(str(text).strip())
+            labels.append(label)
+            sources[source] += 1
+
+    for s in specialties:
+        add(f"{s['tenCK']} {s.get('mota') or ''}", s.get('tenCK'), "mota")
+    valid = set(classifier.labels)
+    for text, label in diagnoses:
+        if label in valid:
+            add(text, label, "chuandoan")
+    for label, words in classifier.keywords.items():
+        for word, _ in words:
+            add(word, label, "lexicon")
+    for example in nlu_examples or []:
+        label, confidence = classifier._lexicon_top(" ".join(tokenize(example)))
+        if label and confidence >= 0.75:
+            add(example, label, "nlu")
+    return texts, labels, sources
+
+
+def build_index(texts: List[str], labels: List[str], dim: int = SYMPTOM_INDEX_DIM) -> SymptomIndex:
+    embedder = HashingEmbedder.fit(texts, dim)
+    vectors = np.vstack([embedder.embed(t) for t in texts]).astype(np.float32) if texts \
+        else np.zeros((0, dim), dtype=np.float32)
+    return SymptomIndex(vectors, list(labels), embedder)
+
+
+def save_index(index: SymptomIndex, path: str = SYMPTOM_INDEX_DIR, extra_meta: Optional[Dict] = None) -> Dict:
+    """
+    Ghi vectors/idf vào file mới có build_id rồi thay meta.json (os.replace, nguyên tử):
+    tiến trình đang đọc bản cũ không bao giờ thấy vectors và nhãn lệch nhau.
+    """
+    os.makedirs(path, exist_ok=True)
+    build_id = uuid.uuid4().hex[:12]
+    vectors_file, idf_file = f"vectors-{build_id}.npy", f"idf-{build_id}.npy"
+    np.save(os.path.join(path, vectors_file), np.ascontiguousarray(index.vectors, dtype=np.float32))
+    np.save(os.path.join(path, idf_file), index.embedder.idf.astype(np.float32))
+    meta = dict(extra_meta or {})
+    meta.update({
+        "build_id": build_id, "built_at": _time.strftime("%Y-%m-%d %H:%M:%S"), "dim": index.embedder.dim,
+        "rows": len(index), "vectors": vectors_file, "idf": idf_file, "labels": index.labels,
+    })
+    tmp = os.path.join(path, f"{_META_FILE}.{build_id}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp, os.path.join(path, _META_FILE))
+
+    # Dọn file của các bản dựng cũ (tiến trình đang mmap bản cũ vẫn đọc được trên Linux)
+    for name in os.listdir(path):
+        if name.endswith(".npy") and build_id not in name:
+            try:
+                os.remove(os.path.join(path, name))
+            except OSError:
+                pass
+    return meta
+
+
+def load_index(path: str = SYMPTOM_INDEX_DIR) -> Optional[SymptomIndex]:
+    """Nạp chỉ mục (vectors mmap chỉ đọc). None nếu chưa dựng / thiếu numpy / file hỏng."""
+    if np is None:
+        return None
+    try:
+        with open(os.path.join(path, _META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = np.load(os.path.join(path, meta["vectors"]), mmap_mode="r")
+        idf = np.load(os.path.join(path, meta["idf"]))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[WARN] Không nạp được chỉ mục triệu chứng ({path}): {e}")
+        return None
+    if vectors.shape != (meta["rows"], meta["dim"]) or len(meta["labels"]) != meta["rows"]:
+        print(f"[WARN] Chỉ mục triệu chứng ({path}) không khớp meta.json, bỏ qua")
+        return None
+    return SymptomIndex(vectors, meta["labels"], HashingEmbedder(meta["dim"], idf), meta)
+
+
+_index: Optional[SymptomIndex] = None
+_index_mtime: Optional[float] = None
+_index_lock = threading.Lock()
+
+
+def get_symptom_index(path: str = SYMPTOM_INDEX_DIR) -> Optional[SymptomIndex]:
+    """Chỉ mục dùng chung trong tiến trình; nạp lại khi meta.json đổi (vừa chạy build_symptom_index)."""
+    global _index, _index_mtime
+    if np is None:
+        return None
+    try:
+        mtime = os.path.getmtime(os.path.join(path, _META_FILE))
+    except OSError:
+        return None
+    if _index_mtime == mtime:
+        return _index
+    with _index_lock:
+        if _index_mtime != mtime:
+            _index = load_index(path)
+            _index_mtime = mtime
+            if _index is not None:
+                print(f"[DEBUG] Symptom index loaded: {len(_index)} dòng, build {_index.meta.get('build_id')}")
+    return _index
@@ -0,0 +1,59 @@
+"""
+Benchmark: throughput của action server với N hội thoại đồng thời,
+TRƯỚC (truy vấn blocking ngay trong event loop) và SAU (await qua executor DB).
+
+Mỗi "hội thoại" thực hiện một số truy vấn `SELECT SLEEP(x)` để mô phỏng
+truy vấn chậm (cần MySQL thật, cấu hình qua .env như action server).
+
+Chạy từ thư mục gốc repo:
+    python benchmarks/bench_async_db.py --conversations 50 --queries 3 --latency-ms 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actions.db import fetch_all, fetch_all_sync, pool_stats  # noqa: E402
+
+QUERY = "SELECT SLEEP(%s) AS s"
+
+
+async def conversation_blocking(queries: int, latency: float):
+    # Cách cũ: gọi driver blocking ngay trong coroutine -> chặn cả event loop
+    for _ in range(queries):
+        fetch_all_sync(QUERY, (latency,))
+
+
+async def conversation_async(queries: int, latency: float):
+    for _ in range(queries):
+        await fetch_all(QUERY, (latency,))
+
+
+async def run_mode(conversation, n: int, queries: int, latency: float) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*(conversation(queries, latency) for _ in range(n)))
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--queries", type=int, default=3, help="Số truy vấn mỗi hội thoại")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Độ trễ giả lập của mỗi truy vấn")
+    args = parser.parse_args()
+
+    latency = args.latency_ms / 1000
+    print(f"{'N':>5} | {'mode':<9} | {'elapsed (s)':>11} | {'conv/s':>8}")
+    print("-" * 44)
+    for n in args.conversations:
+        for label, conv in (("blocking", conversation_blocking), ("async", conversation_async)):
+            elapsed = asyncio.run(run_mode(conv, n, args.queries, latency))
+            print(f"{n:>5} | {label:<9} | {elapsed:>11.3f} | {n / elapsed:>8.1f}")
+    print("\nPool:", pool_stats())
+
+
+if __name__ == "__main__":
+    main()
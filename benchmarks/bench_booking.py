@@ -0,0 +1,167 @@
+"""
+Benchmark độ trễ đường ghi đặt lịch (p50/p99), TRƯỚC và SAU khi gộp thành một transaction.
+
+- before: luồng cũ của ActionSubmitBooking - mở 2 kết nối mới, SELECT maBS,
+  SELECT MAX(mahen), SELECT maCK rồi INSERT (4 round trip).
+- after : write_booking() - maBS/maCK lấy từ snapshot, mahen từ block đã giữ trước,
+  INSERT khóa idempotency + INSERT lichhen trên 1 kết nối của pool.
+
+Mọi INSERT đều bị ROLLBACK nên không để lại dữ liệu. Cần MySQL thật đã chạy migrations.
+
+Lịch được đặt vào một khung giờ thật còn trống trong ca làm việc (thoigiankham) của bác sĩ, vì
+write_booking giữ chỗ (check_slot lock=True) và từ chối giờ nằm ngoài ca. Bác sĩ không có ca nào
+sắp tới còn nhận lịch -> tạo một ca tạm (ngày +365, 08:00-12:00) và xóa khi chạy xong.
+
+    python benchmarks/bench_booking.py --patient BN0001 --runs 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, time as dtime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector  # noqa: E402
+
+from actions.booking import resolve_booking_ids, write_booking  # noqa: E402
+from actions.db import DB_CONFIG, execute_sync, fetch_all_sync, get_connection, run_in_connection  # noqa: E402
+from actions.id_allocator import appointment_ids  # noqa: E402
+from actions.refdata import reference_cache  # noqa: E402
+from actions.slots import UNAVAILABLE_SHIFT_STATUSES, check_slot  # noqa: E402
+
+FIXTURE_START, FIXTURE_END = "08:00:00", "12:00:00"
+
+
+def _slot_error(conn, ma_bs, day, khunggio):
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        return check_slot(cursor, ma_bs, day, khunggio)
+    finally:
+        cursor.close()
+
+
+def _hhmm(value):
+    if isinstance(value, timedelta):
+        return (datetime.min + value).time().strftime('%H:%M')
+    if isinstance(value, dtime):
+        return value.strftime('%H:%M')
+    return str(value)[:5]
+
+
+@contextmanager
+def bookable_slot(ma_bs):
+    """(ngày, "HH:MM") còn nhận lịch của bác sĩ: ca thật sắp tới nếu có, không thì ca tạm (xóa khi xong)."""
+    shifts = fetch_all_sync(
+        "SELECT ngaythangnam, giobatdau, trangthai FROM thoigiankham "
+        "WHERE maBS = %s AND ngaythangnam > %s ORDER BY ngaythangnam, giobatdau LIMIT 50",
+        (ma_bs, date.today()),
+    )
+    for shift in shifts:
+        if shift['trangthai'] in UNAVAILABLE_SHIFT_STATUSES:
+            continue
+        day, khunggio = shift['ngaythangnam'], _hhmm(shift['giobatdau'])
+        if isinstance(day, datetime):
+            day = day.date()
+        if run_in_connection(_slot_error, ma_bs, day, khunggio) is None:
+            yield day, khunggio
+            return
+
+    day = date.today() + timedelta(days=365)
+    execute_sync(
+        "INSERT INTO thoigiankham (maBS, ngaythangnam, giobatdau, gioketthuc, trangthai) VALUES (%s, %s, %s, %s, %s)",
+        (ma_bs, day, FIXTURE_START, FIXTURE_END, 'Trống'),
+    )
+    try:
+        yield day, FIXTURE_START[:5]
+    finally:
+        execute_sync(
+            "DELETE FROM thoigiankham WHERE maBS = %s AND ngaythangnam = %s AND giobatdau = %s AND gioketthuc = %s",
+            (ma_bs, day, FIXTURE_START, FIXTURE_END),
+        )
+
+
+def booking_before(patient_id, doctor_name, specialty_name, day, khunggio):
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    cursor.execute("SELECT maBS FROM bacsi WHERE tenBS = %s", (doctor_name,))
+    maBS = cursor.fetchone()['maBS']
+    cursor.execute("SELECT MAX(CAST(SUBSTRING(mahen, 3) AS UNSIGNED)) AS max_id FROM lichhen")
+    max_id = cursor.fetchone()['max_id'] or 0
+    cursor.close()
+    conn.close()
+
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    cursor.execute("SELECT maCK FROM chuyenkhoa WHERE tenCK = %s", (specialty_name,))
+    maCK = cursor.fetchone()['maCK']
+    cursor.execute(
+        "INSERT INTO lichhen (mahen, maBN, maBS, ngaythangnam, khunggio, trangthai, maCK, mota) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+        (f"LH{max_id + 1:08d}", patient_id, maBS, day, khunggio, 'ChuaKham', maCK, 'benchmark'),
+    )
+    conn.rollback()
+    cursor.close()
+    conn.close()
+
+
+def booking_after(patient_id, doctor_name, specialty_name, day, khunggio):
+    ids = resolve_booking_ids(reference_cache.get_sync(), doctor_name, specialty_name)
+    mahen = appointment_ids.next_id()
+    conn = get_connection()
+    try:
+        result = write_booking(conn, uuid.uuid4().hex * 2, mahen, patient_id, doctor_name, specialty_name,
+                               day, khunggio, 'benchmark', ids["maBS"], ids["maCK"], commit=False)
+        conn.rollback()
+    finally:
+        conn.close()
+    # Lần đo chỉ có nghĩa khi INSERT lichhen thật sự chạy (không bị từ chối / replay rồi thoát sớm)
+    if result.get("mahen") != mahen or "error" in result or result.get("replayed"):
+        raise SystemExit(f"write_booking không ghi lịch hẹn, kết quả đo không hợp lệ: {result}")
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def measure(fn, runs, *args):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patient", required=True, help="maBN có thật (khóa ngoại của lichhen)")
+    parser.add_argument("--doctor", help="tenBS (mặc định: bác sĩ đầu tiên có chuyên khoa)")
+    parser.add_argument("--specialty", help="tenCK của bác sĩ đó")
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    snap = reference_cache.get_sync()
+    doctor_name, specialty_name = args.doctor, args.specialty
+    if not doctor_name:
+        row = snap.doctor_specialty_rows(snap.active_doctors())[0]
+        doctor_name, specialty_name = row['tenBS'], row['tenCK']
+
+    ma_bs = resolve_booking_ids(snap, doctor_name, specialty_name)["maBS"]
+    with bookable_slot(ma_bs) as (day, khunggio):
+        booking_args = (args.patient, doctor_name, specialty_name, day, khunggio)
+        print(f"Đặt lịch thử cho {doctor_name} / {specialty_name} lúc {khunggio} ngày {day:%d/%m/%Y}, "
+              f"{args.runs} lần mỗi chế độ (rollback)")
+        for label, fn in (("before", booking_before), ("after", booking_after)):
+            fn(*booking_args)  # warm-up
+            samples = measure(fn, args.runs, *booking_args)
+            print(f"{label:>6}: p50={statistics.median(samples):7.2f} ms  p99={percentile(samples, 99):7.2f} ms  "
+                  f"max={max(samples):7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Đếm số event "bot" trong tracker và số byte phản hồi webhook của các câu trả lời dạng danh sách, trước và
+sau khi gộp mỗi dòng thành MỘT tin nhắn (nút bấm gộp lại):
+
+- ValidateCancelAppointmentForm.validate_appointment_date: danh sách lịch hẹn trong ngày để chọn lịch cần hủy
+- ActionSearchDoctor: kết quả tìm bác sĩ theo tên
+- ActionCheckUpcomingAppointments: lịch hẹn sắp tới
+
+Lịch sử giả lập của một bệnh nhân "bận": --sessions phiên, mỗi phiên xem lịch hẹn sắp tới (--upcoming lịch),
+mở form hủy lịch cho một ngày có --per-day lịch, tìm bác sĩ với --matches kết quả. Chạy offline.
+
+    python benchmarks/bench_coalesced_messages.py --sessions 20 --upcoming 5 --per-day 4 --matches 6
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_html_templates import _Tracker  # noqa: E402
+from bench_response_modes import RecordingDispatcher, sample_appointments  # noqa: E402
+
+from actions.html_templates import (  # noqa: E402
+    StylesheetTracker,
+    render_appointment_choices,
+    render_doctor_search,
+    render_upcoming_appointments,
+)
+
+
+def day_appointments(count):
+    return [{"mahen": f"LH{i:05d}", "tenBS": f"Nguyễn Văn {chr(65 + i)}", "tenCK": "Nội khoa",
+             "khunggio": timedelta(hours=7 + i), "mota": "Tái khám, đau bụng"} for i in range(count)]
+
+
+def search_matches(count):
+    return [{"maBS": f"BS{i:03d}", "tenBS": f"Nguyễn Văn {chr(65 + i)}", "tenCK": "Nội khoa",
+             "sdtBS": f"09000000{i:02d}"} for i in range(count)]
+
+
+def select_payload(appt):
+    return f"/select_appointment{{\"appointment_id\":\"{appt['mahen']}\"}}"
+
+
+def detail_payload(doc):
+    return f"/view_doctor_detail{{\"doctor_id\":\"{doc['maBS']}\"}}"
+
+
+def cancel_payload(item):
+    return f"/cancel_specific_appointment{{\"appointment_id\":\"{item['mahen']}\"}}"
+
+
+# ----------------------------------------------------------------------
+# Trước: mỗi dòng một utter_message (giữ nguyên mã cũ của actions.py)
+# ----------------------------------------------------------------------
+def legacy_cancel_list(d, date_input, appointments):
+    d.utter_message(text=f"<b>📋 Danh sách lịch hẹn ngày </b> {date_input}:", metadata={"parse_mode": "HTML"})
+    for idx, appt in enumerate(appointments, 1):
+        appt_text = f"{idx}. 🩺 <b>Bác sĩ {appt['tenBS']}</b> ({appt['tenCK']})<br>Giờ: {appt['khunggio']}<br>Mã lịch: {appt['mahen']}<br>Mô tả: {appt['mota']}"
+        d.utter_message(text=appt_text, buttons=[{"title": "Chọn lịch này", "payload": select_payload(appt)}])
+    d.utter_message(text=f"\nTổng cộng: {len(appointments)} lịch hẹn. Vui lòng chọn lịch cần hủy.")
+
+
+def legacy_search(d, keyword, doctors):
+    d.utter_message(
+        text=f"""
+            <div style="font-family: Arial, sans-serif; font-size: 15px; color: #333;">
+                <div style="font-weight: bold; color: #0d6efd; margin-bottom: 8px;">
+                    🔍 Tìm thấy {len(doctors)} bác sĩ phù hợp với từ khóa "<span style='color:#dc3545;'>{keyword}</span>":
+                </div>
+            </div>
+            """,
+        metadata={"html": True}
+    )
+    for doc in doctors:
+        doc_card = f"""
+                <div style="background: #f8f9fa; border-left: 4px solid #0d6efd;
+                            border-radius: 8px; padding: 10px 14px; margin-bottom: 8px;">
+                    <div style="font-weight: bold; color: #0d6efd; margin-bottom: 4px;">
+                        🩺 Bác sĩ {doc['tenBS']}
+                    </div>
+                    <div><strong>Chuyên khoa:</strong> {doc['tenCK']}</div>
+                    <div><strong>SĐT:</strong> {doc['sdtBS']}</div>
+                </div>
+            """
+        d.utter_message(text=doc_card, buttons=[{"title": "📄 Xem chi tiết", "payload": detail_payload(doc)}],
+                        metadata={"html": True})
+
+
+def legacy_upcoming(d, items):
+    title_message = """
+                <div style="font-family: Arial, sans-serif; font-size: 15px; color: #333;
+                            background: #fffbef; border-left: 5px solid #ffc107; border-radius: 8px;
+                            padding: 12px 16px; margin: 10px 0 4px 0;">
+                    <div style="font-weight: bold; color: #856404; margin-bottom: 8px;">
+                        🔔 **Thông báo lịch hẹn sắp tới:**
+                    </div>
+                </div>
+                """
+    d.utter_message(text=title_message, html=True)
+    for item in items:
+        html_appt = f"""
+                    <div style="font-family: Arial, sans-serif; font-size: 15px; color: #333;
+                                background: #fffbef; border-left: 5px solid #ffc107; border-radius: 8px;
+                                padding: 8px 10px; margin: 0 0 4px 0;">
+                        <div><strong>Ngày:</strong> {item['day']}</div>
+                        <div><strong>Giờ:</strong> {item['time']}</div>
+                        <div><strong>Bác sĩ:</strong> {item['tenBS']} ({item['tenCK']})</div>
+                        <div><strong>Mã hẹn:</strong> {item['mahen']}</div>
+                        <div><strong>Mô tả:</strong> {item['mota']}</div>
+                    </div>
+                    """
+        d.utter_message(text=html_appt, buttons=[{"title": f"❌ Hủy lịch hẹn này ({item['mahen']})",
+                                                  "payload": cancel_payload(item)}], html=True)
+    footer_message = """
+                <div style="font-family: Arial, sans-serif; font-size: 14px; color: #333; margin-top: 4px;">
+                    👉 Vui lòng đến đúng giờ.
+                </div>
+                """
+    d.utter_message(text=footer_message, html=True)
+
+
+# ----------------------------------------------------------------------
+# Sau: một tin nhắn cho cả danh sách (giống actions.py hiện tại, chế độ html)
+# ----------------------------------------------------------------------
+def coalesced_cancel_list(d, styles, tracker, date_input, appointments):
+    buttons = [{"title": f"{idx}. Chọn lịch {appt['mahen']}", "payload": select_payload(appt)}
+               for idx, appt in enumerate(appointments, 1)]
+    d.utter_message(text=styles.wrap(tracker, render_appointment_choices(date_input, appointments), "list"),
+                    buttons=buttons, metadata={"parse_mode": "HTML"})
+
+
+def coalesced_search(d, styles, tracker, keyword, doctors):
+    buttons = [{"title": f"📄 Xem chi tiết BS {doc['tenBS']}", "payload": detail_payload(doc)} for doc in doctors]
+    d.utter_message(text=styles.wrap(tracker, render_doctor_search(keyword, doctors), "list"),
+                    buttons=buttons, metadata={"html": True})
+
+
+def coalesced_upcoming(d, styles, tracker, items):
+    buttons = [{"title": f"❌ Hủy lịch hẹn {item['mahen']}", "payload": cancel_payload(item)} for item in items]
+    d.utter_message(text=styles.wrap(tracker, render_upcoming_appointments(items), "appointment"),
+                    buttons=buttons, html=True)
+
+
+def history(coalesced, sessions, upcoming, per_day, matches):
+    """Trả về danh sách lượt (mỗi lượt = các event bot của một action)."""
+    styles = StylesheetTracker(mode="session")
+    items, day, found = sample_appointments(upcoming), day_appointments(per_day), search_matches(matches)
+    turns = []
+    for n in range(sessions):
+        tracker = _Tracker("busy-patient")
+        tracker.events = [{"event": "session_started", "timestamp": float(n)}]
+        for step in ("upcoming", "cancel", "search"):
+            d = RecordingDispatcher()
+            if step == "upcoming":
+                coalesced_upcoming(d, styles, tracker, items) if coalesced else legacy_upcoming(d, items)
+            elif step == "cancel":
+                (coalesced_cancel_list(d, styles, tracker, "10/03/2025", day) if coalesced
+                 else legacy_cancel_list(d, "10/03/2025", day))
+            else:
+                coalesced_search(d, styles, tracker, "Nguyễn", found) if coalesced else legacy_search(d, "Nguyễn", found)
+            turns.append(d.events)
+    return turns
+
+
+def webhook_bytes(events):
+    """Phần "responses" của phản hồi action server: mỗi tin nhắn một dict."""
+    responses = [{"text": ev["text"], "buttons": ev["data"]["buttons"] or [], "custom": ev["data"]["custom"] or {},
+                  **ev["metadata"]} for ev in events]
+    return len(json.dumps(responses, ensure_ascii=False).encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--upcoming", type=int, default=5, help="Số lịch hẹn sắp tới")
+    parser.add_argument("--per-day", type=int, default=4, help="Số lịch hẹn trong ngày muốn hủy")
+    parser.add_argument("--matches", type=int, default=6, help="Số bác sĩ khớp khi tìm theo tên")
+    args = parser.parse_args()
+
+    results = {}
+    for label, coalesced in (("trước", False), ("sau", True)):
+        turns = history(coalesced, args.sessions, args.upcoming, args.per_day, args.matches)
+        events = sum(len(t) for t in turns)
+        nbytes = sum(webhook_bytes(t) for t in turns)
+        tracker_bytes = sum(len(json.dumps(ev, ensure_ascii=False).encode("utf-8")) for t in turns for ev in t)
+        results[label] = (events, nbytes, tracker_bytes)
+        print(f"{label:>5}: {events:5d} event bot ({events / len(turns):.1f} mỗi lượt), "
+              f"webhook {nbytes:8d} byte, tracker store {tracker_bytes:8d} byte")
+    (e0, w0, t0), (e1, w1, t1) = results["trước"], results["sau"]
+    print(f"event bot -{1 - e1 / e0:.0%}, webhook -{1 - w1 / w0:.0%}, tracker store -{1 - t1 / t0:.0%}")
+
+
+if __name__ == "__main__":
+    main()
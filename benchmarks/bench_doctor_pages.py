@@ -0,0 +1,63 @@
+"""
+So sánh danh sách tất cả bác sĩ dạng một khối (cả danh sách trong một tin nhắn, như trước) với phân trang
+keyset (actions/pagination.py, DOCTOR_LIST_PAGE_SIZE dòng mỗi trang): byte mỗi tin nhắn, bộ nhớ cấp phát
+tạm thời lớn nhất mỗi request (tracemalloc) và thời gian dựng. Snapshot giả lập, chạy offline.
+
+    python benchmarks/bench_doctor_pages.py --doctors 300 1000 --page-size 10
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_html_templates import timed  # noqa: E402
+from bench_listing_cache import sample_tables  # noqa: E402
+
+from actions import pagination  # noqa: E402
+from actions.html_templates import render_all_doctors  # noqa: E402
+from actions.listing_cache import all_doctors_page  # noqa: E402
+from actions.refdata import ReferenceSnapshot  # noqa: E402
+
+
+def whole_list(snapshot):
+    """Cách cũ: dựng và render TẤT CẢ bác sĩ trong một khối."""
+    doctors = [{'tenBS': doc['tenBS'],
+                'chuyenkhoa': ", ".join(dict.fromkeys(snapshot.specialty_names_of(doc['maBS']))) or None}
+               for doc in snapshot.active_doctors()]
+    return render_all_doctors(doctors)
+
+
+def peak_kib(fn):
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doctors", type=int, nargs="*", default=[300, 1000])
+    parser.add_argument("--specialties", type=int, default=30)
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=300)
+    args = parser.parse_args()
+
+    pagination.DOCTOR_LIST_PAGE_SIZE = args.page_size
+
+    for n in args.doctors:
+        snapshot = ReferenceSnapshot(1, *sample_tables(n, args.specialties))
+        middle = f">{snapshot.active_doctor_keys[n // 2][1]}"  # Một trang ở giữa danh sách
+        cases = [("cả danh sách", lambda: whole_list(snapshot)),
+                 ("một trang", lambda: all_doctors_page(snapshot, middle).html)]
+        print(f"{n} bác sĩ:")
+        for label, fn in cases:
+            size = len(fn().encode("utf-8"))
+            print(f"  {label:13s}: {size:8d} byte/tin nhắn, cấp phát tạm {peak_kib(fn):8.1f} KiB, "
+                  f"{timed(fn, args.repeat):8.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
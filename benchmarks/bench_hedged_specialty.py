@@ -0,0 +1,84 @@
+"""
+Mô phỏng độ trễ trả lời gợi ý chuyên khoa: LUÔN chờ Gemini so với hedging (actions/hedge.py).
+
+Gemini được giả lập bằng asyncio.sleep với độ trễ log-normal (trung vị --median-ms, độ lệch --sigma)
+và tỉ lệ lỗi --error-rate; dự đoán cục bộ coi như có sẵn. Chạy offline, không cần API key.
+In ra tỉ lệ path thắng, p50/p90/p99 độ trễ trả lời của hai cách, và số lời gọi Gemini chạy nốt
+trong nền (sẽ ghi cache).
+
+    python benchmarks/bench_hedged_specialty.py --requests 300 --median-ms 900 --budget-ms 800
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actions.hedge import HedgeRecorder, hedge  # noqa: E402
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--median-ms", type=float, default=900, help="Trung vị độ trễ Gemini giả lập")
+    parser.add_argument("--sigma", type=float, default=0.6, help="Độ lệch của log-normal")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--budget-ms", type=float, default=800, help="SPECIALTY_HEDGE_BUDGET (ms)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # Cùng một chuỗi độ trễ cho cả hai cách để so sánh công bằng
+    plan = [(rng.lognormvariate(0, args.sigma) * args.median_ms / 1000, rng.random() < args.error_rate)
+            for _ in range(args.requests)]
+    completed_in_background = 0
+
+    async def gemini(latency, fails):
+        nonlocal completed_in_background
+        await asyncio.sleep(latency)
+        completed_in_background += 1
+        return None if fails else ["Tiêu hóa"]
+
+    async def always_wait(latency, fails):
+        t0 = time.perf_counter()
+        result = await gemini(latency, fails) or ["Nội khoa"]
+        return result, (time.perf_counter() - t0) * 1000
+
+    async def hedged(recorder, latency, fails):
+        t0 = time.perf_counter()
+        result, _ = await hedge(gemini(latency, fails), ["Tiêu hóa"], args.budget_ms / 1000, recorder)
+        return result, (time.perf_counter() - t0) * 1000
+
+    async def run():
+        nonlocal completed_in_background
+        baseline = await asyncio.gather(*(always_wait(lat, err) for lat, err in plan))
+        recorder = HedgeRecorder()
+        completed_in_background = 0
+        hedged_rows = await asyncio.gather(*(hedged(recorder, lat, err) for lat, err in plan))
+        answered = completed_in_background
+        await asyncio.sleep(max(lat for lat, _ in plan) + 0.05)  # Chờ các lời gọi nền chạy xong
+        return baseline, hedged_rows, recorder, completed_in_background - answered
+
+    baseline, hedged_rows, recorder, background = asyncio.run(run())
+    for name, rows in (("chờ Gemini", baseline), ("hedge", hedged_rows)):
+        ms = [r[1] for r in rows]
+        print(f"{name:>10}: p50={statistics.median(ms):8.1f} ms  p90={percentile(ms, 0.9):8.1f} ms  "
+              f"p99={percentile(ms, 0.99):8.1f} ms  max={max(ms):8.1f} ms")
+    stats = recorder.stats()
+    wins = stats["wins"]
+    print(f"path thắng: {wins}  ({wins.get('remote', 0) / args.requests:.1%} dùng kết quả Gemini); "
+          f"{background} lời gọi Gemini chạy nốt trong nền sau khi đã trả lời")
+    print(f"độ trễ Gemini (kể cả chạy nền): {stats['latency'].get('remote')}")
+
+
+if __name__ == "__main__":
+    main()
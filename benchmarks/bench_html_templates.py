@@ -0,0 +1,400 @@
+"""
+Đo thời gian render và số byte mỗi tin nhắn HTML: cách cũ (f-string nối bằng +=, mỗi tin nhắn kèm
+nguyên khối <style>) so với template (hàm f-string, escape HTML) + stylesheet gửi một lần mỗi phiên
+(actions/html_templates.py). Dữ liệu giả lập, chạy offline.
+
+Với mỗi action in: byte tin nhắn cũ, byte tin nhắn mới đầu phiên (kèm <style>) và các tin sau
+(chỉ class), thời gian render trung bình (µs).
+
+    python benchmarks/bench_html_templates.py --repeat 2000 --rows 8
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actions.html_templates import (  # noqa: E402
+    StylesheetTracker,
+    render_prescription_table,
+    render_specialty_doctors,
+    render_week_schedule,
+)
+
+DAYS_VN = ["Thứ 2", "Thứ 3", "Thứ 4", "Thứ 5", "Thứ 6", "Thứ 7", "Chủ Nhật"]
+
+
+def day_name(weekday_index):
+    return DAYS_VN[weekday_index]
+
+
+def format_time(time_obj):
+    if isinstance(time_obj, timedelta):
+        return (datetime.min + time_obj).time().strftime('%H:%M')
+    elif isinstance(time_obj, dtime):
+        return time_obj.strftime('%H:%M')
+    return str(time_obj)
+
+
+# ----------------------------------------------------------------------
+# Cách cũ: giữ nguyên mã sinh HTML trước đây của actions.py để so sánh
+# ----------------------------------------------------------------------
+def legacy_week_schedule(tenBS, start_of_week, end_of_week, schedule_by_date):
+    html_table = f"""
+    <style>
+        .schedule-table {{
+            width: 100%; max-width: 450px; border-collapse: collapse;
+            font-family: Arial, sans-serif; background: white;
+            border-radius: 8px; overflow: hidden; box-shadow: 0 2px 5px rgba(0,0,0,0.1);
+        }}
+        .schedule-table th, .schedule-table td {{
+            padding: 10px 12px; text-align: left; border-bottom: 1px solid #eee;
+        }}
+        .schedule-table th {{
+            background-color: #f8faff; color: #007bff; font-size: 14px;
+        }}
+        .schedule-table .date-cell {{
+            font-weight: bold; color: #333; font-size: 14px;
+        }}
+        .schedule-table .shift-cell div {{
+            margin-bottom: 4px;
+        }}
+        /* CSS trạng thái không còn cần thiết nhưng để lại cũng không sao */
+        .status-work {{ color: green; font-weight: bold; }}
+        .status-off {{ color: red; font-weight: bold; }}
+    </style>
+    <div style="font-family: Arial, sans-serif; font-size: 15px; margin-bottom: 8px;">
+        📅 <strong>Lịch làm việc tuần này của Bác sĩ {tenBS}</strong><br>
+        (Từ {start_of_week.strftime('%d/%m')} đến {end_of_week.strftime('%d/%m')})
+    </div>
+    <table class="schedule-table">
+        <thead>
+            <tr>
+                <th>Ngày</th>
+                <th>Ca làm việc</th>
+            </tr>
+        </thead>
+        <tbody>
+    """
+
+    # Điền dữ liệu vào bảng
+    for date_obj, shifts in sorted(schedule_by_date.items()):
+        day_name_vn = day_name(date_obj.weekday())
+        date_str = date_obj.strftime('%d/%m')
+
+        shifts_html = ""
+        for shift in shifts:
+            start_time = format_time(shift['giobatdau'])
+            end_time = format_time(shift['gioketthuc'])
+
+            # SỬA ĐỔI: Bỏ hiển thị trạng thái
+            shifts_html += f"<div>{start_time} - {end_time}</div>"
+
+        html_table += f"""
+            <tr>
+                <td class="date-cell" style="padding-right: 20px;">{day_name_vn} ({date_str})</td>
+                <td class="shift-cell" style="padding-left: 20px;">{shifts_html}</td>
+            </tr>
+        """
+
+    html_table += "</tbody></table>"
+    return html_table
+
+
+def legacy_form_schedule(tenBS, start_of_week, end_of_week, schedule_rows, schedule_by_date):
+    html_table = f"""
+    <style>
+        .schedule-table {{ width: 100%; max-width: 450px; border-collapse: collapse; font-family: Arial, sans-serif; background: white; border-radius: 8px; overflow: hidden; box-shadow: 0 2px 5px rgba(0,0,0,0.1); margin-top: 8px; }}
+        .schedule-table th, .schedule-table td {{ padding: 10px 12px; text-align: left; border-bottom: 1px solid #eee; }}
+        .schedule-table th {{ background-color: #f8faff; color: #007bff; font-size: 14px; }}
+        .schedule-table .date-cell {{ font-weight: bold; color: #333; font-size: 14px; width: 40%; }}
+        .status-ghi {{ color: #dc3545; font-weight: bold; font-style: italic; }}
+        .status-ok {{ color: #28a745; font-weight: bold; }}
+        .status-full {{ color: #6c757d; text-decoration: line-through; }}
+        .empty-schedule {{ text-align: center; color: #888; font-style: italic; padding: 20px; }}
+    </style>
+    <div style="font-family: Arial, sans-serif; font-size: 15px; margin-bottom: 8px; margin-top: 8px;">
+        📅 <strong>Lịch làm việc tuần này của Bác sĩ {tenBS}</strong><br>(Từ {start_of_week.strftime('%d/%m')} đến {end_of_week.strftime('%d/%m')})
+    </div>
+    <table class="schedule-table">
+        <thead><tr><th>Ngày</th><th>Ca làm việc</th></tr></thead><tbody>
+    """
+
+    if not schedule_rows:
+        html_table += "<tr><td colspan='2' class='empty-schedule'>Không có lịch làm việc trong tuần này.</td></tr>"
+    else:
+        for date_obj, shifts in sorted(schedule_by_date.items()):
+            day_vn = day_name(date_obj.weekday())
+            d_str = date_obj.strftime('%d/%m')
+            shifts_html = ""
+            for shift in shifts:
+                s_start = format_time(shift['giobatdau'])
+                s_end = format_time(shift['gioketthuc'])
+                stt = shift['trangthai']
+                cls = "status-ghi" if stt == "Nghỉ" else ("status-full" if stt in ["Đã đầy", "Hoàn thành"] else "status-ok")
+                shifts_html += f"<div class='shift-item'>{s_start} - {s_end} <span class='{cls}'>({stt})</span></div>"
+            html_table += f"<tr><td class='date-cell'>{day_vn} ({d_str})</td><td>{shifts_html}</td></tr>"
+
+    html_table += "</tbody></table>"
+    return html_table
+
+
+def legacy_prescription_table(prescriptions, title):
+    # Tạo HTML table với styling đẹp
+    html_table = f"""
+    <style>
+        .prescription-container {{
+            font-family: Arial, sans-serif;
+            /* SỬA ĐỔI:
+               - Bỏ max-width để khung co lại
+               - Thêm width: fit-content để tự động co theo nội dung
+               - Thêm min-width để không bị quá hẹp
+               - Chuyển box-shadow, border-radius, overflow từ con sang cha
+            */
+            width: fit-content;
+            min-width: 350px;
+            margin: 10px 0;
+            border-radius: 8px;
+            overflow: hidden;
+            box-shadow: 0 2px 8px rgba(0,0,0,0.1);
+
+            /* ================================= */
+            /* ===== THÊM MỚI THEO YÊU CẦU ===== */
+            border: 1px solid #dee2e6; /* <-- Thêm đường viền này */
+            /* ================================= */
+        }}
+        .prescription-title {{
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            color: white;
+            padding: 12px 16px;
+            font-weight: bold;
+            font-size: 16px;
+            /* SỬA ĐỔI: Bỏ border-radius, container cha sẽ xử lý */
+        }}
+        .prescription-table {{
+            /* SỬA ĐỔI: Bỏ width: 100% để bảng co lại theo nội dung */
+            border-collapse: collapse;
+            background: white;
+            /* SỬA ĐỔI: Bỏ box-shadow, border-radius, overflow */
+        }}
+        .prescription-table thead {{
+            background: #f8f9fa;
+        }}
+        .prescription-table th {{
+            padding: 12px 8px;
+            text-align: left;
+            font-weight: bold;
+            color: #495057;
+            border-bottom: 2px solid #dee2e6;
+            font-size: 14px;
+        }}
+        .prescription-table td {{
+            padding: 10px 8px;
+            border-bottom: 1px solid #e9ecef;
+            font-size: 14px;
+            color: #333;
+        }}
+        .prescription-table tr:last-child td {{
+            border-bottom: none;
+        }}
+        .prescription-table tr:hover {{
+            background: #f8f9fa;
+        }}
+        .medicine-name {{
+            font-weight: 600;
+            color: #667eea;
+        }}
+        .dosage {{
+            color: #28a745;
+            font-weight: 500;
+        }}
+        .prescription-footer {{
+            background: #f8f9fa;
+            padding: 10px 16px;
+            font-size: 13px;
+            color: #6c757d;
+            border-top: 2px solid #dee2e6;
+            /* SỬA ĐỔI: Bỏ border-radius và margin-top */
+        }}
+        @media screen and (max-width: 600px) {{
+            /* SỬA ĐỔI: Đảm bảo container vẫn chiếm 100% trên màn hình nhỏ */
+            .prescription-container {{
+                width: 100%;
+                min-width: 0;
+            }}
+            .prescription-table th,
+            .prescription-table td {{
+                font-size: 12px;
+                padding: 8px 6px;
+            }}
+            .prescription-title {{
+                font-size: 14px;
+            }}
+        }}
+    </style>
+
+    <div class="prescription-container">
+        <div class="prescription-title">
+            💊 {title}
+        </div>
+        <table class="prescription-table">
+            <thead>
+                <tr>
+                    <th>STT</th>
+                    <th>Tên thuốc</th>
+                    <th>Liều lượng</th>
+                    <th>Số lượng</th>
+                    <th>Đơn vị</th>
+                    <th>Thời gian SD</th>
+                </tr>
+            </thead>
+            <tbody>
+    """
+
+    # Thêm các dòng dữ liệu
+    for idx, med in enumerate(prescriptions, 1):
+        html_table += f"""
+                <tr>
+                    <td>{idx}</td>
+                    <td class="medicine-name">{med['tenThuoc']}</td>
+                    <td class="dosage">{med['lieuluong']}</td>
+                    <td>{med['soluong']}</td>
+                    <td>{med['donvi']}</td>
+                    <td>{med['thoigianSD']}</td>
+                </tr>
+        """
+
+    html_table += f"""
+            </tbody>
+        </table>
+        <div class="prescription-footer">
+            <strong>Tổng số thuốc:</strong> {len(prescriptions)} loại |
+            <strong>Mã lần khám:</strong> {prescriptions[0]['maLanKham']}
+        </div>
+    </div>
+    """
+    return html_table
+
+
+def legacy_specialty_doctors(spec, doctors):
+    # Bao gồm cả Tiêu đề (Header) và nội dung bên trong
+    html_block = f"""
+    <div style="font-family: Arial, sans-serif; border: 1px solid #cce0ff; border-radius: 10px; overflow: hidden; margin-bottom: 15px; box-shadow: 0 2px 5px rgba(0,0,0,0.05);">
+        <div style="background-color: #e7f3ff; color: #0056b3; padding: 10px 15px; font-weight: bold; border-bottom: 1px solid #cce0ff;">
+            🏥 Danh sách bác sĩ {spec}
+        </div>
+        <div style="padding: 10px 15px; background-color: #fff;">
+    """
+
+    # 3. Lặp qua từng bác sĩ để nối chuỗi HTML
+    for i, doc in enumerate(doctors):
+        # Tạo đường kẻ mờ giữa các bác sĩ (trừ người cuối cùng)
+        border_style = "border-bottom: 1px dashed #eee; padding-bottom: 8px; margin-bottom: 8px;" if i < len(doctors) - 1 else ""
+
+        html_block += f"""
+        <div style="{border_style}">
+            <div style="font-weight: bold; color: #333; font-size: 15px;">👨‍⚕️ BS {doc['tenBS']}</div>
+            <div style="color: #666; font-size: 14px;">📞 SĐT: {doc['sdtBS']}</div>
+        </div>
+        """
+
+    # 4. Đóng thẻ div
+    html_block += "</div></div>"
+    return html_block
+
+
+
+# ----------------------------------------------------------------------
+# Cách mới: giống các action hiện tại
+# ----------------------------------------------------------------------
+def new_days(schedule_by_date, with_status):
+    return [
+        (f"{day_name(d.weekday())} ({d.strftime('%d/%m')})",
+         [(format_time(s['giobatdau']), format_time(s['gioketthuc']), s['trangthai'] if with_status else None)
+          for s in shifts])
+        for d, shifts in sorted(schedule_by_date.items())
+    ]
+
+
+def sample_data(rows):
+    start = date(2025, 3, 3)
+    end = start + timedelta(days=6)
+    schedule_rows = [
+        {"ngaythangnam": start + timedelta(days=i), "giobatdau": timedelta(hours=h), "gioketthuc": timedelta(hours=h + 4),
+         "trangthai": ["Trống", "Đã đầy", "Nghỉ"][(i + h) % 3]}
+        for i in range(6) for h in (7, 13)
+    ]
+    schedule_by_date = {}
+    for row in schedule_rows:
+        schedule_by_date.setdefault(row["ngaythangnam"], []).append(row)
+    prescriptions = [
+        {"maLanKham": "LK000123", "tenThuoc": f"Thuốc số {i}", "lieuluong": "500mg", "soluong": 10 + i,
+         "donvi": "viên", "thoigianSD": "Sáng, tối sau ăn"}
+        for i in range(rows)
+    ]
+    doctors = [{"maBS": f"BS{i:03d}", "tenBS": f"Nguyễn Văn {chr(65 + i)}", "sdtBS": f"09000000{i:02d}",
+                "tenCK": "Nội khoa"} for i in range(3)]
+    return start, end, schedule_rows, schedule_by_date, prescriptions, doctors
+
+
+def timed(fn, repeat, rounds=5):
+    """µs mỗi lần gọi: lấy vòng nhanh nhất trong `rounds` vòng để bớt nhiễu của máy đo."""
+    fn()
+    best = float("inf")
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, time.perf_counter() - t0)
+    return best / repeat * 1e6
+
+
+class _Tracker:
+    def __init__(self, sender_id):
+        self.sender_id = sender_id
+        self.events = [{"event": "session_started", "timestamp": 1.0}]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=8, help="Số dòng thuốc trong toa")
+    args = parser.parse_args()
+
+    start, end, schedule_rows, schedule_by_date, prescriptions, doctors = sample_data(args.rows)
+    s, e = start.strftime('%d/%m'), end.strftime('%d/%m')
+    cases = [  # (action, nhóm CSS, cách cũ, cách mới)
+        ("ActionShowDoctorSchedule", "schedule",
+         lambda: legacy_week_schedule("Nguyễn Văn A", start, end, schedule_by_date),
+         lambda: render_week_schedule("Nguyễn Văn A", s, e, new_days(schedule_by_date, False))),
+        ("_show_doctor_schedule_in_form", "schedule",
+         lambda: legacy_form_schedule("Nguyễn Văn A", start, end, schedule_rows, schedule_by_date),
+         lambda: render_week_schedule("Nguyễn Văn A", s, e, new_days(schedule_by_date, True))),
+        ("_display_prescription_table", "prescription",
+         lambda: legacy_prescription_table(prescriptions, "Toa thuốc ngày 03/03/2025"),
+         lambda: render_prescription_table("Toa thuốc ngày 03/03/2025", prescriptions)),
+        ("ActionRecommendDoctor", "doctor",
+         lambda: legacy_specialty_doctors("Nội khoa", doctors),
+         lambda: render_specialty_doctors("Nội khoa", doctors)),
+    ]
+
+    nbytes = lambda text: len(text.encode("utf-8"))  # noqa: E731
+    print(f"{'action':32s} {'cũ':>8s} {'mới/đầu':>8s} {'mới/sau':>8s}   {'cũ µs':>7s} {'mới µs':>7s}")
+    total_old = total_new = 0
+    for name, sheet, legacy, new in cases:
+        styles = StylesheetTracker(mode="session")
+        tracker = _Tracker(name)
+        first, later = nbytes(styles.wrap(tracker, new(), sheet)), nbytes(styles.wrap(tracker, new(), sheet))
+        old = nbytes(legacy())
+        old_us = timed(legacy, args.repeat)
+        new_us = timed(lambda: styles.wrap(tracker, new(), sheet), args.repeat)
+        total_old += old
+        total_new += later
+        print(f"{name:32s} {old:8d} {first:8d} {later:8d}   {old_us:7.1f} {new_us:7.1f}")
+    print(f"Sau tin nhắn đầu phiên: {total_new} / {total_old} byte cho 4 tin nhắn (-{1 - total_new / total_old:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Đo thời gian phục vụ các danh sách tĩnh (tất cả chuyên khoa / tất cả bác sĩ) khi render lại mỗi request
+so với đọc fragment render sẵn trong actions/listing_cache.py. Snapshot giả lập, chạy offline.
+
+Đồng thời kiểm tra khóa version: nạp lại cùng dữ liệu -> giữ fragment (hit), đổi dữ liệu -> render lại.
+
+    python benchmarks/bench_listing_cache.py --doctors 300 --specialties 30 --repeat 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_html_templates import _Tracker, timed  # noqa: E402
+
+from actions.html_templates import StylesheetTracker  # noqa: E402
+from actions.listing_cache import LISTINGS, ListingCache  # noqa: E402
+from actions.refdata import ReferenceSnapshot  # noqa: E402
+
+
+def sample_tables(n_doctors, n_specialties):
+    specialties = [{"maCK": f"CK{i:03d}", "tenCK": f"Chuyên khoa {i:03d}",
+                    "mota": "Khám, chẩn đoán và điều trị các bệnh lý thường gặp ở người lớn và trẻ em." if i % 3 else None}
+                   for i in range(n_specialties)]
+    doctors = [{"maBS": f"BS{i:04d}", "tenBS": f"Bác sĩ {i:04d}", "sdtBS": f"09{i:08d}", "emailBS": None,
+                "gioithieu": None, "vaiTro": "DOCTOR", "xoa": 0} for i in range(n_doctors)]
+    links = [{"maBS": d["maBS"], "maCK": specialties[(i + k) % n_specialties]["maCK"]}
+             for i, d in enumerate(doctors) for k in range(1 + i % 2)]
+    return doctors, specialties, links
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doctors", type=int, default=300)
+    parser.add_argument("--specialties", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    tables = sample_tables(args.doctors, args.specialties)
+    snapshot = ReferenceSnapshot(1, *tables)
+    cache = ListingCache()
+    t0 = time.perf_counter()
+    cache.prerender(snapshot)
+    print(f"Render trước {len(LISTINGS)} danh sách: {(time.perf_counter() - t0) * 1e3:.1f} ms, "
+          f"{cache.stats()['bytes']}")
+
+    styles = StylesheetTracker(mode="session")
+    tracker = _Tracker("bench")
+    for name, build in LISTINGS.items():
+        sheet = "specialty" if name == "all_specialties" else "list"
+        uncached = timed(lambda: styles.wrap(tracker, build(snapshot).html, sheet), args.repeat)
+        cached = timed(lambda: styles.wrap(tracker, cache.get(snapshot, name).html, sheet), args.repeat)
+        print(f"{name:16s}: render mỗi request {uncached:8.1f} µs, fragment render sẵn {cached:6.2f} µs "
+              f"(x{uncached / cached:.0f})")
+
+    # Refresh TTL với cùng dữ liệu: version mới, nội dung như cũ -> vẫn hit
+    reloaded = ReferenceSnapshot(2, *sample_tables(args.doctors, args.specialties))
+    before = cache.stats()
+    cache.get(reloaded, "all_doctors")
+    assert reloaded.content_version == snapshot.content_version
+    assert cache.stats()["prerenders"] == before["prerenders"], "refresh cùng dữ liệu không được render lại"
+
+    # Đổi tên một bác sĩ (lên đầu danh sách, trang đầu) -> content_version mới -> render lại, nội dung mới
+    doctors, specialties, links = sample_tables(args.doctors, args.specialties)
+    doctors[0] = dict(doctors[0], tenBS="An Đổi Tên")
+    changed = ReferenceSnapshot(3, doctors, specialties, links)
+    assert changed.content_version != snapshot.content_version
+    assert "An Đổi Tên" in cache.get(changed, "all_doctors").html
+    assert cache.stats()["prerenders"] == before["prerenders"] + 1
+    print(f"Kiểm tra version OK: {cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
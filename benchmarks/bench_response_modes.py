@@ -0,0 +1,133 @@
+"""
+Đo số byte tracker store phải lưu cho một hội thoại mẫu ở hai chế độ trả lời (RESPONSE_MODE):
+html (tin nhắn HTML từ actions/html_templates.py, CSS gửi một lần mỗi phiên) và json (custom payload
+từ actions/payloads.py). Dữ liệu giả lập, chạy offline.
+
+Hội thoại: xem lịch bác sĩ, xem lịch trong form đặt lịch, danh sách toàn bộ bác sĩ, danh sách bác sĩ theo
+chuyên khoa, gợi ý bác sĩ, toa thuốc, lịch hẹn sắp tới. Mỗi tin nhắn được ghi như event "bot" mà Rasa
+lưu vào tracker store ({"event": "bot", "text", "data": {...}, "metadata", "timestamp"}), đo bằng json.dumps.
+
+    python benchmarks/bench_response_modes.py --doctors 40 --rows 8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_html_templates import _Tracker, new_days, sample_data  # noqa: E402
+
+from actions.html_templates import (  # noqa: E402
+    StylesheetTracker,
+    render_all_doctors,
+    render_prescription_table,
+    render_specialty_doctor_contacts,
+    render_specialty_doctors,
+    render_upcoming_appointments,
+    render_week_schedule,
+)
+from actions.payloads import (  # noqa: E402
+    appointments_payload,
+    doctor_list_payload,
+    doctor_schedule_payload,
+    prescription_payload,
+)
+
+
+class RecordingDispatcher:
+    """Ghi lại tin nhắn như event BotUttered trong tracker store."""
+
+    def __init__(self):
+        self.events = []
+
+    def utter_message(self, text=None, buttons=None, json_message=None, **kwargs):
+        self.events.append({
+            "event": "bot",
+            "timestamp": time.time(),
+            "metadata": kwargs,
+            "text": text,
+            "data": {"elements": None, "quick_replies": None, "buttons": buttons or None,
+                     "attachment": None, "image": None, "custom": json_message},
+        })
+
+
+def booking_buttons(doctors):
+    return [{"title": f"📅 Đặt lịch BS {doc['tenBS']}",
+             "payload": f"/request_appointment{{\"doctor_id\":\"{doc['maBS']}\"}}"} for doc in doctors]
+
+
+def sample_appointments(count):
+    return [{"day": f"Thứ {2 + i}, {3 + i:02d}/03/2025", "time": "08:00", "tenBS": f"Nguyễn Văn {chr(65 + i)}",
+             "tenCK": "Nội khoa", "mahen": f"LH{i:05d}", "mota": "Khám tổng quát, đau đầu kéo dài"}
+            for i in range(count)]
+
+
+def cancel_buttons(items):
+    return [[{"title": f"❌ Hủy lịch hẹn {item['mahen']}",
+              "payload": f"/cancel_specific_appointment{{\"appointment_id\":\"{item['mahen']}\"}}"}] for item in items]
+
+
+def conversation(mode, n_doctors, rows):
+    """Phát lại các lệnh utter_message của từng action (giống actions.py) ở chế độ mode."""
+    start, end, _, schedule_by_date, prescriptions, doctors = sample_data(rows)
+    s, e = start.strftime('%d/%m'), end.strftime('%d/%m')
+    everyone = [{"maBS": f"BS{i:03d}", "tenBS": f"Bác sĩ {i:03d}", "sdtBS": f"0900{i:06d}",
+                 "emailBS": f"bs{i:03d}@benhvien.vn", "tenCK": "Nội khoa", "chuyenkhoa": "Nội khoa, Tim mạch"}
+                for i in range(n_doctors)]
+    in_specialty = everyone[:max(1, n_doctors // 8)]
+    appointments = sample_appointments(3)
+    title = "Toa thuốc ngày 03/03/2025"
+
+    d = RecordingDispatcher()
+    tracker = _Tracker(f"bench-{mode}")
+    styles = StylesheetTracker(mode="session")
+    if mode == "json":
+        d.utter_message(json_message=doctor_schedule_payload("Nguyễn Văn A", s, e, new_days(schedule_by_date, False)))
+        d.utter_message(json_message=doctor_schedule_payload("Nguyễn Văn A", s, e, new_days(schedule_by_date, True)))
+        d.utter_message(json_message=doctor_list_payload(
+            "Danh sách bác sĩ trong hệ thống", everyone, ["tenBS", "chuyenkhoa"]))
+        d.utter_message(json_message=doctor_list_payload(
+            "Danh sách bác sĩ chuyên khoa Nội khoa", in_specialty, ["tenBS", "sdtBS", "emailBS"], specialty="Nội khoa"))
+        d.utter_message(json_message=doctor_list_payload(
+            "Danh sách bác sĩ Nội khoa", doctors, ["tenBS", "sdtBS"],
+            buttons=[[b] for b in booking_buttons(doctors)], specialty="Nội khoa"))
+        d.utter_message(json_message=prescription_payload(title, prescriptions))
+        d.utter_message(json_message=appointments_payload(appointments, cancel_buttons(appointments)))
+    else:
+        wrap = lambda html, sheet: styles.wrap(tracker, html, sheet)  # noqa: E731
+        d.utter_message(text=wrap(render_week_schedule("Nguyễn Văn A", s, e, new_days(schedule_by_date, False)),
+                                  "schedule"), html=True)
+        d.utter_message(text=wrap(render_week_schedule("Nguyễn Văn A", s, e, new_days(schedule_by_date, True)),
+                                  "schedule"), html=True)
+        d.utter_message(text=wrap(render_all_doctors(everyone), "list"), html=True)
+        d.utter_message(text=wrap(render_specialty_doctor_contacts("Nội khoa", in_specialty), "list"), html=True)
+        d.utter_message(text=wrap(render_specialty_doctors("Nội khoa", doctors), "doctor"),
+                        buttons=booking_buttons(doctors), html=True)
+        d.utter_message(text=wrap(render_prescription_table(title, prescriptions), "prescription"))
+        d.utter_message(text=wrap(render_upcoming_appointments(appointments), "appointment"),
+                        buttons=[b for row in cancel_buttons(appointments) for b in row], html=True)
+    return d.events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doctors", type=int, default=40, help="Số bác sĩ trong danh sách toàn hệ thống")
+    parser.add_argument("--rows", type=int, default=8, help="Số dòng thuốc trong toa")
+    args = parser.parse_args()
+
+    nbytes = lambda event: len(json.dumps(event, ensure_ascii=False).encode("utf-8"))  # noqa: E731
+    totals = {}
+    for mode in ("html", "json"):
+        events = conversation(mode, args.doctors, args.rows)
+        sizes = [nbytes(ev) for ev in events]
+        totals[mode] = sum(sizes)
+        print(f"{mode:>4}: {len(events):2d} event bot, {totals[mode]:7d} byte "
+              f"(lớn nhất {max(sizes)} byte, trung bình {totals[mode] // len(events)} byte)")
+    print(f"json / html: {totals['json'] / totals['html']:.0%} "
+          f"(-{1 - totals['json'] / totals['html']:.0%} byte tracker store mỗi hội thoại)")
+
+
+if __name__ == "__main__":
+    main()
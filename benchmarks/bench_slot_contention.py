@@ -0,0 +1,122 @@
+"""
+Benchmark tranh chấp khung giờ: hàng trăm bệnh nhân cùng lúc đặt cùng (các) khung giờ buổi sáng
+của một bác sĩ. Kiểm tra không khung giờ nào vượt SLOT_CAPACITY, đồng thời đo p50/p99.
+
+Mỗi lượt đặt đi qua đúng đường ghi của ActionSubmitBooking (write_booking, có COMMIT);
+các lịch hẹn + khóa idempotency tạo ra được xóa khi kết thúc. Cần MySQL thật đã chạy migrations.
+
+    python benchmarks/bench_slot_contention.py --patient BN0001 --patients 300 --times 08:00 08:30
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patient", required=True, help="maBN có thật (khóa ngoại của lichhen)")
+    parser.add_argument("--patients", type=int, default=300, help="Số lượt đặt đồng thời")
+    parser.add_argument("--times", nargs="*", help="Các khung giờ tranh chấp (mặc định: giờ bắt đầu ca)")
+    parser.add_argument("--pool-overflow", type=int, default=45, help="DB_POOL_MAX_OVERFLOW cho lần chạy này")
+    args = parser.parse_args()
+
+    # Pool đọc cấu hình lúc import -> đặt trước khi import actions.*
+    os.environ.setdefault("DB_POOL_MAX_OVERFLOW", str(args.pool_overflow))
+    os.environ.setdefault("DB_POOL_TIMEOUT", "60")
+
+    from actions.booking import write_booking
+    from actions.db import execute_sync, fetch_all_sync, get_connection, pool_stats
+    from actions.id_allocator import appointment_ids
+    from actions.queries import SLOT_BOOKINGS_QUERY, day_bounds
+    from actions.refdata import reference_cache
+    from actions.slots import SLOT_CAPACITY, UNAVAILABLE_SHIFT_STATUSES
+
+    snap = reference_cache.get_sync()
+    shifts = fetch_all_sync(
+        "SELECT maBS, ngaythangnam, giobatdau, trangthai FROM thoigiankham "
+        "WHERE ngaythangnam > CURDATE() ORDER BY ngaythangnam, giobatdau LIMIT 200"
+    )
+    shift = next((s for s in shifts if snap.doctor_specialties.get(s['maBS'])
+                  and s['trangthai'] not in UNAVAILABLE_SHIFT_STATUSES), None)
+    if not shift:
+        print("Không có ca làm việc tương lai nào để chạy benchmark.")
+        sys.exit(1)
+
+    doctor = snap.doctor_by_id(shift['maBS'])
+    ma_ck = snap.doctor_specialties[shift['maBS']][0]
+    day = shift['ngaythangnam']
+    day = day.date() if hasattr(day, 'date') else day
+    start = shift['giobatdau']
+    default_time = f"{int(start.total_seconds()) // 3600:02d}:{int(start.total_seconds()) % 3600 // 60:02d}" \
+        if hasattr(start, 'total_seconds') else str(start)[:5]
+    times = args.times or [default_time]
+
+    print(f"{args.patients} lượt đặt đồng thời -> bác sĩ {doctor['tenBS']} ngày {day:%d/%m/%Y}, "
+          f"khung giờ {', '.join(times)} (SLOT_CAPACITY={SLOT_CAPACITY})")
+
+    results, latencies = Counter(), []
+    booked_ids = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.patients)
+
+    def patient(i):
+        time_str = times[i % len(times)]
+        mahen = appointment_ids.next_id()
+        barrier.wait()
+        started = time.perf_counter()
+        conn = get_connection()
+        try:
+            outcome = write_booking(conn, uuid.uuid4().hex * 2, mahen, args.patient, doctor['tenBS'], None,
+                                    day, time_str, 'benchmark tranh chấp', doctor['maBS'], ma_ck)
+            kind = "ok" if "mahen" in outcome else "rejected"
+        except Exception as e:
+            kind = f"error:{type(e).__name__}"
+            outcome = {}
+        finally:
+            conn.close()
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            results[kind] += 1
+            latencies.append(elapsed)
+            if kind == "ok":
+                booked_ids.append(outcome["mahen"])
+
+    threads = [threading.Thread(target=patient, args=(i,)) for i in range(args.patients)]
+    wall = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - wall
+
+    over_capacity = []
+    for time_str in times:
+        count = fetch_all_sync(SLOT_BOOKINGS_QUERY, (doctor['maBS'], *day_bounds(day), time_str))[0]['so_luong']
+        if count > SLOT_CAPACITY:
+            over_capacity.append((time_str, count))
+
+    # Dọn dữ liệu benchmark
+    for mahen in booked_ids:
+        execute_sync("DELETE FROM lichhen WHERE mahen = %s", (mahen,))
+        execute_sync("DELETE FROM booking_idempotency WHERE mahen = %s", (mahen,))
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(round(0.99 * (len(latencies) - 1))))]
+    print(f"Kết quả: {dict(results)} trong {wall:.2f}s")
+    print(f"Độ trễ: p50={statistics.median(latencies):.2f} ms  p99={p99:.2f} ms  max={latencies[-1]:.2f} ms")
+    print(f"Pool: {pool_stats()}")
+    if over_capacity:
+        print(f"FAIL: khung giờ bị đặt vượt sức chứa: {over_capacity}")
+        sys.exit(1)
+    print("PASS: không khung giờ nào bị đặt trùng")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+So sánh kích thước prompt triệu chứng -> chuyên khoa: prompt cũ (nguyên danh sách tên + khối hướng dẫn dài)
+với prompt gọn của actions/specialty_prompt.py (mã ngắn + phần đầu tĩnh).
+
+- Mặc định offline: danh sách chuyên khoa chuẩn, nhân thêm chuyên khoa giả (--scale) để xem prompt
+  tăng theo số chuyên khoa thế nào; token ước lượng bằng estimate_tokens (≈ ký tự / LLM_CHARS_PER_TOKEN).
+- --gemini: gọi Gemini thật với cả hai prompt trên EVAL_SET, in độ chính xác + token thật (usageMetadata)
+  và độ trễ từ usage meter. Cần GEMINI_API_KEY.
+
+    python benchmarks/bench_specialty_prompt.py --scale 1 2 4
+    python benchmarks/bench_specialty_prompt.py --db --gemini
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_symptom_tiers import EVAL_SET, canonical_specialties, db_specialties, score  # noqa: E402
+
+from actions.llm_admission import estimate_tokens  # noqa: E402
+from actions.specialty_prompt import SpecialtyPromptCodec  # noqa: E402
+
+
+def legacy_prompt(symptom_text, names):
+    """Prompt trước đây của ActionRecommendDoctor._consult_gemini_for_specialty (giữ nguyên để so sánh)."""
+    specialties_str = ", ".join([f'"{s}"' for s in names])
+    return f"""
+        Bạn là hệ thống điều phối bệnh nhân.
+
+        DỮ LIỆU:
+        1. Danh sách chuyên khoa hiện có: [{specialties_str}]
+        2. Triệu chứng người dùng: "{symptom_text}"
+
+        YÊU CẦU:
+        - Phân tích triệu chứng và chọn ra các chuyên khoa phù hợp từ danh sách trên.
+        - Nếu người dùng có nhiều triệu chứng (ví dụ: mẹ đau lưng, con sốt), hãy liệt kê TẤT CẢ chuyên khoa phù hợp.
+        - Ưu tiên: "Con/Bé" -> "Nhi khoa".
+        - OUTPUT FORMAT: Chỉ trả về một mảng JSON (JSON Array) chứa tên các chuyên khoa.
+        - Ví dụ: ["Nội khoa"] hoặc ["Nhi khoa", "Sản phụ khoa"].
+        - Không giải thích thêm.
+        """
+
+
+def scaled(specialties, factor):
+    rows = list(specialties)
+    for i in range(len(specialties) * (factor - 1)):
+        rows.append({"maCK": f"X{i:03d}", "tenCK": f"Chuyên khoa mở rộng {i + 1}"})
+    return rows
+
+
+def size_report(specialties, scales, repeat):
+    symptoms = [text for text, _ in EVAL_SET]
+    for factor in scales:
+        rows = scaled(specialties, factor)
+        names = [r["tenCK"] for r in rows]
+        codec = SpecialtyPromptCodec(rows)
+        legacy = [legacy_prompt(t, names) for t in symptoms]
+        compact = [codec.build(t) for t in symptoms]
+        avg = lambda prompts: sum(estimate_tokens(p) for p in prompts) / len(prompts)  # noqa: E731
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            for t in symptoms:
+                codec.build(t)
+        build_us = (time.perf_counter() - t0) / (repeat * len(symptoms)) * 1e6
+        print(f"{len(rows):4d} chuyên khoa: cũ {avg(legacy):7.1f} token  gọn {avg(compact):7.1f} token "
+              f"(-{1 - avg(compact) / avg(legacy):.0%}); phần đầu tĩnh {len(codec.prefix)} ký tự, "
+              f"dựng prompt {build_us:.2f} µs")
+
+
+def gemini_report(specialties):
+    from actions.llm_client import LLMClient
+    from actions.llm_usage import UsageMeter
+
+    names = [r["tenCK"] for r in specialties]
+    codec = SpecialtyPromptCodec(specialties)
+    legacy_codec = SpecialtyPromptCodec.from_names(names)  # chỉ dùng decode(): nhận tên trong mảng JSON
+    usage = UsageMeter(log_path=None)
+    client = LLMClient(usage=usage)
+
+    async def run():
+        correct = {"legacy": 0, "compact": 0}
+        for text, gold in EVAL_SET:
+            legacy = legacy_codec.decode(await client.generate(legacy_prompt(text, names), purpose="legacy"))
+            compact = codec.decode(await client.generate(codec.build(text), purpose="compact"))
+            correct["legacy"] += score(legacy, gold)["top1"]
+            correct["compact"] += score(compact, gold)["top1"]
+        return correct
+
+    correct = asyncio.run(run())
+    for purpose, data in usage.stats().items():
+        print(f"{purpose:>8}: top1={correct[purpose] / len(EVAL_SET):6.1%}  prompt={data['avg_prompt_tokens']} token  "
+              f"output={data['avg_output_tokens']} token  p50={data.get('p50_ms')} ms  p99={data.get('p99_ms')} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", action="store_true", help="Dùng danh sách chuyên khoa trong MySQL")
+    parser.add_argument("--scale", type=int, nargs="*", default=[1, 2, 4], help="Nhân số chuyên khoa")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--gemini", action="store_true", help="Gọi Gemini thật với cả hai prompt")
+    args = parser.parse_args()
+
+    specialties = db_specialties() if args.db else canonical_specialties()
+    size_report(specialties, args.scale, args.repeat)
+    if args.gemini:
+        gemini_report(specialties)
+
+
+if __name__ == "__main__":
+    main()
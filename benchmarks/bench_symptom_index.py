@@ -0,0 +1,135 @@
+"""
+Đo recall và độ trễ của chỉ mục vector triệu chứng (actions/symptom_index.py) trên câu giữ lại (held-out).
+
+- Mặc định offline: dựng chỉ mục từ danh sách chuyên khoa chuẩn + từ khóa + nlu.yml, đánh giá trên
+  EVAL_SET của bench_symptom_tiers.py (không trùng câu nào trong nlu.yml).
+- --db: dựng từ chuyenkhoa / lankham thật; giữ lại --holdout phần chẩn đoán (chia cố định theo crc32)
+  làm câu hỏi đánh giá bổ sung, phần còn lại đưa vào chỉ mục.
+
+Chỉ mục được lưu ra thư mục tạm và nạp lại bằng mmap trước khi đo, giống action server.
+recall@k = tỉ lệ chuyên khoa đúng nằm trong top-k chuyên khoa của mệnh đề tương ứng.
+
+    python benchmarks/bench_symptom_index.py
+    python benchmarks/bench_symptom_index.py --db --holdout 0.2 --k 1 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_symptom_tiers import EVAL_SET, canonical_specialties, db_specialties  # noqa: E402
+
+from actions.symptom_classifier import SYMPTOM_LEXICON, load_nlu_examples, split_clauses  # noqa: E402
+from actions.symptom_index import (  # noqa: E402
+    DIAGNOSES_QUERY,
+    SYMPTOM_INDEX_DIM,
+    SYMPTOM_INDEX_THRESHOLD,
+    build_index,
+    collect_documents,
+    load_index,
+    save_index,
+)
+
+
+def canonical_label_map(specialties):
+    """Tên chuẩn trong EVAL_SET -> tenCK trong DB (so sánh không phân biệt hoa thường + alias)."""
+    by_lower = {s['tenCK'].lower(): s['tenCK'] for s in specialties}
+    mapping = {}
+    for canonical, (aliases, _) in SYMPTOM_LEXICON.items():
+        for name in [canonical] + aliases:
+            if name.lower() in by_lower:
+                mapping[canonical] = by_lower[name.lower()]
+                break
+    return mapping
+
+
+def db_diagnoses(specialties):
+    from actions.db import fetch_all_sync
+    names = {s['maCK']: s['tenCK'] for s in specialties}
+    return [(r['chuandoan'], names[r['maCK']]) for r in fetch_all_sync(DIAGNOSES_QUERY) if r['maCK'] in names]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", action="store_true", help="Dựng từ MySQL (chuyenkhoa + lankham)")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Tỉ lệ chẩn đoán giữ lại để đánh giá (--db)")
+    parser.add_argument("--dim", type=int, default=SYMPTOM_INDEX_DIM)
+    parser.add_argument("--k", type=int, nargs="*", default=[1, 3])
+    parser.add_argument("--threshold", type=float, default=SYMPTOM_INDEX_THRESHOLD)
+    parser.add_argument("--repeat", type=int, default=20, help="Số lần lặp khi đo độ trễ")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    specialties = db_specialties() if args.db else canonical_specialties()
+    label_of = canonical_label_map(specialties)
+    # Mỗi câu đánh giá: (mệnh đề, chuyên khoa đúng của mệnh đề)
+    queries = []
+    for text, gold in EVAL_SET:
+        clauses = split_clauses(text)
+        if len(clauses) == len(gold):
+            queries.extend((c, label_of.get(g, g)) for c, g in zip(clauses, gold))
+        else:
+            queries.append((text, label_of.get(gold[0], gold[0])))
+
+    train_diagnoses = []
+    if args.db:
+        held = 0
+        for text, label in db_diagnoses(specialties):
+            if zlib.crc32(text.encode("utf-8")) % 1000 < args.holdout * 1000:
+                queries.append((text, label))
+                held += 1
+            else:
+                train_diagnoses.append((text, label))
+        print(f"Chẩn đoán: {len(train_diagnoses)} đưa vào chỉ mục, {held} giữ lại để đánh giá")
+
+    started = time.perf_counter()
+    texts, labels, sources = collect_documents(specialties, train_diagnoses, load_nlu_examples())
+    built = build_index(texts, labels, args.dim)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    with tempfile.TemporaryDirectory() as path:
+        save_index(built, path)
+        started = time.perf_counter()
+        index = load_index(path)
+        load_ms = (time.perf_counter() - started) * 1000
+        print(f"Chỉ mục: {len(index)} dòng x {args.dim} chiều, nguồn {sources}; dựng {build_ms:.0f} ms, "
+              f"nạp mmap {load_ms:.2f} ms; {len(queries)} câu đánh giá")
+
+        hits = {k: 0 for k in args.k}
+        confident = confident_correct = 0
+        latencies = []
+        for clause, gold in queries:
+            ranked = index.rank_clause(clause)
+            names = [name for name, _ in ranked]
+            for k in args.k:
+                hits[k] += gold in names[:k]
+            label, confidence = index.search_clause(clause)
+            if confidence >= args.threshold:
+                confident += 1
+                confident_correct += label == gold
+            if args.verbose:
+                print(f"  [{confidence:.2f}] {clause!r} -> {names[:3]} (đúng: {gold})")
+
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                index.search_clause(clause)
+                latencies.append((time.perf_counter() - t0) * 1000)
+
+        recall = "  ".join(f"recall@{k}={hits[k] / len(queries):6.1%}" for k in args.k)
+        precision = confident_correct / confident if confident else 0.0
+        print(f"{recall}  | độ tin cậy >= {args.threshold}: {confident}/{len(queries)} câu, đúng {precision:.1%}")
+        print(f"Độ trễ / mệnh đề: p50={statistics.median(latencies):.3f} ms  p99={percentile(latencies, 0.99):.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
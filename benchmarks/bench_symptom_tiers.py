@@ -0,0 +1,145 @@
+"""
+Báo cáo độ chính xác / độ trễ của các tầng gợi ý chuyên khoa từ triệu chứng:
+
+- local  : bộ phân loại cục bộ (actions/symptom_classifier.py)
+- gemini : gọi thẳng Gemini (_consult_gemini_for_specialty), cần GEMINI_API_KEY + --gemini
+- cascade: local, chỉ hỏi Gemini khi độ tin cậy < ngưỡng (đúng như ActionRecommendDoctor)
+
+Mặc định chạy offline với danh sách chuyên khoa chuẩn của từ điển; --db lấy chuyenkhoa
+(kèm mota) từ MySQL. Nhãn đúng của tập đánh giá dùng tên chuyên khoa chuẩn.
+
+    python benchmarks/bench_symptom_tiers.py
+    python benchmarks/bench_symptom_tiers.py --db --gemini --threshold 0.6
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actions.symptom_classifier import (  # noqa: E402
+    SYMPTOM_CONFIDENCE_THRESHOLD,
+    SYMPTOM_LEXICON,
+    SymptomClassifier,
+    load_nlu_examples,
+)
+
+# (câu triệu chứng, các chuyên khoa đúng) - không trùng với câu trong data/nlu.yml
+EVAL_SET = [
+    ("tôi bị sổ mũi và đau họng mấy hôm nay", ["Tai mũi họng"]),
+    ("tai tôi bị ù và nghe không rõ", ["Tai mũi họng"]),
+    ("tôi bị đau bụng và tiêu chảy từ tối qua", ["Tiêu hóa"]),
+    ("ăn xong hay bị ợ chua, nóng rát dạ dày", ["Tiêu hóa"]),
+    ("da tay nổi mẩn đỏ ngứa quá", ["Da liễu"]),
+    ("mặt tôi nổi nhiều mụn viêm", ["Da liễu"]),
+    ("tôi ho có đờm và hơi khó thở", ["Hô hấp"]),
+    ("tối nào cũng ho khan khò khè", ["Hô hấp"]),
+    ("tôi hay hồi hộp, tim đập nhanh", ["Tim mạch"]),
+    ("huyết áp của tôi dạo này cao", ["Tim mạch"]),
+    ("đau đầu chóng mặt suốt mấy ngày", ["Thần kinh"]),
+    ("tôi bị mất ngủ kéo dài", ["Thần kinh"]),
+    ("đau lưng không cúi xuống được", ["Cơ xương khớp"]),
+    ("đầu gối sưng đau khi leo cầu thang", ["Cơ xương khớp"]),
+    ("mắt tôi bị đỏ và ngứa", ["Mắt"]),
+    ("dạo này nhìn mờ không rõ chữ", ["Mắt"]),
+    ("tôi bị nhức răng hàm trên", ["Răng hàm mặt"]),
+    ("chảy máu chân răng khi đánh răng", ["Răng hàm mặt"]),
+    ("tôi bị trễ kinh hai tuần", ["Sản phụ khoa"]),
+    ("tôi đang mang thai tháng thứ ba muốn khám", ["Sản phụ khoa"]),
+    ("đi tiểu buốt và tiểu rắt", ["Tiết niệu"]),
+    ("bị bỏng dầu ở tay", ["Ngoại khoa"]),
+    ("tay tôi có vết thương bị sưng", ["Ngoại khoa"]),
+    ("tôi bị sốt và mệt mỏi", ["Nội khoa"]),
+    ("người ớn lạnh như bị cúm", ["Nội khoa"]),
+    ("bé nhà tôi sốt cao và bỏ ăn", ["Nhi khoa"]),
+    ("con tôi bị ho mấy ngày nay", ["Nhi khoa"]),
+    ("mẹ tôi đau lưng, con tôi thì sốt", ["Cơ xương khớp", "Nhi khoa"]),
+    ("tôi bị ngứa da, còn chồng tôi bị đau răng", ["Da liễu", "Răng hàm mặt"]),
+    ("dau bung di ngoai nhieu lan", ["Tiêu hóa"]),
+    ("nguoi toi noi man ngua", ["Da liễu"]),
+    ("khát nước nhiều, sụt cân nhanh", ["Nội tiết"]),
+]
+
+
+def canonical_specialties():
+    return [{"tenCK": name, "mota": ""} for name in SYMPTOM_LEXICON]
+
+
+def db_specialties():
+    from actions.refdata import reference_cache
+    return reference_cache.get_sync().sorted_specialties()
+
+
+def score(predicted, gold):
+    norm = lambda xs: {x.strip().lower() for x in xs}  # noqa: E731
+    p, g = norm(predicted), norm(gold)
+    return {"exact": p == g, "top1": bool(predicted) and predicted[0].strip().lower() in g}
+
+
+def report(name, rows):
+    latencies = sorted(r["ms"] for r in rows)
+    p99 = latencies[min(len(latencies) - 1, int(round(0.99 * (len(latencies) - 1))))]
+    exact = sum(r["exact"] for r in rows) / len(rows)
+    top1 = sum(r["top1"] for r in rows) / len(rows)
+    extra = ""
+    if "escalated" in rows[0]:
+        extra = f"  gọi Gemini={sum(r['escalated'] for r in rows)}/{len(rows)}"
+    print(f"{name:>8}: exact={exact:6.1%}  top1={top1:6.1%}  p50={statistics.median(latencies):8.2f} ms  "
+          f"p99={p99:8.2f} ms{extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", action="store_true", help="Lấy chuyenkhoa + mota từ MySQL")
+    parser.add_argument("--gemini", action="store_true", help="Đo cả tầng Gemini (gọi API thật)")
+    parser.add_argument("--threshold", type=float, default=SYMPTOM_CONFIDENCE_THRESHOLD)
+    parser.add_argument("--verbose", action="store_true", help="In dự đoán từng câu")
+    args = parser.parse_args()
+
+    specialties = db_specialties() if args.db else canonical_specialties()
+    started = time.perf_counter()
+    classifier = SymptomClassifier(specialties, load_nlu_examples())
+    print(f"Dựng classifier: {(time.perf_counter() - started) * 1000:.1f} ms, {len(classifier.labels)} chuyên khoa, "
+          f"{classifier.weak_labeled} câu nlu.yml gán nhãn yếu; {len(EVAL_SET)} câu đánh giá, ngưỡng {args.threshold}")
+
+    gemini = None
+    if args.gemini:
+        from actions.actions import ActionRecommendDoctor
+        names = [s['tenCK'] for s in specialties]
+        action = ActionRecommendDoctor()
+        loop = asyncio.new_event_loop()  # Một event loop cho mọi lần gọi (client async của SDK gắn với loop)
+        gemini = lambda text: loop.run_until_complete(action._consult_gemini_for_specialty(text, names))  # noqa: E731
+
+    local_rows, gemini_rows, cascade_rows = [], [], []
+    for text, gold in EVAL_SET:
+        t0 = time.perf_counter()
+        predicted, confidence = classifier.predict(text)
+        local_ms = (time.perf_counter() - t0) * 1000
+        local_rows.append(dict(score(predicted, gold), ms=local_ms))
+        if args.verbose:
+            print(f"  [{confidence:.2f}] {text!r} -> {predicted} (đúng: {gold})")
+
+        if gemini:
+            t0 = time.perf_counter()
+            g_predicted = gemini(text)
+            g_ms = (time.perf_counter() - t0) * 1000
+            gemini_rows.append(dict(score(g_predicted, gold), ms=g_ms))
+
+            escalate = not predicted or confidence < args.threshold
+            final = g_predicted if escalate else predicted
+            cascade_rows.append(dict(score(final, gold), ms=local_ms + (g_ms if escalate else 0), escalated=escalate))
+
+    report("local", local_rows)
+    if gemini:
+        report("gemini", gemini_rows)
+        report("cascade", cascade_rows)
+    else:
+        confident = sum(1 for text, _ in EVAL_SET if classifier.predict(text)[1] >= args.threshold)
+        print(f"(bỏ qua tầng Gemini; {confident}/{len(EVAL_SET)} câu đủ tin cậy để không cần gọi Gemini)")
+
+
+if __name__ == "__main__":
+    main()
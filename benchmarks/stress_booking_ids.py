@@ -0,0 +1,84 @@
+"""
+Stress test cấp mã lịch hẹn đồng thời: nhiều tiến trình (mô phỏng nhiều action server),
+mỗi tiến trình nhiều thread cùng xin mã. Kiểm tra KHÔNG có mã trùng.
+
+Dùng một sequence riêng ('stress_lichhen') nên không ảnh hưởng mã lịch hẹn thật.
+Cần MySQL thật đã chạy migrations/002_id_sequences.sql.
+
+    python benchmarks/stress_booking_ids.py --processes 4 --threads 16 --ids 200 --block-size 20
+"""
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actions.db import execute_sync  # noqa: E402
+from actions.id_allocator import SequenceIdAllocator  # noqa: E402
+
+SEQUENCE = "stress_lichhen"
+
+
+def worker_process(threads: int, ids_per_thread: int, block_size: int, out):
+    # Tiến trình spawn (không fork): allocator + pool + kết nối MySQL riêng, giống một action server độc lập
+    allocator = SequenceIdAllocator(SEQUENCE, prefix="LH", width=8, block_size=block_size, seed_query="SELECT 1")
+    results = []
+    lock = threading.Lock()
+
+    def run():
+        local = [allocator.next_id() for _ in range(ids_per_thread)]
+        with lock:
+            results.extend(local)
+
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    out.put(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--ids", type=int, default=200, help="Số mã mỗi thread xin")
+    parser.add_argument("--block-size", type=int, default=20)
+    args = parser.parse_args()
+
+    execute_sync("DELETE FROM id_sequences WHERE name = %s", (SEQUENCE,))
+
+    # spawn thay vì fork: tiến trình con không kế thừa pool (và kết nối rảnh) mà lệnh DELETE ở trên vừa tạo,
+    # nên các tiến trình không thể dùng chung một socket MySQL
+    ctx = mp.get_context("spawn")
+    out = ctx.Queue()
+    procs = [ctx.Process(target=worker_process, args=(args.threads, args.ids, args.block_size, out))
+             for _ in range(args.processes)]
+    started = time.perf_counter()
+    for p in procs:
+        p.start()
+    all_ids = []
+    for _ in procs:
+        all_ids.extend(out.get())
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - started
+
+    execute_sync("DELETE FROM id_sequences WHERE name = %s", (SEQUENCE,))
+
+    duplicates = {k: v for k, v in Counter(all_ids).items() if v > 1}
+    expected = args.processes * args.threads * args.ids
+    print(f"Đã cấp {len(all_ids)}/{expected} mã trong {elapsed:.2f}s ({len(all_ids) / elapsed:.0f} mã/s)")
+    print(f"Mã trùng: {len(duplicates)}")
+    if duplicates or len(all_ids) != expected:
+        print("FAIL:", list(duplicates.items())[:10])
+        sys.exit(1)
+    print("PASS: không có mã trùng")
+
+
+if __name__ == "__main__":
+    main()
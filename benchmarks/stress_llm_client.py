@@ -0,0 +1,283 @@
+"""
+Kiểm tra client LLM (actions/llm_client.py) với một stub server giả lập REST API Gemini
+(`POST /v1beta/models/...:generateContent`) có thể tiêm độ trễ và lỗi. Chạy offline, không cần API key.
+
+Các kịch bản:
+- healthy  : phản hồi nhanh -> mọi lần gọi thành công.
+- slow     : phản hồi chậm hơn timeout -> mỗi lần gọi thất bại trong khoảng deadline.
+- flaky    : một phần yêu cầu trả về 503 -> retry kéo tỉ lệ thành công lên.
+- outage   : luôn 503 -> breaker mở, các lần gọi sau thất bại ngay (không chạm tới server).
+- recovery : hết thời gian reset, server hoạt động lại -> lượt half-open thành công, breaker đóng,
+             các lần gọi sau đó thành công.
+- bad_request: 400 -> không retry, không đếm vào circuit breaker (lỗi của request, upstream vẫn sống).
+- coalesce : nhiều bệnh nhân gửi CÙNG một prompt cùng lúc -> chỉ một request lên server.
+- cap      : nhiều prompt khác nhau cùng lúc -> số request đồng thời ở server không vượt LLM_MAX_CONCURRENCY.
+- queue    : hàng chờ nhỏ -> lần gọi vượt quá slot + hàng chờ bị từ chối ngay (queue_full), chờ lâu -> queue_timeout.
+- sender   : một sender gọi liên tục -> chỉ LLM_SENDER_BURST lượt được đi, sender khác không bị ảnh hưởng.
+- budget   : ngân sách ngày nhỏ -> lượt vượt ngân sách bị từ chối, không request nào lên server.
+Kịch bản healthy / flaky kiểm tra thêm usage meter: mỗi lượt thử lên server được ghi đúng một lần,
+token lấy từ usageMetadata của stub (không phải ước lượng).
+
+    python benchmarks/stress_llm_client.py --calls 40 --timeout 0.3 --deadline 1.0
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actions.llm_admission import AdmissionController  # noqa: E402
+from actions.llm_usage import UsageMeter  # noqa: E402
+from actions.llm_client import (  # noqa: E402
+    CircuitBreaker,
+    CircuitOpenError,
+    GeminiRestBackend,
+    LLMClient,
+    LLMError,
+)
+
+
+class StubGemini:
+    """Cấu hình hành vi của stub: độ trễ (giây), tỉ lệ lỗi và mã lỗi trả về."""
+
+    def __init__(self):
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.error_status = 503
+        self.requests = 0
+        self.active = 0
+        self.peak_active = 0
+        self.lock = threading.Lock()
+
+    def configure(self, latency=0.0, error_rate=0.0, error_status=503):
+        with self.lock:
+            self.latency, self.error_rate, self.error_status = latency, error_rate, error_status
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with stub.lock:
+                    stub.requests += 1
+                    stub.active += 1
+                    stub.peak_active = max(stub.peak_active, stub.active)
+                    latency, error_rate, status = stub.latency, stub.error_rate, stub.error_status
+                if latency:
+                    time.sleep(latency)
+                with stub.lock:
+                    stub.active -= 1
+                if random.random() < error_rate:
+                    self._reply(status, {"error": {"code": status, "message": "stub error"}})
+                    return
+                prompt = body["contents"][0]["parts"][0]["text"]
+                text = json.dumps(["Nội khoa"], ensure_ascii=False) if "chuyên khoa" in prompt else "ok"
+                self._reply(200, {"candidates": [{"content": {"parts": [{"text": text}]}}],
+                                  "usageMetadata": {"promptTokenCount": len(prompt) // 4 + 1,
+                                                    "candidatesTokenCount": len(text) // 4 + 1}})
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Client đã bỏ cuộc vì timeout
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+async def run_calls(client: LLMClient, calls: int, concurrency: int, same_prompt: bool = False,
+                    sender_id=None):
+    """
+    Gọi generate() `calls` lần, tối đa `concurrency` lần đồng thời. Trả về [(ok, ms, lỗi)].
+    Mặc định mỗi lần gọi một prompt khác nhau (không bị gộp); same_prompt=True để thử single-flight.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            t0 = time.perf_counter()
+            prompt = "Giải thích chuyên khoa Nội khoa" + ("" if same_prompt else f" #{i}")
+            try:
+                await client.generate(prompt, sender_id=sender_id)
+                return True, (time.perf_counter() - t0) * 1000, None
+            except LLMError as e:
+                return False, (time.perf_counter() - t0) * 1000, type(e).__name__
+
+    return await asyncio.gather(*(one(i) for i in range(calls)))
+
+
+def report(name, rows, stub, requests_before):
+    ms = sorted(r[1] for r in rows)
+    ok = sum(r[0] for r in rows)
+    errors = {}
+    for r in rows:
+        if r[2]:
+            errors[r[2]] = errors.get(r[2], 0) + 1
+    p99 = ms[min(len(ms) - 1, int(len(ms) * 0.99))]
+    print(f"{name:12s} ok={ok}/{len(rows)}  p50={statistics.median(ms):8.1f} ms  p99={p99:8.1f} ms  "
+          f"max={ms[-1]:8.1f} ms  server_requests={stub.requests - requests_before}  lỗi={errors}")
+    return ok, ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=40, help="Số lần gọi mỗi kịch bản")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=0.3, help="LLM_TIMEOUT (giây / lượt thử)")
+    parser.add_argument("--deadline", type=float, default=1.0, help="LLM_DEADLINE (giây / lần gọi)")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--threshold", type=int, default=5, help="LLM_BREAKER_THRESHOLD")
+    parser.add_argument("--reset", type=float, default=1.0, help="LLM_BREAKER_RESET (giây)")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="LLM_MAX_CONCURRENCY")
+    args = parser.parse_args()
+
+    stub = StubGemini()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), stub.handler())
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"Stub Gemini tại {base_url}; timeout={args.timeout}s deadline={args.deadline}s "
+          f"retries={args.retries} threshold={args.threshold} reset={args.reset}s")
+
+    backend = GeminiRestBackend(base_url, api_key="stub")
+
+    def new_client(max_concurrency=64, queue_max=1000, queue_timeout=60.0, **admission):
+        admission.setdefault("daily_calls", 0)
+        admission.setdefault("daily_tokens", 0)
+        return LLMClient(backend, timeout=args.timeout, deadline=args.deadline, max_retries=args.retries,
+                         backoff_base=0.02, backoff_max=0.1, breaker=CircuitBreaker(args.threshold, args.reset),
+                         admission=AdmissionController(max_concurrency=max_concurrency, queue_max=queue_max,
+                                                       queue_timeout=queue_timeout, **admission),
+                         usage=UsageMeter(log_path=None))
+
+    failures = []
+
+    def check(cond, message):
+        if not cond:
+            failures.append(message)
+            print(f"  FAIL: {message}")
+
+    async def scenarios():
+        # healthy
+        stub.configure(latency=0.02)
+        client, before = new_client(), stub.requests
+        ok, _ = report("healthy", await run_calls(client, args.calls, args.concurrency), stub, before)
+        check(ok == args.calls, "healthy: mọi lần gọi phải thành công")
+        usage = client.usage.stats().get("default", {})
+        check(usage.get("calls") == args.calls and usage.get("estimated_calls") == 0,
+              f"healthy: usage meter phải ghi {args.calls} lượt với token thật từ usageMetadata ({usage})")
+
+        # slow: server chậm hơn timeout -> mọi lần gọi kết thúc trong deadline
+        stub.configure(latency=args.deadline * 3)
+        client, before = new_client(), stub.requests
+        ok, ms = report("slow", await run_calls(client, args.concurrency, args.concurrency), stub, before)
+        check(ok == 0, "slow: không lần gọi nào được thành công")
+        check(ms[-1] <= args.deadline * 1000 * 1.25, "slow: lần gọi vượt quá deadline")
+
+        # flaky: 30% lỗi 503, retry kéo tỉ lệ thành công lên (breaker ngưỡng cao để không mở)
+        stub.configure(latency=0.01, error_rate=0.3)
+        client, before = new_client(), stub.requests
+        client.breaker = CircuitBreaker(10 ** 6, args.reset)
+        ok, _ = report("flaky", await run_calls(client, args.calls, args.concurrency), stub, before)
+        check(ok >= args.calls * 0.9, "flaky: retry phải giữ tỉ lệ thành công >= 90%")
+        check(client.stats()["retries"] > 0, "flaky: phải có retry")
+        usage = client.usage.stats().get("default", {})
+        check(usage.get("calls") == stub.requests - before and usage.get("errors", 0) > 0,
+              f"flaky: usage meter phải ghi mọi lượt thử kể cả lỗi ({usage})")
+
+        # outage: luôn 503 -> breaker mở, phần lớn lần gọi thất bại ngay mà không gửi request
+        stub.configure(latency=0.01, error_rate=1.0)
+        client, before = new_client(), stub.requests
+        rows = await run_calls(client, args.calls, 1)
+        report("outage", rows, stub, before)
+        fast = [r for r in rows if r[2] == CircuitOpenError.__name__]
+        check(client.breaker.state != CircuitBreaker.CLOSED, "outage: breaker phải mở")
+        check(stub.requests - before <= args.threshold + args.retries, "outage: breaker mở vẫn gửi request")
+        check(bool(fast) and max(r[1] for r in fast) < 5, "outage: khi breaker mở phải thất bại ngay (< 5 ms)")
+
+        # recovery: server hoạt động lại, chờ hết reset -> lượt half-open thành công, breaker đóng
+        stub.configure(latency=0.01)
+        await asyncio.sleep(args.reset)
+        before = stub.requests
+        probe = await run_calls(client, 1, 1)  # Half-open chỉ cho 1 lượt thăm dò
+        check(probe[0][0] and client.breaker.state == CircuitBreaker.CLOSED, "recovery: breaker phải đóng lại")
+        ok, _ = report("recovery", await run_calls(client, args.calls, args.concurrency), stub, before)
+        check(ok == args.calls, "recovery: mọi lần gọi sau khi đóng phải thành công")
+
+        # bad_request: 400 -> không retry
+        stub.configure(error_rate=1.0, error_status=400)
+        client, before = new_client(), stub.requests
+        report("bad_request", await run_calls(client, args.threshold + 1, 1), stub, before)
+        check(stub.requests - before == args.threshold + 1, "bad_request: lỗi 400 không được retry")
+        check(client.breaker.state == "closed", "bad_request: lỗi 400 không được mở circuit breaker")
+
+        # coalesce: cùng một prompt từ nhiều hội thoại -> 1 request, mọi người nhận cùng kết quả
+        stub.configure(latency=0.2)
+        client, before = new_client(), stub.requests
+        ok, _ = report("coalesce", await run_calls(client, args.calls, args.calls, same_prompt=True), stub, before)
+        check(ok == args.calls, "coalesce: mọi lần gọi phải thành công")
+        check(stub.requests - before == 1, "coalesce: prompt trùng phải chỉ gửi 1 request")
+
+        # cap: prompt khác nhau, đồng thời cao -> server không thấy quá max_concurrency request cùng lúc
+        stub.configure(latency=0.05)
+        while stub.active:  # Chờ các handler còn ngủ từ kịch bản slow kết thúc
+            await asyncio.sleep(0.05)
+        client, before = new_client(args.max_concurrency), stub.requests
+        stub.peak_active = 0
+        ok, _ = report("cap", await run_calls(client, args.calls, args.calls), stub, before)
+        check(ok == args.calls, "cap: mọi lần gọi phải thành công (chờ slot trong deadline)")
+        check(stub.peak_active <= args.max_concurrency,
+              f"cap: server thấy {stub.peak_active} request đồng thời > {args.max_concurrency}")
+
+        # queue: 4 slot + hàng chờ 8, 40 lần gọi cùng lúc -> 28 bị từ chối ngay, phần còn lại chạy hoặc hết giờ chờ
+        stub.configure(latency=0.2)
+        client, before = new_client(4, queue_max=8, queue_timeout=0.3), stub.requests
+        ok, _ = report("queue", await run_calls(client, args.calls, args.calls), stub, before)
+        shed = client.admission.stats()["shed_by_reason"]
+        check(shed.get("queue_full") == args.calls - 4 - 8, f"queue: queue_full={shed.get('queue_full')}")
+        check(shed.get("queue_timeout", 0) > 0, "queue: phải có lần gọi hết giờ chờ slot")
+        check(ok + sum(shed.values()) == args.calls, "queue: mọi lần gọi phải thành công hoặc bị từ chối")
+
+        # sender: burst 3 -> lượt thứ 4 trở đi của cùng sender bị từ chối; sender khác vẫn đi được
+        stub.configure(latency=0.01)
+        client, before = new_client(sender_rate=6, sender_burst=3), stub.requests
+        ok, _ = report("sender", await run_calls(client, 10, 1, sender_id="patient-a"), stub, before)
+        check(ok == 3, f"sender: chỉ 3 lượt đầu được đi (thực tế {ok})")
+        before = stub.requests
+        ok, _ = report("sender(b)", await run_calls(client, 1, 1, sender_id="patient-b"), stub, before)
+        check(ok == 1, "sender: sender khác không bị ảnh hưởng")
+
+        # budget: 5 lượt / ngày -> 5 lượt đầu đi, phần còn lại bị từ chối mà không chạm server
+        client, before = new_client(daily_calls=5), stub.requests
+        ok, _ = report("budget", await run_calls(client, 10, 1), stub, before)
+        check(ok == 5 and stub.requests - before == 5, "budget: chỉ 5 lượt trong ngân sách được gửi lên server")
+
+        print("stats (client cuối):", client.stats())
+
+    asyncio.run(scenarios())
+    server.shutdown()
+    if failures:
+        print(f"THẤT BẠI: {len(failures)} kiểm tra")
+        sys.exit(1)
+    print("OK: deadline, retry, circuit breaker, gộp request, giới hạn đồng thời và admission control hoạt động đúng")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+-- 001: Composite index cho các truy vấn nóng (xem actions/queries.py)
+
+-- Lịch làm việc bác sĩ theo tuần / theo ngày
+CREATE INDEX idx_thoigiankham_bs_ngay ON thoigiankham (maBS, ngaythangnam);
+
+-- Lịch hẹn của bệnh nhân theo ngày + trạng thái. Ngày đứng trước trạng thái: lịch hẹn trong ngày lọc
+-- `trangthai != 'Huy'` (điều kiện khoảng) nên vẫn quét khoảng theo ngày, trangthai được lọc ngay trong index
+CREATE INDEX idx_lichhen_bn_ngay_tt ON lichhen (maBN, ngaythangnam, trangthai);
+
+-- Lần khám theo hồ sơ + ngày khám (tra cứu toa thuốc)
+CREATE INDEX idx_lankham_hs_ngay ON lankham (maHS, ngaythangnamkham);
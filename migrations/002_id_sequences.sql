@@ -0,0 +1,10 @@
+-- 002: Bảng sequence cấp mã (thay cho SELECT MAX(...) FROM lichhen)
+CREATE TABLE IF NOT EXISTS id_sequences (
+    name VARCHAR(64) NOT NULL PRIMARY KEY,
+    next_value BIGINT UNSIGNED NOT NULL
+);
+
+-- Khởi tạo sequence của lichhen tiếp nối mã lớn nhất hiện có
+INSERT INTO id_sequences (name, next_value)
+SELECT 'lichhen', COALESCE(MAX(CAST(SUBSTRING(mahen, 3) AS UNSIGNED)), 0) + 1 FROM lichhen
+ON DUPLICATE KEY UPDATE next_value = GREATEST(next_value, VALUES(next_value));
@@ -0,0 +1,8 @@
+-- 003: Khóa idempotency cho đặt lịch - webhook bị gửi lại không tạo lịch hẹn trùng
+CREATE TABLE IF NOT EXISTS booking_idempotency (
+    idem_key CHAR(64) NOT NULL PRIMARY KEY,  -- sha256(sender_id | sự kiện kích hoạt)
+    mahen VARCHAR(20) NOT NULL,
+    maBN VARCHAR(20) NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_booking_idempotency_created (created_at)
+);
@@ -0,0 +1,2 @@
+-- 004: Kiểm tra khung giờ đã có người đặt (actions/slots.py) không quét lichhen
+CREATE INDEX idx_lichhen_bs_ngay_gio ON lichhen (maBS, ngaythangnam, khunggio);
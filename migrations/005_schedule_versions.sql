@@ -0,0 +1,21 @@
+-- 005: Đánh dấu bác sĩ có lịch làm việc (thoigiankham) thay đổi,
+-- để cache lịch tuần (actions/schedule_cache.py) chỉ invalidate đúng bác sĩ đó.
+CREATE TABLE IF NOT EXISTS schedule_versions (
+    maBS VARCHAR(20) NOT NULL PRIMARY KEY,
+    version BIGINT UNSIGNED NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3),
+    KEY idx_schedule_versions_updated (updated_at)
+);
+
+-- Mỗi trigger chỉ có MỘT câu lệnh (migrate.py tách file theo dấu chấm phẩy)
+CREATE TRIGGER trg_thoigiankham_ai AFTER INSERT ON thoigiankham FOR EACH ROW
+    INSERT INTO schedule_versions (maBS) VALUES (NEW.maBS)
+    ON DUPLICATE KEY UPDATE version = version + 1;
+
+CREATE TRIGGER trg_thoigiankham_au AFTER UPDATE ON thoigiankham FOR EACH ROW
+    INSERT INTO schedule_versions (maBS) VALUES (OLD.maBS), (NEW.maBS)
+    ON DUPLICATE KEY UPDATE version = version + 1;
+
+CREATE TRIGGER trg_thoigiankham_ad AFTER DELETE ON thoigiankham FOR EACH ROW
+    INSERT INTO schedule_versions (maBS) VALUES (OLD.maBS)
+    ON DUPLICATE KEY UPDATE version = version + 1;
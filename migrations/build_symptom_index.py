@@ -0,0 +1,57 @@
+"""
+Dựng lại chỉ mục vector triệu chứng (actions/symptom_index.py) từ MySQL + data/nlu.yml, chạy offline.
+
+Nguồn: chuyenkhoa.mota, lankham.chuandoan (gắn với chuyên khoa của bác sĩ điều trị, chỉ bác sĩ
+thuộc một chuyên khoa), từ khóa SYMPTOM_LEXICON, câu triệu chứng trong nlu.yml gán nhãn yếu.
+Action server đang chạy tự nạp bản mới ở lần gợi ý chuyên khoa kế tiếp.
+
+Chạy lại định kỳ (ví dụ mỗi đêm) hoặc sau khi sửa chuyenkhoa / có thêm nhiều lần khám:
+    python migrations/build_symptom_index.py
+    python migrations/build_symptom_index.py --dim 2048 --path .cache/symptom_index
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actions.db import fetch_all_sync  # noqa: E402
+from actions.refdata import reference_cache  # noqa: E402
+from actions.symptom_classifier import load_nlu_examples  # noqa: E402
+from actions.symptom_index import (  # noqa: E402
+    DIAGNOSES_QUERY,
+    SYMPTOM_INDEX_DIM,
+    SYMPTOM_INDEX_DIR,
+    build_index,
+    collect_documents,
+    save_index,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=SYMPTOM_INDEX_DIR, help="Thư mục chứa chỉ mục (SYMPTOM_INDEX_DIR)")
+    parser.add_argument("--dim", type=int, default=SYMPTOM_INDEX_DIM, help="Số chiều của hashing embedding")
+    parser.add_argument("--no-diagnoses", action="store_true", help="Không dùng lankham.chuandoan")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    snapshot = reference_cache.get_sync()
+    diagnoses = []
+    if not args.no_diagnoses:
+        for row in fetch_all_sync(DIAGNOSES_QUERY):
+            specialty = snapshot.specialties.get(row['maCK'])
+            if specialty:
+                diagnoses.append((row['chuandoan'], specialty['tenCK']))
+
+    texts, labels, sources = collect_documents(snapshot.sorted_specialties(), diagnoses, load_nlu_examples())
+    index = build_index(texts, labels, args.dim)
+    meta = save_index(index, args.path, {"sources": sources})
+    print(f"Đã dựng chỉ mục {meta['build_id']}: {meta['rows']} dòng x {meta['dim']} chiều "
+          f"({len(set(labels))} chuyên khoa; nguồn {sources}) vào {args.path} "
+          f"trong {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Kiểm chứng bằng EXPLAIN rằng mỗi truy vấn nóng trong actions/queries.py
+dùng đúng composite index tạo bởi các migration, và cột ngày nằm trong các phần
+của index thực sự được dùng (used_key_parts của EXPLAIN FORMAT=JSON), tức là
+quét khoảng theo ngày chứ không chỉ theo các cột đứng trước.
+
+Chạy sau `python migrations/migrate.py`:
+    python migrations/explain_check.py
+
+Thoát với mã 1 nếu có truy vấn không dùng index mong đợi.
+"""
+import json
+import os
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector  # noqa: E402
+
+from actions.db import DB_CONFIG  # noqa: E402
+from actions.queries import (  # noqa: E402
+    DOCTOR_SHIFTS_QUERY,
+    DOCTOR_WORKING_SHIFTS_QUERY,
+    PATIENT_APPOINTMENTS_ON_DAY_QUERY,
+    PATIENT_PRESCRIPTIONS_ON_DAY_QUERY,
+    PATIENT_UPCOMING_APPOINTMENTS_QUERY,
+    SLOT_BOOKINGS_QUERY,
+    day_bounds,
+)
+
+
+def sample_value(cursor, query: str, default: str) -> str:
+    cursor.execute(query)
+    row = cursor.fetchone()
+    return row[0] if row and row[0] is not None else default
+
+
+def used_key_parts(plan, table: str):
+    """used_key_parts của bảng `table` trong cây EXPLAIN FORMAT=JSON (None nếu không có)."""
+    if isinstance(plan, dict):
+        if plan.get("table_name") == table:
+            return plan.get("used_key_parts")
+        plan = list(plan.values())
+    if isinstance(plan, list):
+        for child in plan:
+            found = used_key_parts(child, table)
+            if found is not None:
+                return found
+    return None
+
+
+def main():
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cursor = conn.cursor(buffered=True)
+
+    # Lấy giá trị mẫu có thật để plan phản ánh dữ liệu thực tế
+    ma_bs = sample_value(cursor, "SELECT maBS FROM thoigiankham LIMIT 1", "BS0001")
+    ma_bn = sample_value(cursor, "SELECT maBN FROM lichhen LIMIT 1", "BN0001")
+    ma_bn_hs = sample_value(cursor, "SELECT maBN FROM hosobenhnhan LIMIT 1", ma_bn)
+    today = date.today()
+    monday = today - timedelta(days=today.weekday())
+
+    checks = [
+        ("Lịch tuần (ActionShowDoctorSchedule)", DOCTOR_WORKING_SHIFTS_QUERY,
+         (ma_bs, *day_bounds(monday, monday + timedelta(days=6))), "thoigiankham", "idx_thoigiankham_bs_ngay",
+         "ngaythangnam"),
+        ("Lịch ngày (validate_date)", DOCTOR_SHIFTS_QUERY,
+         (ma_bs, *day_bounds(today)), "thoigiankham", "idx_thoigiankham_bs_ngay", "ngaythangnam"),
+        ("Lịch hẹn trong ngày (validate_appointment_date)", PATIENT_APPOINTMENTS_ON_DAY_QUERY,
+         (ma_bn, *day_bounds(today)), "lh", "idx_lichhen_bn_ngay_tt", "ngaythangnam"),
+        ("Lịch hẹn sắp tới (ActionCheckUpcomingAppointments)", PATIENT_UPCOMING_APPOINTMENTS_QUERY,
+         (ma_bn, today), "lh", "idx_lichhen_bn_ngay_tt", "ngaythangnam"),
+        ("Toa thuốc theo ngày (ActionShowPrescriptionResults)", PATIENT_PRESCRIPTIONS_ON_DAY_QUERY,
+         (ma_bn_hs, *day_bounds(today)), "lk", "idx_lankham_hs_ngay", "ngaythangnamkham"),
+        ("Khung giờ đã đặt (actions/slots.py)", SLOT_BOOKINGS_QUERY,
+         (ma_bs, *day_bounds(today), "08:00"), "lichhen", "idx_lichhen_bs_ngay_gio", "ngaythangnam"),
+    ]
+
+    failed = 0
+    for label, query, params, table, expected_index, range_column in checks:
+        cursor.execute("EXPLAIN " + query, params)
+        columns = [c[0] for c in cursor.description]
+        plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        row = next((r for r in plan if r.get("table") == table), None)
+        used = row.get("key") if row else None
+        cursor.execute("EXPLAIN FORMAT=JSON " + query, params)
+        parts = used_key_parts(json.loads(cursor.fetchone()[0]), table) or []
+        ok = used == expected_index and range_column in parts
+        failed += not ok
+        print(f"[{'PASS' if ok else 'FAIL'}] {label}: table={table} key={used} "
+              f"type={row.get('type') if row else None} parts={','.join(parts)} "
+              f"(mong đợi {expected_index}, khoảng theo {range_column})")
+
+    cursor.close()
+    conn.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
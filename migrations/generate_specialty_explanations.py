@@ -0,0 +1,89 @@
+"""
+Sinh trước phần giải thích cho các chuyên khoa chưa có mô tả (chuyenkhoa.mota rỗng) bằng Gemini
+và ghi ngược vào bảng chuyenkhoa. Trong hội thoại, ActionExplainSpecialtyInForm chỉ đọc mota
+(snapshot dữ liệu tham chiếu / DB), không bao giờ gọi LLM.
+
+Chạy lại sau khi thêm chuyên khoa mới (chỉ xử lý dòng còn thiếu, không ghi đè mô tả đã có):
+    python migrations/generate_specialty_explanations.py --dry-run         # xem trước, không ghi DB
+    python migrations/generate_specialty_explanations.py --concurrency 4
+    python migrations/generate_specialty_explanations.py --only "Nhi khoa" --overwrite
+
+Action server nhận mô tả mới sau tối đa REFDATA_TTL giây (hoặc khởi động lại).
+Thoát với mã 1 nếu có chuyên khoa không sinh được mô tả.
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actions.db import execute, fetch_all  # noqa: E402
+from actions.llm_client import LLMClient, LLMError  # noqa: E402
+
+MISSING_QUERY = "SELECT maCK, tenCK FROM chuyenkhoa WHERE mota IS NULL OR TRIM(mota) = '' ORDER BY tenCK"
+ALL_QUERY = "SELECT maCK, tenCK FROM chuyenkhoa ORDER BY tenCK"
+# Điều kiện mota rỗng lặp lại trong UPDATE: không ghi đè mô tả do người sửa tay trong lúc job chạy
+UPDATE_MISSING = "UPDATE chuyenkhoa SET mota = %s WHERE maCK = %s AND (mota IS NULL OR TRIM(mota) = '')"
+UPDATE_ANY = "UPDATE chuyenkhoa SET mota = %s WHERE maCK = %s"
+
+
+def explanation_prompt(ten_ck: str) -> str:
+    return (f"Giải thích ngắn gọn về chuyên khoa y tế '{ten_ck}' bằng tiếng Việt, "
+            f"tối đa 3 câu, dành cho bệnh nhân. Chỉ trả về đoạn giải thích, không dùng markdown.")
+
+
+async def generate(client: LLMClient, row, overwrite: bool, dry_run: bool):
+    try:
+        text = " ".join((await client.generate(explanation_prompt(row['tenCK']), purpose="explanation")).split())
+    except LLMError as e:
+        print(f"[FAIL]    {row['maCK']} {row['tenCK']}: {e}")
+        return False
+    if not text:
+        print(f"[FAIL]    {row['maCK']} {row['tenCK']}: Gemini trả về rỗng")
+        return False
+    if dry_run:
+        print(f"[DRY-RUN] {row['maCK']} {row['tenCK']}: {text}")
+        return True
+    updated = await execute(UPDATE_ANY if overwrite else UPDATE_MISSING, (text, row['maCK']))
+    # SKIP: mô tả vừa được người khác điền trong lúc job chạy
+    print(f"{'[OK]     ' if updated else '[SKIP]   '} {row['maCK']} {row['tenCK']}")
+    return True
+
+
+async def run(args) -> int:
+    rows = await fetch_all(ALL_QUERY if args.overwrite else MISSING_QUERY)
+    if args.only:
+        wanted = {name.lower() for name in args.only}
+        rows = [r for r in rows if (r['tenCK'] or '').lower() in wanted]
+    if not rows:
+        print("Không có chuyên khoa nào cần sinh mô tả.")
+        return 0
+
+    print(f"Sinh mô tả cho {len(rows)} chuyên khoa (tối đa {args.concurrency} request Gemini đồng thời)")
+    client = LLMClient(max_concurrency=args.concurrency)
+    # Giới hạn song song ở đây (không để lượt gọi xếp hàng trong client, vì thời gian chờ slot tính vào deadline)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def bounded(row):
+        async with semaphore:
+            return await generate(client, row, args.overwrite, args.dry_run)
+
+    results = await asyncio.gather(*(bounded(row) for row in rows))
+    failed = results.count(False)
+    print(f"Xong: {len(rows) - failed} thành công, {failed} lỗi. stats={client.stats()}")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=4, help="Số request Gemini đồng thời tối đa")
+    parser.add_argument("--only", nargs="*", help="Chỉ xử lý các chuyên khoa có tên này")
+    parser.add_argument("--overwrite", action="store_true", help="Sinh lại cả mô tả đã có")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ in kết quả, không ghi DB")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
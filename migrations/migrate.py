@@ -0,0 +1,75 @@
+"""
+Chạy các migration SQL có đánh số phiên bản (NNN_ten.sql) theo thứ tự.
+
+Phiên bản đã chạy được ghi vào bảng schema_migrations nên mỗi file chỉ áp dụng một lần.
+
+Chạy từ thư mục gốc repo (dùng cấu hình DB trong .env):
+    python migrations/migrate.py            # áp dụng các migration còn thiếu
+    python migrations/migrate.py --status   # chỉ liệt kê trạng thái
+"""
+import argparse
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector  # noqa: E402
+
+from actions.db import DB_CONFIG  # noqa: E402
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+_FILE_PATTERN = re.compile(r"^(\d{3})_[\w-]+\.sql$")
+
+
+def list_migrations():
+    files = sorted(f for f in os.listdir(MIGRATIONS_DIR) if _FILE_PATTERN.match(f))
+    return [(_FILE_PATTERN.match(f).group(1), f) for f in files]
+
+
+def split_statements(sql: str):
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    return [stmt.strip() for stmt in "\n".join(lines).split(";") if stmt.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="Chỉ hiển thị trạng thái, không áp dụng")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        " version VARCHAR(16) PRIMARY KEY,"
+        " filename VARCHAR(255) NOT NULL,"
+        " applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+    )
+    cursor.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in cursor.fetchall()}
+
+    for version, filename in list_migrations():
+        if version in applied:
+            print(f"[OK]      {filename}")
+            continue
+        if args.status:
+            print(f"[PENDING] {filename}")
+            continue
+
+        print(f"[APPLY]   {filename}")
+        with open(os.path.join(MIGRATIONS_DIR, filename), encoding="utf-8") as fh:
+            statements = split_statements(fh.read())
+        # DDL trong MySQL tự commit -> chạy lần lượt, chỉ ghi version khi tất cả thành công
+        for stmt in statements:
+            cursor.execute(stmt)
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, filename) VALUES (%s, %s)", (version, filename)
+        )
+        conn.commit()
+
+    cursor.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()